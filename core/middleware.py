@@ -0,0 +1,67 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('core.queries')
+
+# statements of transactions and savepoints are not queries of the request
+TRANSACTION_STATEMENTS = ('BEGIN', 'SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+class QueryStats:
+    """
+    Database execute wrapper counting queries and the time spent running them
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.startswith(TRANSACTION_STATEMENTS):
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+class QueryCountMiddleware:
+    """
+    Record the number of database queries and their total time for every request.
+
+    The numbers are logged together with the view and, with DEBUG or QUERY_COUNT_HEADERS enabled, returned
+    in the X-Query-Count and X-Query-Time headers. Requests running more queries than the `query_budget`
+    declared on the view class are logged as warnings. Budgets cover the whole request including the
+    user and account tier lookups of JWT authentication.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+
+        view = getattr(request, 'query_budget_view', None)
+        view_name = view.__name__ if view is not None else request.path
+        budget = getattr(view, 'query_budget', None)
+        if budget is not None and stats.count > budget:
+            logger.warning('%s ran %d queries, over its budget of %d', view_name, stats.count, budget)
+        else:
+            logger.debug('%s ran %d queries in %.1fms', view_name, stats.count, stats.duration * 1000)
+        if settings.DEBUG or getattr(settings, 'QUERY_COUNT_HEADERS', False):
+            response['X-Query-Count'] = str(stats.count)
+            response['X-Query-Time'] = f'{stats.duration * 1000:.1f}ms'
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget_view = getattr(view_func, 'cls', None)
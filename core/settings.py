@@ -44,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.QueryCountMiddleware',
     'allow_cidr.middleware.AllowCIDRMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -89,6 +90,21 @@ DATABASES = {
     }
 }
 
+# Shared cache used by the image list cache, a per-process memory cache is used when REDIS_URL is not set
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -132,9 +148,16 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'user_app.User'
 
+# Authenticate API requests from the claims of the access token without loading the user and its tier,
+# changes of users and tiers reach all processes through the AUTH_CACHE_ALIAS cache once they are committed,
+# a user whose state is missing from the cache is loaded from the database
+JWT_CLAIMS_AUTHENTICATION = os.environ.get('JWT_CLAIMS_AUTHENTICATION', '0') == '1'
+AUTH_CACHE_ALIAS = 'default'
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'user_app.authentication.ClaimsJWTAuthentication' if JWT_CLAIMS_AUTHENTICATION
+        else 'rest_framework_simplejwt.authentication.JWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_FILTER_BACKENDS': [
@@ -142,16 +165,137 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.coreapi.AutoSchema',
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.ScopedRateThrottle',
+        'core.throttling.TokenBucketThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
         'images_list': '60/minute',
         'image_upload': '10/min',
         'create_link': '40/min',
         'expiring_images': '15/min',
+        'thumbnails': '300/min',
+        'upload_chunks': '600/min',
     }
 }
 
+# Cache holding the token buckets of TokenBucketThrottle, it has to be shared by all workers (REDIS_URL)
+# for the rates to apply across processes. Account tiers override the rates in `throttle_rates`
+THROTTLE_CACHE_ALIAS = 'default'
+
+# Media storage in an S3 compatible object store (AWS S3, MinIO with S3_ENDPOINT_URL), enabled by S3_BUCKET.
+# Transfers over S3_MULTIPART_THRESHOLD bytes are split in parts of S3_MULTIPART_CHUNK_SIZE bytes sent
+# S3_MAX_CONCURRENCY at a time, presigned URLs and direct upload forms are valid for S3_PRESIGNED_EXPIRY seconds
+S3_BUCKET = os.environ.get('S3_BUCKET', '')
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL') or None
+S3_REGION = os.environ.get('S3_REGION') or None
+S3_ACCESS_KEY_ID = os.environ.get('S3_ACCESS_KEY_ID', '')
+S3_SECRET_ACCESS_KEY = os.environ.get('S3_SECRET_ACCESS_KEY', '')
+S3_QUERYSTRING_AUTH = os.environ.get('S3_QUERYSTRING_AUTH', '1') == '1'
+S3_PRESIGNED_EXPIRY = 3600
+S3_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+S3_MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024
+S3_MAX_CONCURRENCY = 10
+S3_UPLOAD_PREFIX = 'uploads/'
+
+if S3_BUCKET:
+    STORAGES = {
+        'default': {'BACKEND': 'image_app.storage.S3Storage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    }
+
+# How original images behind expiring links are sent: 'python' streams them from the application,
+# 'x-accel-redirect' hands them to nginx through the internal MEDIA_ACCEL_REDIRECT_PREFIX location,
+# 'x-sendfile' to web servers supporting the X-Sendfile header and 'redirect' redirects to a presigned URL
+# of the S3 storage
+MEDIA_DELIVERY_MODE = os.environ.get('MEDIA_DELIVERY_MODE', 'redirect' if S3_BUCKET else 'python')
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# In-process cache of expiring link lookups, unknown tokens are remembered for LINK_CACHE_NEGATIVE_TTL seconds
+LINK_CACHE_MAX_ENTRIES = 10000
+LINK_CACHE_TTL = 300
+LINK_CACHE_NEGATIVE_TTL = 30
+
+# Maximum number of images in one bulk link creation request
+LINK_BULK_MAX_IMAGES = 500
+
+# Seconds between reloads of the revoked signed links
+SIGNED_LINK_REVOCATION_REFRESH = 60
+
+# Return X-Query-Count and X-Query-Time headers also with DEBUG disabled
+QUERY_COUNT_HEADERS = False
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'core.queries': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+        },
+    },
+}
+
+# Cached image list representations, invalidated whenever the user's images change
+LIST_CACHE_ALIAS = 'default'
+LIST_CACHE_TIMEOUT = 300
+
+# Render thumbnails in the `run_jobs` worker instead of inside the upload request
+IMAGE_PROCESSING_ASYNC = os.environ.get('IMAGE_PROCESSING_ASYNC', '0') == '1'
+
+# Upload limits enforced by ImageUploadHandler while the upload is streamed, the image header has to fit
+# in the first UPLOAD_HEADER_MAX_BYTES
+UPLOAD_MAX_FILE_SIZE = 20 * 1024 * 1024
+UPLOAD_MAX_PIXELS = 50_000_000
+UPLOAD_HEADER_MAX_BYTES = 1024 * 1024
+
+# Resumable uploads, chunks of UPLOAD_CHUNK_SIZE bytes are written to UPLOAD_SESSION_ROOT and sessions
+# not updated for UPLOAD_SESSION_MAX_AGE seconds are removed by `purge_upload_sessions`
+UPLOAD_SESSION_ROOT = os.environ.get('UPLOAD_SESSION_ROOT', os.path.join(BASE_DIR, 'cache', 'uploads'))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_SESSION_MAX_AGE = 24 * 60 * 60
+
+# Batch uploads, thumbnails of UPLOAD_BATCH_WORKERS images are rendered at the same time
+UPLOAD_BATCH_MAX_FILES = 20
+UPLOAD_BATCH_WORKERS = 4
+
+# Bulk user provisioning, passwords are hashed by PROVISIONING_WORKERS processes (0 hashes in the request process),
+# PROVISIONING_CHUNK_SIZE users are checked and inserted at once
+PROVISIONING_WORKERS = int(os.environ.get('PROVISIONING_WORKERS', os.cpu_count() or 1))
+# uploads to the API are hashed by at most PROVISIONING_HTTP_WORKERS processes, large files belong to the command
+PROVISIONING_HTTP_WORKERS = int(os.environ.get('PROVISIONING_HTTP_WORKERS', 2))
+PROVISIONING_CHUNK_SIZE = 1000
+PROVISIONING_MAX_ROWS = 5000
+
+# Thumbnail engine, encoding runs on a process pool of THUMBNAIL_ENGINE_WORKERS processes (0 disables the pool)
+# once all thumbnails of an image have at least THUMBNAIL_ENGINE_PARALLEL_MIN_PIXELS pixels together
+THUMBNAIL_JPEG_QUALITY = 85
+THUMBNAIL_WEBP_QUALITY = 80
+THUMBNAIL_AVIF_QUALITY = 60
+THUMBNAIL_ENGINE_WORKERS = int(os.environ.get('THUMBNAIL_ENGINE_WORKERS', os.cpu_count() or 1))
+THUMBNAIL_ENGINE_PARALLEL_MIN_PIXELS = 500_000
+
+# Thumbnail engine microbenchmarks, `bench_thumbnails --check` fails when the total time of a case grows by more
+# than THUMBNAIL_BENCH_TIME_TOLERANCE (or the noise of the baseline) or its peak RSS by more than
+# THUMBNAIL_BENCH_MEMORY_TOLERANCE of the baseline
+THUMBNAIL_BENCH_BASELINE = os.path.join(BASE_DIR, 'benchmarks', 'thumbnails.json')
+THUMBNAIL_BENCH_TIME_TOLERANCE = 0.25
+THUMBNAIL_BENCH_MEMORY_TOLERANCE = 0.10
+# time growth below THUMBNAIL_BENCH_MIN_REGRESSION_MS milliseconds is noise whatever the tolerance
+THUMBNAIL_BENCH_MIN_REGRESSION_MS = 10.0
+
+# Disk cache of thumbnails rendered on demand, least recently used entries are evicted over the byte budget
+THUMBNAIL_CACHE_ROOT = os.environ.get('THUMBNAIL_CACHE_ROOT', os.path.join(BASE_DIR, 'cache', 'thumbnails'))
+THUMBNAIL_CACHE_MAX_BYTES = int(os.environ.get('THUMBNAIL_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
+# Background jobs
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_DELAY = 30
+JOB_LOCK_TIMEOUT = 600
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=4),
     'REFRESH_TOKEN_LIFETIME': timedelta(hours=24)
@@ -0,0 +1,61 @@
+import inspect
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework.views import APIView
+
+from core.middleware import TRANSACTION_STATEMENTS
+from user_app.models import AccountTier, ThumbnailSize
+from user_app.tiers import bump_tiers_version
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryBudgetAPIClient(APIClient):
+    """
+    API client failing the test when a request runs more queries than the `query_budget` of its view
+    """
+
+    def request(self, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = super().request(**kwargs)
+        view = getattr(getattr(response, 'resolver_match', None), 'func', None)
+        budget = getattr(getattr(view, 'cls', None), 'query_budget', None)
+        executed = [query['sql'] for query in queries.captured_queries
+                    if not query['sql'].startswith(TRANSACTION_STATEMENTS)]
+        if budget is not None and len(executed) > budget:
+            raise QueryBudgetExceeded(
+                f'{view.cls.__name__} ran {len(executed)} queries, its budget is {budget}:\n' + '\n'.join(executed))
+        return response
+
+
+def get_views_without_query_budget(module):
+    """
+    Return API view classes defined in the module that do not declare a `query_budget`
+    """
+    return [cls for _, cls in inspect.getmembers(module, inspect.isclass)
+            if issubclass(cls, APIView) and cls.__module__ == module.__name__
+            and getattr(cls, 'query_budget', None) is None]
+
+
+def set_thumbnail_sizes(account_tier, heights, formats='', **kwargs):
+    """
+    Replace the thumbnail sizes of an account tier with sizes of the given heights
+    """
+    account_tier.thumbnail_sizes.all().delete()
+    for height in heights:
+        ThumbnailSize.objects.create(account_tier=account_tier, height=height, formats=formats, **kwargs)
+    # tiers are invalidated on commit, test cases run in a transaction that is never committed
+    bump_tiers_version()
+
+
+def create_tier(name, heights, formats='', **kwargs):
+    """
+    Create an account tier with thumbnail sizes of the given heights
+    """
+    account_tier = AccountTier.objects.create(name=name, **kwargs)
+    set_thumbnail_sizes(account_tier, heights, formats)
+    return account_tier
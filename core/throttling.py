@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import ScopedRateThrottle
+
+
+class TokenBucketThrottle(ScopedRateThrottle):
+    """
+    Scoped throttle enforcing a token bucket per user (or client address) in a shared cache.
+
+    A rate of `N/period` allows bursts of N requests and refills one token every period / N. The bucket is
+    stored as a single integer, its theoretical arrival time in microseconds (GCRA), which is only ever
+    advanced with an atomic `incr`, so a request costs one read and one counter update however high the rate
+    is and all workers sharing THROTTLE_CACHE_ALIAS see the same bucket. Rejected requests give their token
+    back.
+
+    The account tier of the user can override the rate of any scope in its `throttle_rates`, requests
+    without a tier rate use DEFAULT_THROTTLE_RATES.
+    """
+    cache_format = 'bucket_%(scope)s_%(ident)s'
+
+    def __init__(self):
+        # the rate depends on the request, it is resolved in allow_request
+        self.cache = caches[getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default')]
+        self.wait_seconds = None
+
+    def get_tier_rate(self, request):
+        account_tier = getattr(request.user, 'account_tier', None) if request.user.is_authenticated else None
+        if account_tier is None:
+            return None
+        return (account_tier.throttle_rates or {}).get(self.scope)
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, self.scope_attr, None)
+        if not self.scope:
+            return True
+        self.rate = self.get_tier_rate(request) or self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        if self.num_requests is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        return self.consume()
+
+    def consume(self):
+        if not self.num_requests:
+            # a rate of zero requests blocks the scope
+            self.wait_seconds = self.duration
+            return False
+        interval = self.duration * 1_000_000 // self.num_requests
+        tolerance = self.duration * 1_000_000
+        timeout = self.duration + 1
+        now = int(self.timer() * 1_000_000)
+        arrival = self.cache.get(self.key)
+        if arrival is None:
+            if self.cache.add(self.key, now + interval, timeout):
+                return True
+            arrival = self.cache.get(self.key, now)
+
+        # a bucket that refilled completely while idle restarts its timeline from now, the catch-up is added by
+        # the same increment as the token, a separate write would drop the tokens of concurrent requests
+        step = max(interval, now + interval - arrival)
+        try:
+            arrival = self.cache.incr(self.key, step)
+        except ValueError:
+            # expired since it was read, the bucket is full
+            self.cache.add(self.key, now + interval, timeout)
+            return True
+        if arrival - now > tolerance:
+            # requests racing on an idle bucket may each add the catch-up, they are rejected rather than let
+            # through over the quota and can retry at once
+            self.cache.decr(self.key, step)
+            self.wait_seconds = max(arrival - (step - interval) - now - tolerance, 0) / 1_000_000
+            return False
+        self.cache.touch(self.key, timeout)
+        return True
+
+    def wait(self):
+        return self.wait_seconds
@@ -1,6 +1,8 @@
 from django.contrib import admin
-from image_app.models import Image, Thumbnail, ExpirationLink
+from image_app.models import Image, Thumbnail, ExpirationLink, Job, RevokedLink
 
 admin.site.register(Image)
 admin.site.register(Thumbnail)
 admin.site.register(ExpirationLink)
+admin.site.register(Job)
+admin.site.register(RevokedLink)
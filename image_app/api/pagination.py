@@ -1,7 +1,17 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class ImagePagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = 'size'
     max_page_size = 25
+
+
+class ImageCursorPagination(CursorPagination):
+    """
+    Keyset pagination over the (user, id) index, pages are addressed by opaque cursors and no total count is run
+    """
+    page_size = 10
+    page_size_query_param = 'size'
+    max_page_size = 25
+    ordering = 'id'
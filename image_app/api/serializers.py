@@ -1,9 +1,16 @@
+import os
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
 from django.urls import reverse
 from rest_framework import serializers
-from image_app.models import Image, Thumbnail, ExpirationLink
-from PIL import Image as img
-import os
-from io import BytesIO
+from image_app import blobs, jobs
+from image_app.metadata import read_metadata
+from image_app.models import Image, Thumbnail, ExpirationLink, UploadSession
+from image_app.resumable import get_chunk_size
+from image_app.negotiation import choose_format, select_thumbnails
+from image_app.thumbnails import create_thumbnails, get_image_extension, get_source_format
 
 
 class ThumbnailSerializer(serializers.ModelSerializer):
@@ -11,50 +18,105 @@ class ThumbnailSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Thumbnail
-        fields = ['id', 'name', 'thumbnail']
+        fields = ['id', 'name', 'thumbnail', 'format']
 
 
 class ImageSerializer(serializers.ModelSerializer):
-    thumbnails = ThumbnailSerializer(many=True, read_only=True)
+    thumbnails = serializers.SerializerMethodField()
     original_image = serializers.ImageField(use_url=True)
 
     class Meta:
         model = Image
-        fields = ['id', 'original_image', 'thumbnails']
+        fields = ['id', 'original_image', 'status', 'thumbnails']
+        read_only_fields = ['status']
 
     def create(self, validated_data):
         image = validated_data['original_image']
-        image_name, image_extension = os.path.splitext(image.name)
-        image_extension = image_extension.lower()
-        if image_extension == '.jpg':
-            image_extension = '.jpeg'
-        image_obj = Image.objects.create(**validated_data)
         user = validated_data.get('user')
-        thumbnail_sizes = list(map(int, user.account_tier.thumbnail_size.split(',')))
-        with img.open(image) as im:
-            original_width, original_height = im.size
-            for height in reversed(thumbnail_sizes):
-                thumbnail_name = f"{image_name}_thumbnail_{height}{image_extension}"
-                aspect_ratio = original_width / original_height
-                new_width = int(aspect_ratio * height)
-                im.thumbnail((new_width, height))
-                buffer = BytesIO()
-                if image_extension == '.jpeg':
-                    im.save(buffer, format='JPEG', quality=85)
-                else:
-                    im.save(buffer, image_extension.replace('.', ''))
-                thumbnail_obj = Thumbnail.objects.create(name=thumbnail_name, image=image_obj)
-                thumbnail_obj.thumbnail.save(thumbnail_name, buffer)
+        validated_data.update(read_metadata(image))
+        name = blobs.original_name(validated_data['checksum'], get_image_extension(image.name))
+        with transaction.atomic():
+            # the original is stored under its content address, a duplicate upload reuses the stored file
+            validated_data['original_image'] = blobs.store(Image.original_image.field.storage, name, image)
+            if getattr(settings, 'IMAGE_PROCESSING_ASYNC', False):
+                image_obj = Image.objects.create(status=Image.Status.PENDING, **validated_data)
+                jobs.enqueue('process_image', image_id=image_obj.pk)
+            else:
+                image_obj = Image.objects.create(**validated_data)
+                image.seek(0)
+                create_thumbnails(image_obj, user.account_tier.get_plan(), source=image)
         return image_obj
 
+    def get_plan(self):
+        if 'plan' not in self.context:
+            self.context['plan'] = self.context['request'].user.account_tier.get_plan()
+        return self.context['plan']
+
+    def get_thumbnail_format(self):
+        """
+        Return the variant format negotiated for the request, shared by all images of a list
+        """
+        if 'thumbnail_format' not in self.context:
+            request = self.context['request']
+            self.context['thumbnail_format'] = choose_format(request, self.get_plan().variant_formats)
+        return self.context['thumbnail_format']
+
+    def get_thumbnails(self, obj):
+        # one thumbnail per height, in the variant format the client accepts when it is stored
+        thumbnails = select_thumbnails(obj.thumbnails.all(), self.get_thumbnail_format(), get_source_format(obj))
+        data = ThumbnailSerializer(thumbnails, many=True, context=self.context).data
+        # lazy sizes are rendered on their first request by the thumbnail view
+        request = self.context['request']
+        image_name = os.path.splitext(os.path.basename(obj.original_image.name))[0]
+        for height in self.get_plan().lazy_heights:
+            data.append({
+                'id': None,
+                'name': f'{image_name}_thumbnail_{height}',
+                'thumbnail': request.build_absolute_uri(reverse('render_thumbnail', args=[obj.pk, height])),
+                'format': None,
+            })
+        return data
+
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         user = self.context['request'].user
         if not user.account_tier.original_link:
             representation.pop('original_image', None)
+        elif isinstance(Image.original_image.field.storage, FileSystemStorage):
+            # the public media route only serves thumbnails, local originals are delivered by the original view
+            representation['original_image'] = self.context['request'].build_absolute_uri(
+                reverse('image_original', args=[instance.pk]))
         return representation
 
 
+class UploadSessionSerializer(serializers.ModelSerializer):
+    offset = serializers.IntegerField(source='received', read_only=True)
+    chunk_size = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'file_name', 'size', 'offset', 'chunk_size']
+
+    def get_chunk_size(self, obj):
+        return get_chunk_size()
+
+    def validate_size(self, value):
+        max_size = getattr(settings, 'UPLOAD_MAX_FILE_SIZE', 20 * 1024 * 1024)
+        if not 0 < value <= max_size:
+            raise serializers.ValidationError(f'Size needs to be between 1 and {max_size} bytes')
+        return value
+
+
+class DirectUploadSerializer(UploadSessionSerializer):
+    upload = serializers.SerializerMethodField()
+
+    class Meta(UploadSessionSerializer.Meta):
+        fields = ['id', 'file_name', 'size', 'upload']
+
+    def get_upload(self, obj):
+        return Image.original_image.field.storage.presigned_post(obj.storage_name, obj.size)
+
+
 class ExpirationLinkSerializer(serializers.ModelSerializer):
     link = serializers.SerializerMethodField()
     expiration_time = serializers.DateTimeField(read_only=True)
@@ -72,3 +134,12 @@ class ExpirationLinkSerializer(serializers.ModelSerializer):
     def get_link(self, obj):
         request = self.context.get('request')
         return request.build_absolute_uri(reverse('retrieve_expiring_image', kwargs={'token': obj.token}))
+
+
+class SignedLinkSerializer(serializers.Serializer):
+    expiration_time = serializers.DateTimeField(read_only=True)
+    link = serializers.SerializerMethodField()
+
+    def get_link(self, obj):
+        request = self.context.get('request')
+        return request.build_absolute_uri(reverse('retrieve_signed_image', kwargs={'token': obj['token']}))
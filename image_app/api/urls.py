@@ -1,12 +1,29 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CreateImageView, ListImageView, ExpirationLinkCreateAPIView, ExpirationLinkRetrieveView
+from .views import CreateImageView, ListImageView, ExpirationLinkCreateAPIView, ExpirationLinkRetrieveView, \
+    ExpirationLinkBulkCreateAPIView, ThumbnailRenderView, LinkCacheStatsView, SignedLinkRetrieveView, \
+    SignedLinkRevokeView, BatchCreateImageView, UploadSessionCreateView, UploadSessionView, UploadChunkView, \
+    UploadSessionFinalizeView, DirectUploadCreateView, DirectUploadCompleteView, OriginalImageView
 
 router = DefaultRouter()
 
 urlpatterns = [
     path('upload/', CreateImageView.as_view(), name='image_create'),
+    path('upload/batch/', BatchCreateImageView.as_view(), name='image_batch_create'),
+    path('upload/sessions/', UploadSessionCreateView.as_view(), name='upload_session_create'),
+    path('upload/sessions/<uuid:pk>/', UploadSessionView.as_view(), name='upload_session'),
+    path('upload/sessions/<uuid:pk>/chunks/<int:index>/', UploadChunkView.as_view(), name='upload_session_chunk'),
+    path('upload/sessions/<uuid:pk>/finalize/', UploadSessionFinalizeView.as_view(),
+         name='upload_session_finalize'),
+    path('upload/direct/', DirectUploadCreateView.as_view(), name='direct_upload_create'),
+    path('upload/direct/<uuid:pk>/complete/', DirectUploadCompleteView.as_view(), name='direct_upload_complete'),
     path('list/', ListImageView.as_view(), name='image_list'),
+    path('original/<int:pk>/', OriginalImageView.as_view(), name='image_original'),
     path('create-link/<int:pk>/', ExpirationLinkCreateAPIView.as_view(), name='create_expiring_link'),
+    path('create-links/', ExpirationLinkBulkCreateAPIView.as_view(), name='create_expiring_links'),
     path('expiring-images/<uuid:token>/', ExpirationLinkRetrieveView.as_view(), name='retrieve_expiring_image'),
+    path('signed-images/<str:token>/', SignedLinkRetrieveView.as_view(), name='retrieve_signed_image'),
+    path('revoke-link/', SignedLinkRevokeView.as_view(), name='revoke_signed_link'),
+    path('link-cache/stats/', LinkCacheStatsView.as_view(), name='link_cache_stats'),
+    path('thumb/<int:image_id>/<int:height>/', ThumbnailRenderView.as_view(), name='render_thumbnail'),
 ]
@@ -2,69 +2,394 @@ import magic
 
 from datetime import timedelta
 
-from django.http import FileResponse
+from django.conf import settings
+from django.core import signing
 from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
 from rest_framework import generics, status
 from rest_framework.exceptions import ValidationError
-from django.core.exceptions import ValidationError as DjangoValidationError
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .pagination import ImagePagination
-from .serializers import ImageSerializer, ExpirationLinkSerializer
-from image_app.models import Image, ExpirationLink
+from .pagination import ImagePagination, ImageCursorPagination
+from .serializers import ImageSerializer, ExpirationLinkSerializer, SignedLinkSerializer, UploadSessionSerializer, \
+    DirectUploadSerializer
+from image_app import list_cache, signed_links
+from image_app.batch_upload import upload_batch
+from image_app.delivery import StoredFile, file_response, path_response
+from image_app.link_cache import MISSING, CachedLink, get_token_cache
+from image_app.models import Image, ExpirationLink, UploadSession
+from image_app.negotiation import choose_format
+from image_app.resumable import ChunkConflict, UploadSessionError, open_direct_upload, open_upload, write_chunk
+from image_app.thumbnails import get_cached_thumbnail
+from image_app.upload_handlers import ImageUploadHandler
+
+
+def get_content_type(field_file):
+    """
+    Detect the content type of a stored file from its first bytes, storages may not have local paths
+    """
+    with field_file.open('rb') as file:
+        return magic.from_buffer(file.read(2048), mime=True)
+
+
+def get_expiration_time(request, account_tier):
+    """
+    Validate the `expiration-time` of a link creation request against the account tier limits.
+
+    Returns (expiration time, None) or (None, error response).
+    """
+    min_duration = account_tier.expiring_link_duration_min
+    max_duration = account_tier.expiring_link_duration_max
+    expiration_time = request.data.get('expiration-time', None)
+
+    if not expiration_time:
+        return None, Response({'error': 'Expiration time not specified'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        expiration_time = int(expiration_time)
+        if not min_duration <= expiration_time <= max_duration:
+            raise ValueError
+    except (ValueError, TypeError):
+        return None, Response({'error': f'Expiration time needs to be between {min_duration} and {max_duration}'},
+                              status=status.HTTP_400_BAD_REQUEST)
+
+    return timezone.now() + timedelta(seconds=expiration_time), None
+
 
-ALLOWED_EXTENSIONS = ['jpg', 'jpeg', 'png', 'JPG']
+class ImageUploadMixin:
+    """
+    Parse uploads with ImageUploadHandler, it has to be installed before anything reads the request body
+    """
+    skip_rejected_uploads = False
 
+    def initialize_request(self, request, *args, **kwargs):
+        self.upload_handler = ImageUploadHandler(request, skip_rejected=self.skip_rejected_uploads)
+        request.upload_handlers = [self.upload_handler]
+        return super().initialize_request(request, *args, **kwargs)
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    def get_uploads(self, request, field_name):
+        """
+        Return the files of the field in request order, including files rejected by the upload handler
+        """
+        request.FILES  # parses the request body
+        return [file for file in self.upload_handler.uploads if file.field_name == field_name]
 
 
-class CreateImageView(generics.CreateAPIView):
+class CreateImageView(ImageUploadMixin, generics.CreateAPIView):
     """
     Create a new image with POST data.
 
     Parameters:
-    - original_image: The image file to be uploaded. The file should have a supported extension.
+    - original_image: The image file to be uploaded. JPEG and PNG images are accepted, the type is detected
+      from the file content.
+
+    With IMAGE_PROCESSING_ASYNC enabled the thumbnails are rendered by the `run_jobs` worker
+    and the response is 202 with the image in `pending` status.
     """
     queryset = Image.objects.all()
     permissions_classes = [IsAuthenticated]
     serializer_class = ImageSerializer
     throttle_scope = 'image_upload'
+    query_budget = 12
 
     def post(self, request, *args, **kwargs):
         user = request.user
         if not user.is_authenticated:
             return Response({'error': 'Unauthorized'}, status=status.HTTP_401_UNAUTHORIZED)
-        if 'original_image' not in request.FILES:
+        files = self.get_uploads(request, 'original_image')
+        if not files:
             raise ValidationError('File not uploaded')
-        file = request.FILES['original_image']
-        try:
-            if not allowed_file(file.name):
-                raise ValidationError('File extension not allowed')
-        except DjangoValidationError:
-            raise ValidationError('Incorrect file')
+        if files[0].upload_error:
+            raise ValidationError(files[0].upload_error)
         return super().post(request, *args, **kwargs)
 
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        if response.data.get('status') == Image.Status.PENDING:
+            response.status_code = status.HTTP_202_ACCEPTED
+        return response
+
     def perform_create(self, serializer):
         user = self.request.user
         serializer.save(user=user)
 
 
+class BatchCreateImageView(ImageUploadMixin, APIView):
+    """
+    Upload many images in one request with POST data.
+
+    Parameters:
+    - original_images: The image files to be uploaded, the field is repeated for every file.
+
+    Every file gets its own entry in `results`, either with the created `image` or with an `error`.
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_scope = 'image_upload'
+    query_budget = 10
+    # a rejected file only fails its own entry, files over the size limit stop reading the following files
+    skip_rejected_uploads = True
+
+    def post(self, request):
+        files = self.get_uploads(request, 'original_images')
+        if not files:
+            raise ValidationError('File not uploaded')
+        max_files = getattr(settings, 'UPLOAD_BATCH_MAX_FILES', 20)
+        if len(files) > max_files:
+            raise ValidationError(f'At most {max_files} files can be uploaded at once')
+
+        items = upload_batch(request.user, files)
+        results = []
+        for item in items:
+            if item.error is None:
+                results.append({'file': item.file.name,
+                                'image': ImageSerializer(item.image, context={'request': request}).data})
+            else:
+                results.append({'file': item.file.name, 'error': item.error})
+
+        if not any(item.error is None for item in items):
+            response_status = status.HTTP_400_BAD_REQUEST
+        elif getattr(settings, 'IMAGE_PROCESSING_ASYNC', False):
+            response_status = status.HTTP_202_ACCEPTED
+        else:
+            response_status = status.HTTP_201_CREATED
+        return Response({'results': results}, status=response_status)
+
+
+class UploadSessionCreateView(generics.CreateAPIView):
+    """
+    Start a resumable upload with POST data.
+
+    Parameters:
+    - file_name: Name of the uploaded file.
+    - size: Size of the file in bytes.
+
+    The file is then sent in chunks of `chunk_size` bytes to the chunk endpoint of the returned session `id`.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = UploadSessionSerializer
+    throttle_scope = 'image_upload'
+    query_budget = 3
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+
+class UploadSessionMixin:
+    permission_classes = [IsAuthenticated]
+    throttle_scope = 'upload_chunks'
+
+    def get_session(self, request, pk, direct=False):
+        sessions = UploadSession.objects.filter(pk=pk, user_id=request.user.pk)
+        if direct is not None:
+            sessions = sessions.filter(direct=direct)
+        return sessions.first()
+
+    def create_image(self, request, session, file):
+        """
+        Create the image of the uploaded file like `/api/upload/` does and remove the session
+        """
+        with file:
+            serializer = ImageSerializer(data={'original_image': file}, context={'request': request})
+            if not serializer.is_valid():
+                session.delete_file()
+                session.delete()
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            image = serializer.save(user=request.user)
+        session.delete_file()
+        session.delete()
+        response_status = status.HTTP_202_ACCEPTED if image.status == Image.Status.PENDING else status.HTTP_201_CREATED
+        return Response(serializer.data, status=response_status)
+
+
+class UploadSessionView(UploadSessionMixin, APIView):
+    """
+    Return the received `offset` of a resumable upload with GET or cancel it with DELETE.
+
+    Parameters:
+    - pk: The id of the upload session.
+
+    """
+    query_budget = 3
+
+    def get(self, request, pk):
+        session = self.get_session(request, pk, direct=None)
+        if session is None:
+            return Response({'error': 'Upload session not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(UploadSessionSerializer(session).data)
+
+    def delete(self, request, pk):
+        session = self.get_session(request, pk, direct=None)
+        if session is None:
+            return Response({'error': 'Upload session not found'}, status=status.HTTP_404_NOT_FOUND)
+        session.delete_file()
+        session.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UploadChunkView(UploadSessionMixin, APIView):
+    """
+    Upload chunk number `index` of a resumable upload with PUT, the request body is the raw chunk.
+
+    Parameters:
+    - pk: The id of the upload session.
+    - index: Number of the chunk, starting from 0.
+
+    Chunks are accepted in order, 409 is returned with the current `offset` when a chunk is ahead of it.
+    Chunks that were already received are acknowledged without being written again.
+    """
+    parser_classes = []
+    query_budget = 4
+
+    def put(self, request, pk, index):
+        session = self.get_session(request, pk)
+        if session is None:
+            return Response({'error': 'Upload session not found'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        try:
+            write_chunk(session, index, request.stream, length)
+        except ChunkConflict as e:
+            return Response({'error': str(e), 'offset': session.received}, status=status.HTTP_409_CONFLICT)
+        except UploadSessionError as e:
+            return Response({'error': str(e), 'offset': session.received}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(UploadSessionSerializer(session).data)
+
+
+class UploadSessionFinalizeView(UploadSessionMixin, APIView):
+    """
+    Create the image of a complete resumable upload with POST.
+
+    Parameters:
+    - pk: The id of the upload session.
+
+    The response is the same as for `/api/upload/`, the upload session is removed.
+    """
+    throttle_scope = 'image_upload'
+    query_budget = 15
+
+    def post(self, request, pk):
+        session = self.get_session(request, pk)
+        if session is None:
+            return Response({'error': 'Upload session not found'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            file = open_upload(session)
+        except ChunkConflict as e:
+            return Response({'error': str(e), 'offset': session.received}, status=status.HTTP_409_CONFLICT)
+        except UploadSessionError as e:
+            session.delete_file()
+            session.delete()
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return self.create_image(request, session, file)
+
+
+class DirectUploadCreateView(generics.CreateAPIView):
+    """
+    Start an upload sent by the client straight to the media storage with POST data.
+
+    Parameters:
+    - file_name: Name of the uploaded file.
+    - size: Size of the file in bytes.
+
+    The response contains the presigned `upload` form, POST its `fields` together with the `file` field to its
+    `url` and then call the complete endpoint of the returned session `id`. Only available with S3 storage.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = DirectUploadSerializer
+    throttle_scope = 'image_upload'
+    query_budget = 3
+
+    def create(self, request, *args, **kwargs):
+        if not hasattr(Image.original_image.field.storage, 'presigned_post'):
+            return Response({'error': 'Direct uploads are not supported by the media storage'},
+                            status=status.HTTP_501_NOT_IMPLEMENTED)
+        return super().create(request, *args, **kwargs)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user, direct=True)
+
+
+class DirectUploadCompleteView(UploadSessionMixin, APIView):
+    """
+    Create the image of a direct upload with POST once the client uploaded the file to the storage.
+
+    Parameters:
+    - pk: The id of the upload session.
+
+    The response is the same as for `/api/upload/`, 409 is returned while the file is not in the storage.
+    """
+    throttle_scope = 'image_upload'
+    query_budget = 15
+
+    def post(self, request, pk):
+        session = self.get_session(request, pk, direct=True)
+        if session is None:
+            return Response({'error': 'Upload session not found'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            file = open_direct_upload(session, Image.original_image.field.storage)
+        except ChunkConflict as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        except UploadSessionError as e:
+            session.delete_file()
+            session.delete()
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return self.create_image(request, session, file)
+
+
 class ListImageView(generics.ListAPIView):
     """
     List all images associated with the authenticated user.
+
+    Parameters:
+    - pagination: `cursor` switches to cursor pagination, pages are then followed with the `next` and `previous`
+      links and the response has no `count`. Page number pagination is used by default.
+
+    Representations are cached until the user's images change, or half of the expiry of presigned URLs
+    passes, and carry an ETag, requests with a matching If-None-Match header get 304 Not Modified. Thumbnails
+    are listed in the variant format of the account tier accepted by the Accept header,
+    e.g. `Accept: application/json, image/webp`.
     """
     permission_classes = [IsAuthenticated]
     serializer_class = ImageSerializer
     pagination_class = ImagePagination
+    cursor_pagination_class = ImageCursorPagination
     throttle_scope = 'images_list'
+    query_budget = 5
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            query_params = self.request.query_params
+            if query_params.get('pagination') == 'cursor' or 'cursor' in query_params:
+                self._paginator = self.cursor_pagination_class()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
     def get_queryset(self):
         user = self.request.user
-        return Image.objects.all().filter(user=user)
+        return Image.objects.all().filter(user=user).prefetch_related('thumbnails')
+
+    def list(self, request, *args, **kwargs):
+        key = list_cache.make_key(request)
+        etag = f'"{key.rsplit(":", 1)[1]}"'
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            data = list_cache.get_data(key)
+            if data is None:
+                response = super().list(request, *args, **kwargs)
+                list_cache.set_data(key, response.data)
+            else:
+                response = Response(data)
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Accept'])
+        return response
 
 
 class ExpirationLinkCreateAPIView(APIView):
@@ -73,9 +398,12 @@ class ExpirationLinkCreateAPIView(APIView):
 
     Parameters:
     - id: The unique identifier of the image.
+    - expiration-time: Number of seconds the link stays valid.
+    - link-type: `signed` creates a stateless signed link which is verified without database access.
 
     """
     throttle_scope = 'create_link'
+    query_budget = 4
 
     def post(self, request, pk):
         user = request.user
@@ -86,26 +414,19 @@ class ExpirationLinkCreateAPIView(APIView):
         except Image.DoesNotExist:
             return Response({'error': 'Photo not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        if image.user != request.user:
+        if image.user_id != user.pk:
             return Response({'error': 'You do not have permission to create an expiration link for this photo'},
                             status=status.HTTP_403_FORBIDDEN)
 
-        min_duration = user.account_tier.expiring_link_duration_min
-        max_duration = user.account_tier.expiring_link_duration_max
-        expiration_time = request.data.get('expiration-time', None)
+        expiration_time, error = get_expiration_time(request, user.account_tier)
+        if error is not None:
+            return error
 
-        if not expiration_time:
-            return Response({'error': 'Expiration time not specified'}, status=status.HTTP_400_BAD_REQUEST)
-
-        try:
-            expiration_time = int(request.data.get('expiration-time', None))
-            if not min_duration <= expiration_time <= max_duration:
-                raise ValueError
-        except (ValueError, TypeError):
-            return Response({'error': f'Expiration time needs to be between {min_duration} and {max_duration}'},
-                            status=status.HTTP_400_BAD_REQUEST)
-
-        expiration_time = timezone.now() + timedelta(seconds=int(expiration_time))
+        if request.data.get('link-type') == 'signed':
+            token = signed_links.make_token(image, expiration_time)
+            serializer = SignedLinkSerializer({'expiration_time': expiration_time, 'token': token},
+                                              context={'request': request})
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         link = ExpirationLink(image=image, expiration_time=expiration_time)
         link.save()
@@ -114,6 +435,67 @@ class ExpirationLinkCreateAPIView(APIView):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
+class ExpirationLinkBulkCreateAPIView(APIView):
+    """
+    Create expiration links for many images at once using POST data.
+
+    Parameters:
+    - images: List of unique identifiers of the images.
+    - expiration-time: Number of seconds the links stay valid.
+    - link-type: `signed` creates stateless signed links which are verified without database access.
+
+    Links are returned for every image the user owns, other identifiers are reported in `errors`.
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_scope = 'create_link'
+    query_budget = 5
+
+    def post(self, request):
+        user = request.user
+        image_ids = request.data.getlist('images') if hasattr(request.data, 'getlist') else request.data.get('images')
+        if not image_ids or not isinstance(image_ids, list):
+            return Response({'error': 'Images not specified'}, status=status.HTTP_400_BAD_REQUEST)
+        max_images = getattr(settings, 'LINK_BULK_MAX_IMAGES', 500)
+        if len(image_ids) > max_images:
+            return Response({'error': f'At most {max_images} images can be linked at once'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            image_ids = list(dict.fromkeys(int(image_id) for image_id in image_ids))
+        except (ValueError, TypeError):
+            return Response({'error': 'Image identifiers need to be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        expiration_time, error = get_expiration_time(request, user.account_tier)
+        if error is not None:
+            return error
+
+        images = Image.objects.filter(pk__in=image_ids).only('id', 'user_id', 'original_image', 'content_type')
+        images = {image.pk: image for image in images}
+        errors = []
+        owned = []
+        for image_id in image_ids:
+            image = images.get(image_id)
+            if image is None:
+                errors.append({'image': image_id, 'error': 'Photo not found'})
+            elif image.user_id != user.pk:
+                errors.append({'image': image_id,
+                               'error': 'You do not have permission to create an expiration link for this photo'})
+            else:
+                owned.append(image)
+
+        if request.data.get('link-type') == 'signed':
+            links = [{'image': image.pk, **SignedLinkSerializer(
+                {'expiration_time': expiration_time, 'token': signed_links.make_token(image, expiration_time)},
+                context={'request': request}).data} for image in owned]
+        else:
+            created = ExpirationLink.objects.bulk_create(
+                [ExpirationLink(image=image, expiration_time=expiration_time) for image in owned])
+            links = [{'image': link.image_id, **ExpirationLinkSerializer(link, context={'request': request}).data}
+                     for link in created]
+
+        response_status = status.HTTP_201_CREATED if links else status.HTTP_400_BAD_REQUEST
+        return Response({'links': links, 'errors': errors}, status=response_status)
+
+
 class ExpirationLinkRetrieveView(APIView):
     """
     Retrieve an image associated with a given expiration link.
@@ -121,19 +503,175 @@ class ExpirationLinkRetrieveView(APIView):
     Parameters:
     - token: The unique identifier associated with the ExpirationLink.
 
+    Resolved and unknown tokens are cached in process, see LINK_CACHE_* settings.
+    """
+    throttle_scope = 'expiring_images'
+    query_budget = 1
+
+    def get(self, request, token):
+        token_cache = get_token_cache()
+        link = token_cache.get(token)
+        if link is MISSING:
+            return Response({'error': 'Invalid or expired link'}, status=status.HTTP_404_NOT_FOUND)
+        if link is None:
+            try:
+                exp_link = ExpirationLink.objects.select_related('image').get(token=token)
+            except ExpirationLink.DoesNotExist:
+                token_cache.set_missing(token)
+                return Response({'error': 'Invalid or expired link'}, status=status.HTTP_404_NOT_FOUND)
+            image = exp_link.image
+            link = CachedLink(
+                name=image.original_image.name,
+                content_type=image.content_type or get_content_type(image.original_image),
+                checksum=image.checksum,
+                expiration_time=exp_link.expiration_time,
+            )
+            token_cache.set(token, link)
+
+        if link.expiration_time <= timezone.now():
+            return Response({'error': 'Link has expired'}, status=status.HTTP_410_GONE)
+
+        max_age = int((link.expiration_time - timezone.now()).total_seconds())
+        try:
+            return file_response(request, StoredFile(Image.original_image.field.storage, link.name),
+                                 link.content_type, etag=f'"{link.checksum}"' if link.checksum else None,
+                                 cache_control=f'private, max-age={max_age}', expires=max_age)
+        except FileNotFoundError:
+            # the image was deleted by another process, which only cleared its own token cache
+            token_cache.invalidate(token)
+            return Response({'error': 'Photo not found'}, status=status.HTTP_404_NOT_FOUND)
+
+
+class SignedLinkRetrieveView(APIView):
+    """
+    Retrieve an image associated with a given signed link.
+
+    Parameters:
+    - token: The signed token of the link.
+
     """
     throttle_scope = 'expiring_images'
+    query_budget = 1
 
     def get(self, request, token):
         try:
-            exp_link = ExpirationLink.objects.get(token=token)
-        except ExpirationLink.DoesNotExist:
+            link = signed_links.load_token(token)
+        except (signing.BadSignature, ValueError):
             return Response({'error': 'Invalid or expired link'}, status=status.HTTP_404_NOT_FOUND)
 
-        if not exp_link.is_valid():
+        if link.expiration_time <= timezone.now():
             return Response({'error': 'Link has expired'}, status=status.HTTP_410_GONE)
+        if link.digest in signed_links.get_revocations():
+            return Response({'error': 'Link has been revoked'}, status=status.HTTP_410_GONE)
+
+        max_age = int((link.expiration_time - timezone.now()).total_seconds())
+        try:
+            return file_response(request, StoredFile(Image.original_image.field.storage, link.name),
+                                 link.content_type or 'application/octet-stream',
+                                 cache_control=f'private, max-age={max_age}', expires=max_age)
+        except FileNotFoundError:
+            return Response({'error': 'Photo not found'}, status=status.HTTP_404_NOT_FOUND)
+
+
+class SignedLinkRevokeView(APIView):
+    """
+    Revoke a signed link of one of the user's images.
+
+    Parameters:
+    - token: The signed token of the link.
+
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_scope = 'create_link'
+    query_budget = 5
+
+    def post(self, request):
+        try:
+            link = signed_links.load_token(request.data.get('token', ''))
+        except (signing.BadSignature, ValueError):
+            return Response({'error': 'Invalid link'}, status=status.HTTP_400_BAD_REQUEST)
+        if not Image.objects.filter(pk=link.image_id, user_id=request.user.pk).exists():
+            return Response({'error': 'You do not have permission to revoke this link'},
+                            status=status.HTTP_403_FORBIDDEN)
+        signed_links.revoke(link)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class LinkCacheStatsView(APIView):
+    """
+    Return hit, miss and eviction counters of the expiring link cache of the serving process.
+    """
+    permission_classes = [IsAdminUser]
+    query_budget = 2
+
+    def get(self, request):
+        return Response(get_token_cache().stats())
+
+
+class ThumbnailRenderView(APIView):
+    """
+    Retrieve a thumbnail of the given height, rendered on the first request and served from the disk cache.
+
+    Parameters:
+    - image_id: The unique identifier of the image.
+    - height: Thumbnail height, it has to be one of the sizes of the user's account tier.
+
+    The thumbnail is rendered with the quality of the size in the account tier, in a variant format of the
+    size accepted by the Accept header or in the format of the original. Lazy sizes of the account tier are
+    only served by this view.
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_scope = 'thumbnails'
+    query_budget = 3
+
+    def get(self, request, image_id, height):
+        plan = request.user.account_tier.get_plan()
+        if height not in plan:
+            return Response({'error': 'Thumbnail size not available in your account tier'},
+                            status=status.HTTP_403_FORBIDDEN)
+        try:
+            image = Image.objects.get(pk=image_id, user=request.user)
+        except Image.DoesNotExist:
+            return Response({'error': 'Photo not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        image_format = choose_format(request, plan.formats(height))
+        path, content_type = get_cached_thumbnail(image, height, image_format, plan.quality(height))
+        try:
+            response = path_response(request, path, content_type, cache_control='private, max-age=3600')
+        except FileNotFoundError:
+            # evicted by a concurrent request between the lookup and the response
+            path, content_type = get_cached_thumbnail(image, height, image_format, plan.quality(height))
+            response = path_response(request, path, content_type, cache_control='private, max-age=3600')
+        patch_vary_headers(response, ['Accept'])
+        return response
+
+
+class OriginalImageView(APIView):
+    """
+    Retrieve the original of one of the user's images.
 
-        image_path = exp_link.image.original_image.path
-        image_content_type = magic.from_file(image_path, mime=True)
-        img = open(image_path, 'rb')
-        return FileResponse(img, content_type=image_content_type)
+    Parameters:
+    - pk: The unique identifier of the image.
+
+    Originals are not served by the public media route, they are only delivered to their owner on an account
+    tier with original links and through expiring links.
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_scope = 'thumbnails'
+    query_budget = 2
+
+    def get(self, request, pk):
+        if not request.user.account_tier.original_link:
+            return Response({'error': 'Original images are not available in your account tier'},
+                            status=status.HTTP_403_FORBIDDEN)
+        try:
+            image = Image.objects.get(pk=pk, user=request.user)
+        except Image.DoesNotExist:
+            return Response({'error': 'Photo not found'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            return file_response(request, StoredFile(Image.original_image.field.storage, image.original_image.name),
+                                 image.content_type or get_content_type(image.original_image),
+                                 etag=f'"{image.checksum}"' if image.checksum else None,
+                                 cache_control='private, max-age=3600')
+        except FileNotFoundError:
+            return Response({'error': 'Photo not found'}, status=status.HTTP_404_NOT_FOUND)
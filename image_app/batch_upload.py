@@ -0,0 +1,105 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from PIL import UnidentifiedImageError
+
+from image_app import blobs, list_cache
+from image_app.metadata import read_metadata
+from image_app.models import Image, Job, Thumbnail
+from image_app.thumbnails import build_thumbnails, get_image_extension, render_original, thumbnail_names, \
+    thumbnail_specs
+
+UPLOAD_ERRORS = (OSError, ValueError, UnidentifiedImageError)
+
+
+class BatchItem:
+    def __init__(self, file):
+        self.file = file
+        self.image = None
+        self.rendered = []
+        self.thumbnails = []
+        self.error = None
+
+
+def _validate(item):
+    if getattr(item.file, 'upload_error', None):
+        item.error = item.file.upload_error
+        return
+    try:
+        metadata = read_metadata(item.file)
+    except UPLOAD_ERRORS:
+        item.error = 'Incorrect file'
+        return
+    item.image = Image(**metadata)
+
+
+def _render(item, specs, plan):
+    # images of the batch are rendered in parallel threads, the engine's process pool is not used
+    try:
+        item.file.seek(0)
+        item.rendered = render_original(item.image, specs, source=item.file, workers=0, plan=plan)
+    except UPLOAD_ERRORS:
+        item.error = 'Incorrect file'
+
+
+def upload_batch(user, files):
+    """
+    Store many uploaded images at once and return a BatchItem for each file.
+
+    All files are validated up front, thumbnails of the valid ones are rendered concurrently and all Image
+    and Thumbnail rows are inserted with bulk inserts in one transaction. A file rejected by
+    ImageUploadHandler or failing validation or rendering only sets the `error` of its item. With
+    IMAGE_PROCESSING_ASYNC enabled the images are queued for the `run_jobs` worker instead of being rendered.
+    Originals and thumbnails are stored under their content address, so files already stored for identical
+    uploads are reused and their thumbnails are not rendered again.
+    """
+    items = [BatchItem(file) for file in files]
+    for item in items:
+        _validate(item)
+
+    processing_async = getattr(settings, 'IMAGE_PROCESSING_ASYNC', False)
+    plan = user.account_tier.get_plan()
+    valid = [item for item in items if item.error is None]
+    specs = {}
+    for item in valid:
+        item.image.user = user
+        item.image.original_image.name = blobs.original_name(item.image.checksum, get_image_extension(item.file.name))
+        specs[item] = [] if processing_async else thumbnail_specs(item.image, plan)
+    names = {item: thumbnail_names(item.image, specs[item], plan) for item in valid}
+    if any(specs.values()):
+        stored = blobs.stored(name for item in valid for name in names[item].values())
+        missing = {item: [spec for spec in specs[item] if names[item][spec] not in stored] for item in valid}
+        with ThreadPoolExecutor(max_workers=getattr(settings, 'UPLOAD_BATCH_WORKERS', 4)) as executor:
+            list(executor.map(lambda item: _render(item, missing[item], plan),
+                              [item for item in valid if missing[item]]))
+
+    # files written for a batch that fails are left in place, an identical upload reuses them
+    valid = [item for item in items if item.error is None]
+    storage = Image.original_image.field.storage
+    with transaction.atomic():
+        existing = blobs.acquire([item.image.original_image.name for item in valid] +
+                                 [name for item in valid for name in names[item].values()])
+        for item in valid:
+            if processing_async:
+                item.image.status = Image.Status.PENDING
+            name = item.image.original_image.name
+            if name not in existing or not storage.exists(name):
+                item.file.seek(0)
+                blobs.write(storage, name, item.file)
+            item.thumbnails = build_thumbnails(item.image, specs[item], item.rendered, existing=existing,
+                                                plan=plan)
+        Image.objects.bulk_create([item.image for item in valid])
+        if processing_async:
+            Job.objects.bulk_create([Job(kind='process_image', payload={'image_id': item.image.pk})
+                                     for item in valid])
+        else:
+            Thumbnail.objects.bulk_create([thumbnail for item in valid for thumbnail in item.thumbnails])
+
+    images = [item.image for item in valid]
+    if images:
+        prefetch_related_objects(images, 'thumbnails')
+        # bulk inserts do not send post_save, the list cache is invalidated once for the whole batch
+        list_cache.bump_version(user.pk)
+    return items
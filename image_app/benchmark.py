@@ -0,0 +1,225 @@
+import io
+import itertools
+import math
+import threading
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connections
+from django.urls import reverse
+from PIL import Image as img, ImageDraw
+from rest_framework.test import APIClient
+
+from image_app.models import ExpirationLink, Image
+from user_app.authentication import ClaimsRefreshToken
+from user_app.models import AccountTier, User
+
+SCENARIOS = ['upload', 'list', 'create_link', 'retrieve_link']
+IMAGE_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp'}
+
+
+def generate_image(size, index=0, image_format='JPEG'):
+    """
+    Return bytes of a synthetic image with photo-like detail, images of different `index` differ
+    """
+    width, height = size
+    detail = img.effect_mandelbrot(size, (-2.0, -1.25, 0.75, 1.25), 100)
+    image = img.merge('RGB', [detail, img.linear_gradient('L').resize(size), detail.transpose(img.FLIP_LEFT_RIGHT)])
+    # the index is drawn into a corner so every upload has its own content address
+    ImageDraw.Draw(image).rectangle((0, 0, min(width, 16) - 1, min(height, 16) - 1),
+                                    fill=(index % 256, index // 256 % 256, index // 65536 % 256))
+    file = io.BytesIO()
+    image.save(file, image_format)
+    return file.getvalue()
+
+
+def percentile(values, percent):
+    """
+    Return the nearest-rank percentile of sorted values
+    """
+    if not values:
+        return None
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+def summarize(samples, elapsed):
+    """
+    Return request count, errors, requests per second, latency percentiles in milliseconds and queries per
+    request of (latency, status code, query count) samples
+    """
+    latencies = sorted(latency * 1000 for latency, _, _ in samples)
+    queries = [count for _, _, count in samples if count is not None]
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for _, status_code, _ in samples if status_code >= 400),
+        'rps': round(len(samples) / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'mean': sum(latencies) / len(latencies) if latencies else None,
+            'max': latencies[-1] if latencies else None,
+        },
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+class LoadBenchmark:
+    """
+    Load benchmark of the API driving requests through the full middleware and view stack in process.
+
+    `seed` loads the account tiers of initial_data.json, creates `users` users per tier and uploads `images`
+    synthetic images for every user. `run` sends `requests` requests of every scenario from `concurrency`
+    threads and returns a report with latency percentiles, requests per second and queries per request.
+    Queries are counted by QueryCountMiddleware, so QUERY_COUNT_HEADERS has to be enabled.
+    """
+
+    def __init__(self, users=5, images=2, image_sizes=((1920, 1080),), image_format='JPEG', requests=100,
+                 concurrency=4, warmup=5):
+        self.users = users
+        self.images = images
+        self.image_sizes = list(image_sizes)
+        self.image_format = image_format
+        self.requests = requests
+        self.concurrency = concurrency
+        self.warmup = warmup
+        self.uploads = itertools.count()
+        self.accounts = []
+        self.links = []
+        self.local = threading.local()
+
+    def seed(self):
+        call_command('loaddata', 'initial_data.json', verbosity=0)
+        # one unusable password for all users, the benchmark authenticates with tokens
+        password = make_password(None)
+        tiers = list(AccountTier.objects.filter(name__in=['Basic', 'Premium', 'Enterprise']))
+        User.objects.bulk_create([
+            User(email=f'bench-{tier.pk}-{number}@bench.local', username=f'bench-{tier.pk}-{number}',
+                 password=password, account_tier=tier)
+            for tier in tiers for number in range(self.users)
+        ], ignore_conflicts=True)
+        users = User.objects.filter(email__endswith='@bench.local').select_related('account_tier').order_by('pk')
+        self.accounts = [(user, f'Bearer {ClaimsRefreshToken.for_user(user).access_token}') for user in users]
+        for index in range(len(self.accounts) * self.images):
+            self.upload_request(index)()
+
+    def get_client(self):
+        if not hasattr(self.local, 'client'):
+            # server errors are counted as failed requests instead of stopping the thread
+            self.local.client = APIClient(raise_request_exception=False)
+        return self.local.client
+
+    # every scenario returns a callable sending the request, the request body is prepared outside of the timing
+
+    def upload_request(self, index):
+        _, authorization = self.accounts[index % len(self.accounts)]
+        number = next(self.uploads)
+        size = self.image_sizes[number % len(self.image_sizes)]
+        file = SimpleUploadedFile(f'bench-{number}{IMAGE_EXTENSIONS[self.image_format]}',
+                                  generate_image(size, number, self.image_format))
+        client = self.get_client()
+        return lambda: client.post(reverse('image_create'), {'original_image': file}, format='multipart',
+                                   HTTP_AUTHORIZATION=authorization)
+
+    def list_request(self, index):
+        _, authorization = self.accounts[index % len(self.accounts)]
+        client = self.get_client()
+        return lambda: client.get(reverse('image_list'), HTTP_AUTHORIZATION=authorization)
+
+    def create_link_request(self, index):
+        image_id, authorization = self.link_images[index % len(self.link_images)]
+        client = self.get_client()
+
+        def send():
+            response = client.post(reverse('create_expiring_link', args=[image_id]), {'expiration-time': 3600},
+                                   HTTP_AUTHORIZATION=authorization)
+            if response.status_code == 201:
+                self.links.append(response.data['link'].rstrip('/').rsplit('/', 1)[-1])
+            return response
+        return send
+
+    def retrieve_link_request(self, index):
+        token = self.links[index % len(self.links)]
+        client = self.get_client()
+
+        def send():
+            response = client.get(reverse('retrieve_expiring_image', args=[token]))
+            # the file is streamed, reading it is part of the request
+            for _ in getattr(response, 'streaming_content', ()):
+                pass
+            return response
+        return send
+
+    def prepare(self, scenario):
+        if scenario in ('create_link', 'retrieve_link'):
+            tokens = {user.pk: authorization for user, authorization in self.accounts
+                      if user.account_tier.expiring_link}
+            self.link_images = [(image_id, tokens[user_id]) for image_id, user_id in
+                                Image.objects.filter(user_id__in=tokens).values_list('pk', 'user_id')]
+            if not self.link_images:
+                raise ValueError('Expiring links need images of users with expiring links in their account tier')
+        if scenario == 'retrieve_link' and not self.links:
+            self.links = [str(token) for token in ExpirationLink.objects.filter(
+                image__user_id__in=tokens).values_list('token', flat=True)]
+            if not self.links:
+                for index in range(len(self.link_images)):
+                    self.create_link_request(index)()
+
+    def measure(self, scenario, count):
+        """
+        Send `count` requests of the scenario from `concurrency` threads and return (samples, elapsed seconds)
+        """
+        indexes = iter(range(count))
+        lock = threading.Lock()
+        samples = []
+
+        def worker():
+            try:
+                while True:
+                    with lock:
+                        index = next(indexes, None)
+                    if index is None:
+                        return
+                    send = getattr(self, f'{scenario}_request')(index)
+                    started = time.perf_counter()
+                    response = send()
+                    latency = time.perf_counter() - started
+                    queries = response.get('X-Query-Count')
+                    with lock:
+                        samples.append((latency, response.status_code, int(queries) if queries else None))
+            finally:
+                # every thread has its own database connections
+                for connection in connections.all(initialized_only=True):
+                    connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(max(1, self.concurrency))]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return samples, time.perf_counter() - started
+
+    def run(self, scenarios=SCENARIOS):
+        report = {
+            'config': {
+                'users_per_tier': self.users,
+                'images_per_user': self.images,
+                'image_sizes': ['x'.join(map(str, size)) for size in self.image_sizes],
+                'image_format': self.image_format,
+                'requests': self.requests,
+                'concurrency': self.concurrency,
+                'warmup': self.warmup,
+                'database': connections['default'].vendor,
+            },
+            'scenarios': {},
+        }
+        for scenario in scenarios:
+            self.prepare(scenario)
+            if self.warmup:
+                self.measure(scenario, self.warmup)
+            samples, elapsed = self.measure(scenario, self.requests)
+            report['scenarios'][scenario] = summarize(samples, elapsed)
+        return report
@@ -0,0 +1,96 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F
+from django.utils.crypto import salted_hmac
+
+from image_app.models import Blob
+
+
+def original_name(checksum, extension):
+    # keyed with SECRET_KEY, the name of an original cannot be derived from the checksum in its thumbnail names
+    stem = salted_hmac('image_app.blobs.original_name', checksum, algorithm='sha256').hexdigest()
+    return f'images/original/{stem[:2]}/{stem}{extension}'
+
+
+def thumbnail_name(checksum, height, extension, quality=None):
+    if quality is not None:
+        return f'images/thumbnails/{checksum[:2]}/{checksum}_{height}_q{quality}{extension}'
+    return f'images/thumbnails/{checksum[:2]}/{checksum}_{height}{extension}'
+
+
+def stored(names):
+    """
+    Return the names of blobs that are referenced and therefore stored
+    """
+    return set(Blob.objects.filter(name__in=set(names), references__gt=0).values_list('name', flat=True))
+
+
+@transaction.atomic(savepoint=False)
+def acquire(names):
+    """
+    Add a reference to the blob of every name, a name may repeat, and return the names of blobs that existed.
+
+    Existing blobs are locked until the transaction commits, so a concurrent release cannot delete them
+    in between. Blobs created by a concurrent upload meanwhile are referenced as well.
+    """
+    counts = Counter(names)
+    existing = set(Blob.objects.select_for_update().filter(name__in=counts).values_list('name', flat=True))
+    new = [name for name in counts if name not in existing]
+    if new:
+        Blob.objects.bulk_create([Blob(name=name) for name in new], ignore_conflicts=True)
+    # names referenced the same number of times are updated by one query
+    by_count = {}
+    for name, count in counts.items():
+        by_count.setdefault(count, []).append(name)
+    for count, names in by_count.items():
+        Blob.objects.filter(name__in=names).update(references=F('references') + count)
+    return existing
+
+
+def write(storage, name, content):
+    """
+    Write the content of a blob unless the file is already stored
+    """
+    if storage.exists(name):
+        return
+    source_name = getattr(content, 'storage_name', None)
+    if source_name is not None and hasattr(storage, 'copy'):
+        # the content was uploaded to the storage directly, it is copied without passing through the application
+        storage.copy(source_name, name)
+        return
+    saved_name = storage.save(name, content)
+    if saved_name != name:
+        # another process wrote the same content meanwhile
+        storage.delete(saved_name)
+
+
+def store(storage, name, content):
+    """
+    Reference the blob and write its content when it was not stored yet, returns the name
+    """
+    if name not in acquire([name]) or not storage.exists(name):
+        write(storage, name, content)
+    return name
+
+
+@transaction.atomic(savepoint=False)
+def release(storage, names):
+    """
+    Remove a reference from the blob of every name, files of blobs without references are deleted on commit
+    """
+    counts = Counter(name for name in names if name)
+    for name, count in counts.items():
+        Blob.objects.filter(name=name, references__gte=count).update(references=F('references') - count)
+    orphaned = list(Blob.objects.filter(name__in=counts, references=0).values_list('name', flat=True))
+    if not orphaned:
+        return
+    Blob.objects.filter(name__in=orphaned, references=0).delete()
+
+    def delete_files():
+        # the content may have been uploaded again after the blob was deleted
+        referenced = stored(orphaned)
+        for name in orphaned:
+            if name not in referenced:
+                storage.delete(name)
+    transaction.on_commit(delete_files)
@@ -0,0 +1,223 @@
+import os
+import re
+import uuid
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+DELIVERY_PYTHON = 'python'
+DELIVERY_X_ACCEL_REDIRECT = 'x-accel-redirect'
+DELIVERY_X_SENDFILE = 'x-sendfile'
+DELIVERY_REDIRECT = 'redirect'
+
+MAX_RANGES = 16
+CHUNK_SIZE = 64 * 1024
+RANGE_PATTERN = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+
+
+class StoredFile:
+    """
+    Minimal stand-in for a FieldFile when only the storage name of a file is known
+    """
+
+    def __init__(self, storage, name):
+        self.storage = storage
+        self.name = name
+
+    @property
+    def path(self):
+        return self.storage.path(self.name)
+
+
+def make_etag(size, last_modified):
+    return f'"{int(last_modified):x}-{size:x}"'
+
+
+def parse_range(header, size):
+    """
+    Parse a Range header into a list of (start, end) byte offsets, end included.
+
+    Returns None when the header is missing, malformed or asks for too many ranges, in which case
+    the whole file is sent. An empty list means no range is satisfiable.
+    """
+    if not header or '=' not in header:
+        return None
+    unit, _, ranges_spec = header.partition('=')
+    if unit.strip().lower() != 'bytes':
+        return None
+    specs = ranges_spec.split(',')
+    if len(specs) > MAX_RANGES:
+        return None
+    ranges = []
+    for spec in specs:
+        match = RANGE_PATTERN.match(spec)
+        if not match or match.groups() == ('', ''):
+            return None
+        first, last = match.groups()
+        if not first:
+            # suffix range, the last N bytes
+            length = int(last)
+            if length == 0:
+                continue
+            ranges.append((max(0, size - length), size - 1))
+            continue
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+        if start < size:
+            ranges.append((start, end))
+    return ranges
+
+
+def _range_applies(request, etag, last_modified):
+    """
+    Return True if the Range header should be honoured according to If-Range
+    """
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    if_range_date = parse_http_date_safe(if_range)
+    return if_range_date is not None and int(last_modified) <= if_range_date
+
+
+def _iter_range(file, start, end):
+    file.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        chunk = file.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+
+def _iter_multipart(open_file, ranges, size, content_type, boundary):
+    with open_file() as file:
+        for start, end in ranges:
+            yield (f'--{boundary}\r\nContent-Type: {content_type}\r\n'
+                   f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n').encode()
+            yield from _iter_range(file, start, end)
+            yield b'\r\n'
+        yield f'--{boundary}--\r\n'.encode()
+
+
+def _iter_single(open_file, start, end):
+    with open_file() as file:
+        yield from _iter_range(file, start, end)
+
+
+def serve_file(request, open_file, size, last_modified, content_type, etag=None, cache_control=None):
+    """
+    Return a response for a file honouring conditional and Range requests.
+
+    Parameters:
+    - open_file: Callable returning the file opened in binary mode, it is only called when the body is sent.
+    - size: File size in bytes.
+    - last_modified: Modification time as a POSIX timestamp.
+    - etag: Strong entity tag, derived from the size and modification time when not given.
+    - cache_control: Value of the Cache-Control header.
+
+    Supports If-None-Match, If-Modified-Since, If-Match and If-Unmodified-Since validation, single ranges
+    (206 Partial Content), multiple ranges (multipart/byteranges) and If-Range.
+    """
+    etag = etag or make_etag(size, last_modified)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+        'Accept-Ranges': 'bytes',
+    }
+    if cache_control:
+        headers['Cache-Control'] = cache_control
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(last_modified))
+    if response is not None:
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    ranges = None
+    if request.method == 'GET' and _range_applies(request, etag, last_modified):
+        ranges = parse_range(request.headers.get('Range'), size)
+
+    if ranges is None:
+        if request.method == 'HEAD':
+            response = HttpResponse(content_type=content_type)
+        else:
+            response = FileResponse(open_file(), content_type=content_type)
+        response['Content-Length'] = str(size)
+    elif not ranges:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response = StreamingHttpResponse(_iter_single(open_file, start, end), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        boundary = uuid.uuid4().hex
+        response = StreamingHttpResponse(_iter_multipart(open_file, ranges, size, content_type, boundary),
+                                         status=206, content_type=f'multipart/byteranges; boundary={boundary}')
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+def file_response(request, field_file, content_type, etag=None, cache_control=None, expires=None):
+    """
+    Return a response delivering the stored file according to MEDIA_DELIVERY_MODE.
+
+    - python: the file is sent by the application with `serve_file`.
+    - x-accel-redirect: nginx serves the file from the internal MEDIA_ACCEL_REDIRECT_PREFIX location.
+    - x-sendfile: the web server (Apache mod_xsendfile, lighttpd) serves the file from its absolute path.
+    - redirect: the client is redirected to the URL of the file in the storage, a presigned GET URL of
+      S3Storage valid for at most `expires` seconds.
+    In the web server and redirect modes the application never opens the file and the web server or object
+    store handles Range and conditional requests.
+    """
+    mode = getattr(settings, 'MEDIA_DELIVERY_MODE', DELIVERY_PYTHON)
+    if mode == DELIVERY_REDIRECT:
+        expire = getattr(settings, 'S3_PRESIGNED_EXPIRY', 3600)
+        if expires is not None:
+            expire = max(1, min(expire, expires))
+        response = HttpResponseRedirect(field_file.storage.url(field_file.name, expire=expire))
+        # the presigned URL expires, the redirect itself is not cached
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+    if mode in (DELIVERY_X_ACCEL_REDIRECT, DELIVERY_X_SENDFILE):
+        response = HttpResponse(content_type=content_type)
+        if mode == DELIVERY_X_ACCEL_REDIRECT:
+            response['X-Accel-Redirect'] = quote(settings.MEDIA_ACCEL_REDIRECT_PREFIX + field_file.name)
+        else:
+            response['X-Sendfile'] = field_file.path
+        if etag:
+            response['ETag'] = etag
+        if cache_control:
+            response['Cache-Control'] = cache_control
+        return response
+
+    storage = field_file.storage
+    name = field_file.name
+    return serve_file(
+        request,
+        lambda: storage.open(name, 'rb'),
+        storage.size(name),
+        storage.get_modified_time(name).timestamp(),
+        content_type,
+        etag=etag,
+        cache_control=cache_control,
+    )
+
+
+def path_response(request, path, content_type, cache_control=None):
+    """
+    Return a response for a local file with `serve_file`
+    """
+    stat = os.stat(path)
+    return serve_file(request, lambda: open(path, 'rb'), stat.st_size, stat.st_mtime, content_type,
+                      cache_control=cache_control)
@@ -0,0 +1,109 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from image_app.models import Job
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+
+def register(kind, on_failure=None):
+    """
+    Register a function as the handler of jobs of the given kind.
+
+    The handler is called with the job payload as keyword arguments. `on_failure` is called the same way
+    once the job ran out of attempts.
+    """
+    def decorator(func):
+        _handlers[kind] = (func, on_failure)
+        return func
+    return decorator
+
+
+def enqueue(kind, run_after=None, **payload):
+    """
+    Store a new job of the given kind, it is picked up by the next `run_jobs` worker poll
+    """
+    if kind not in _handlers:
+        raise ValueError(f'Unknown job kind: {kind}')
+    return Job.objects.create(kind=kind, payload=payload, run_after=run_after or timezone.now())
+
+
+def schedule_repeating(kind, interval, **payload):
+    """
+    Queue a job of the given kind repeating every `interval` seconds, returns the job or None when a job of
+    the kind is already queued or running
+    """
+    # a running job schedules its next run itself
+    if Job.objects.filter(kind=kind, status__in=[Job.Status.QUEUED, Job.Status.RUNNING]).exists():
+        return None
+    return enqueue(kind, interval=interval, **payload)
+
+
+def schedule_next(kind, interval=None, **payload):
+    """
+    Queue the next run of a repeating job `interval` seconds from now, jobs without an interval run once
+    """
+    if interval:
+        return enqueue(kind, run_after=timezone.now() + timedelta(seconds=interval), interval=interval, **payload)
+    return None
+
+
+def claim(batch_size=1):
+    """
+    Lock up to `batch_size` due jobs and mark them as running.
+
+    Rows locked by another worker are skipped, so any number of workers can poll the same table.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=getattr(settings, 'JOB_LOCK_TIMEOUT', 600))
+    with transaction.atomic():
+        due = Job.objects.filter(status=Job.Status.QUEUED, run_after__lte=now)
+        abandoned = Job.objects.filter(status=Job.Status.RUNNING, locked_at__lt=stale)
+        jobs = list((due | abandoned).select_for_update(skip_locked=True).order_by('run_after', 'id')[:batch_size])
+        Job.objects.filter(pk__in=[job.pk for job in jobs]).update(status=Job.Status.RUNNING, locked_at=now)
+    for job in jobs:
+        job.status = Job.Status.RUNNING
+        job.locked_at = now
+    return jobs
+
+
+def run(job):
+    """
+    Execute a claimed job and record the outcome, failed jobs are retried with a linear backoff
+    """
+    handler, on_failure = _handlers[job.kind]
+    job.attempts += 1
+    try:
+        handler(**job.payload)
+    except Exception:
+        logger.exception('Job %s failed', job)
+        job.last_error = traceback.format_exc()
+        if job.attempts >= getattr(settings, 'JOB_MAX_ATTEMPTS', 3):
+            job.status = Job.Status.FAILED
+            if on_failure is not None:
+                on_failure(**job.payload)
+        else:
+            job.status = Job.Status.QUEUED
+            job.run_after = timezone.now() + timedelta(seconds=getattr(settings, 'JOB_RETRY_DELAY', 30) * job.attempts)
+    else:
+        job.status = Job.Status.DONE
+    job.locked_at = None
+    job.save(update_fields=['attempts', 'status', 'run_after', 'locked_at', 'last_error'])
+    return job
+
+
+def run_pending(batch_size=10):
+    """
+    Claim and run one batch of due jobs, returns the number of processed jobs
+    """
+    jobs = claim(batch_size)
+    for job in jobs:
+        run(job)
+    return len(jobs)
@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.utils import timezone
+
+CachedLink = namedtuple('CachedLink', ['name', 'content_type', 'checksum', 'expiration_time'])
+
+MISSING = object()
+
+
+class TokenCache:
+    """
+    Bounded in-process LRU cache of resolved expiring links.
+
+    Resolved links are kept until the configured TTL or their expiration time, whichever comes first.
+    Unknown tokens are remembered for a short negative TTL in a separate LRU, so probing random tokens
+    cannot evict resolved links.
+    """
+
+    def __init__(self, max_entries, ttl, negative_ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._links = OrderedDict()
+        self._missing = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.negative_hits = self.misses = self.evictions = 0
+
+    def get(self, token):
+        """
+        Return the CachedLink of the token, MISSING for a known unknown token or None on a cache miss
+        """
+        now = time.monotonic()
+        with self._lock:
+            for entries, result in ((self._links, None), (self._missing, MISSING)):
+                item = entries.get(token)
+                if item is None:
+                    continue
+                expires, value = item
+                if expires <= now:
+                    del entries[token]
+                    continue
+                entries.move_to_end(token)
+                if value is MISSING:
+                    self.negative_hits += 1
+                else:
+                    self.hits += 1
+                return value
+            self.misses += 1
+            return None
+
+    def _store(self, entries, token, value, ttl):
+        entries[token] = (time.monotonic() + ttl, value)
+        entries.move_to_end(token)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def set(self, token, link):
+        ttl = min(self.ttl, (link.expiration_time - timezone.now()).total_seconds())
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._missing.pop(token, None)
+            self._store(self._links, token, link, ttl)
+
+    def set_missing(self, token):
+        with self._lock:
+            self._store(self._missing, token, MISSING, self.negative_ttl)
+
+    def invalidate(self, token):
+        with self._lock:
+            self._links.pop(token, None)
+            self._missing.pop(token, None)
+
+    def clear(self):
+        with self._lock:
+            self._links.clear()
+            self._missing.clear()
+            self.hits = self.negative_hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._links),
+                'negative_entries': len(self._missing),
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+_token_cache = None
+
+
+def get_token_cache():
+    """
+    Return the process wide cache configured by LINK_CACHE_* settings
+    """
+    global _token_cache
+    if _token_cache is None:
+        _token_cache = TokenCache(
+            max_entries=getattr(settings, 'LINK_CACHE_MAX_ENTRIES', 10000),
+            ttl=getattr(settings, 'LINK_CACHE_TTL', 300),
+            negative_ttl=getattr(settings, 'LINK_CACHE_NEGATIVE_TTL', 30),
+        )
+    return _token_cache
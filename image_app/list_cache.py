@@ -0,0 +1,92 @@
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from image_app.models import Image, Thumbnail
+from image_app.negotiation import choose_format
+
+VERSION_KEY = 'image_list_version:{}'
+
+
+def get_cache():
+    return caches[getattr(settings, 'LIST_CACHE_ALIAS', 'default')]
+
+
+def get_version(user_id):
+    """
+    Return the current version of the user's image list.
+
+    Versions are random tokens instead of counters, a version evicted from the cache is replaced by a new one
+    and never matches representations cached before.
+    """
+    cache = get_cache()
+    key = VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(user_id):
+    """
+    Invalidate every cached list representation of the user once the current transaction commits.
+
+    A version changed before the commit could be read together with the old rows by a concurrent request,
+    which would cache the stale list under the new version.
+    """
+    if user_id is not None:
+        transaction.on_commit(lambda: get_cache().set(VERSION_KEY.format(user_id), uuid.uuid4().hex, None))
+
+
+def get_url_period():
+    """
+    Return the number of seconds a list representation holding expiring URLs is used for or None.
+
+    Storages presigning their URLs set `url_expiry`, representations are replaced every half of it, so the URLs
+    a client keeps while its ETag matches are valid for at least half of their expiry.
+    """
+    expiries = [getattr(storage, 'url_expiry', None)
+                for storage in (Image.original_image.field.storage, Thumbnail.thumbnail.field.storage)]
+    expiries = [expiry for expiry in expiries if expiry]
+    return max(1, min(expiries) // 2) if expiries else None
+
+
+def make_key(request):
+    """
+    Return the cache key of the list representation for the request.
+
+    The representation depends on the user's images, the tier features and thumbnail plan of the user, the query
+    parameters, the host used in absolute URLs, the negotiated renderer and the negotiated thumbnail format.
+    With expiring URLs it also changes every period of `get_url_period`.
+    """
+    user = request.user
+    tier = user.account_tier
+    plan = tier.get_plan()
+    parts = [
+        get_version(user.pk),
+        tier.pk,
+        tier.original_link,
+        choose_format(request, plan.variant_formats),
+        plan.digest,
+        request.build_absolute_uri('/'),
+        request.accepted_renderer.format,
+        sorted(request.query_params.lists()),
+    ]
+    period = get_url_period()
+    if period:
+        parts.append(int(time.time()) // period)
+    digest = hashlib.sha256(repr(parts).encode()).hexdigest()
+    return f'image_list:{user.pk}:{digest}'
+
+
+def get_data(key):
+    return get_cache().get(key)
+
+
+def set_data(key, data):
+    get_cache().set(key, data, getattr(settings, 'LIST_CACHE_TIMEOUT', 300))
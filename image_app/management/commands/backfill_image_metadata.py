@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from image_app.metadata import read_metadata
+from image_app.models import Image
+
+METADATA_FIELDS = ['content_type', 'file_size', 'width', 'height', 'checksum']
+
+
+class Command(BaseCommand):
+    help = 'Store content type, size, dimensions and checksum of images uploaded before they were recorded'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of images updated per query')
+
+    def handle(self, *args, **options):
+        last_id = 0
+        updated = failed = 0
+        queryset = Image.objects.filter(checksum='').only('id', 'original_image').order_by('pk')
+        while True:
+            batch = list(queryset.filter(pk__gt=last_id)[:options['batch_size']])
+            if not batch:
+                break
+            last_id = batch[-1].pk
+            changed = []
+            for image in batch:
+                try:
+                    with image.original_image.open('rb') as original:
+                        metadata = read_metadata(original)
+                except (OSError, ValueError) as e:
+                    failed += 1
+                    self.stderr.write(f'Image {image.pk}: {e}')
+                    continue
+                for field, value in metadata.items():
+                    setattr(image, field, value)
+                changed.append(image)
+            Image.objects.bulk_update(changed, METADATA_FIELDS)
+            updated += len(changed)
+            self.stdout.write(f'Processed images up to {last_id}: {updated} updated, {failed} failed')
+        self.stdout.write(self.style.SUCCESS(f'Done: {updated} images updated, {failed} failed'))
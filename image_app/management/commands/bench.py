@@ -0,0 +1,85 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings, setup_databases, setup_test_environment, teardown_databases, \
+    teardown_test_environment
+from rest_framework.views import APIView
+
+from image_app.benchmark import IMAGE_EXTENSIONS, SCENARIOS, LoadBenchmark
+
+
+def parse_size(value):
+    try:
+        width, height = (int(part) for part in value.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'Invalid image size {value}, use WIDTHxHEIGHT')
+    return width, height
+
+
+class Command(BaseCommand):
+    help = ('Seed a test database with users of every account tier and synthetic images, then measure latency '
+            'percentiles, requests per second and queries per request of API scenarios and print them as JSON. '
+            'Files are written to a temporary directory and the test database is destroyed afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                            help='Scenario to run, repeat for more, all scenarios run by default')
+        parser.add_argument('--users', type=int, default=5, help='Number of users seeded per account tier')
+        parser.add_argument('--images', type=int, default=2, help='Number of images seeded per user')
+        parser.add_argument('--image-size', action='append', type=parse_size,
+                            help='Size of generated images as WIDTHxHEIGHT, repeat to upload several sizes')
+        parser.add_argument('--image-format', choices=sorted(IMAGE_EXTENSIONS), default='JPEG',
+                            help='Format of generated images')
+        parser.add_argument('--requests', type=int, default=100, help='Number of measured requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=4, help='Number of threads sending requests')
+        parser.add_argument('--warmup', type=int, default=5, help='Number of unmeasured requests per scenario')
+        parser.add_argument('--throttle', action='store_true', help='Keep request throttling enabled')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the test database between runs')
+        parser.add_argument('--output', help='Write the report to this file instead of the standard output')
+
+    def handle(self, *args, **options):
+        benchmark = LoadBenchmark(
+            users=options['users'],
+            images=options['images'],
+            image_sizes=options['image_size'] or [(1920, 1080)],
+            image_format=options['image_format'],
+            requests=options['requests'],
+            concurrency=options['concurrency'],
+            warmup=options['warmup'],
+        )
+        if connection.vendor == 'sqlite' and options['concurrency'] > 1:
+            self.stderr.write('SQLite locks tables for concurrent writes, use PostgreSQL to measure concurrent uploads')
+        root = tempfile.mkdtemp(prefix='bench-')
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+        throttle_classes = APIView.throttle_classes
+        try:
+            if not options['throttle']:
+                APIView.throttle_classes = []
+            with override_settings(
+                    STORAGES={**settings.STORAGES,
+                              'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'}},
+                    MEDIA_ROOT=os.path.join(root, 'media'),
+                    THUMBNAIL_CACHE_ROOT=os.path.join(root, 'thumbnails'),
+                    UPLOAD_SESSION_ROOT=os.path.join(root, 'uploads'),
+                    QUERY_COUNT_HEADERS=True):
+                benchmark.seed()
+                report = benchmark.run(options['scenario'] or SCENARIOS)
+        finally:
+            APIView.throttle_classes = throttle_classes
+            teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+            shutil.rmtree(root, ignore_errors=True)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output + '\n')
+        else:
+            self.stdout.write(output)
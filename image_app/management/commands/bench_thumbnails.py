@@ -0,0 +1,103 @@
+import json
+import os
+import platform
+
+import PIL
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from image_app.benchmark import generate_image
+from image_app.thumbnail_bench import HEIGHTS, compare, get_cases, get_noise, run_cases
+
+
+class Command(BaseCommand):
+    help = ('Measure decode, resize, encode and save times, output bytes and peak RSS of the thumbnail engine over '
+            'a fixed corpus of synthetic images for several resample filters, formats and qualities. With --check '
+            'the run fails when a case regresses against the stored baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--case', action='append',
+                            help='Only run cases whose id contains this text, e.g. 4000x3000 or webp, repeatable')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Minimum number of measured runs per case, the fastest is reported')
+        parser.add_argument('--min-time', type=float, default=0.2,
+                            help='Minimum number of seconds every case is measured for')
+        parser.add_argument('--samples', type=int, default=3,
+                            help='Number of passes over the cases, the fastest pass of every case is reported')
+        parser.add_argument('--baseline', default=getattr(settings, 'THUMBNAIL_BENCH_BASELINE', None),
+                            help='Baseline file, defaults to THUMBNAIL_BENCH_BASELINE')
+        parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baseline')
+        parser.add_argument('--check', action='store_true',
+                            help='Fail when a case is slower or uses more memory than the baseline allows')
+        parser.add_argument('--time-tolerance', type=float,
+                            default=getattr(settings, 'THUMBNAIL_BENCH_TIME_TOLERANCE', 0.25),
+                            help='Allowed relative growth of the total time of a case')
+        parser.add_argument('--min-regression-ms', type=float,
+                            default=getattr(settings, 'THUMBNAIL_BENCH_MIN_REGRESSION_MS', 10.0),
+                            help='Growth of the total time of a case in milliseconds ignored as noise')
+        parser.add_argument('--memory-tolerance', type=float,
+                            default=getattr(settings, 'THUMBNAIL_BENCH_MEMORY_TOLERANCE', 0.1),
+                            help='Allowed relative growth of the peak RSS of a case')
+        parser.add_argument('--output', help='Write the results to this file instead of the standard output')
+
+    def handle(self, *args, **options):
+        cases = [case for case in get_cases()
+                 if not options['case'] or any(text in case[0] for text in options['case'])]
+        if not cases:
+            raise CommandError('No cases match')
+        images = {source: generate_image((source.width, source.height), image_format=source.format)
+                  for _, source, _ in cases}
+        report = {
+            'environment': {
+                'python': platform.python_version(),
+                'pillow': PIL.__version__,
+                'machine': platform.machine(),
+            },
+            'heights': list(HEIGHTS),
+            'repeat': options['repeat'],
+            'min_time': options['min_time'],
+            'samples': options['samples'],
+            'cases': run_cases(cases, images, repeat=options['repeat'], min_time=options['min_time'],
+                               samples=options['samples']),
+        }
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output + '\n')
+        elif not options['check']:
+            self.stdout.write(output)
+
+        if options['save_baseline']:
+            baseline = self.read_baseline(options['baseline'], missing_ok=True) or {'cases': {}}
+            # cases not run keep their stored baseline
+            report['cases'] = {**baseline['cases'], **report['cases']}
+            os.makedirs(os.path.dirname(options['baseline']), exist_ok=True)
+            with open(options['baseline'], 'w') as baseline_file:
+                baseline_file.write(json.dumps(report, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Baseline of {len(cases)} cases saved to {options['baseline']}"))
+
+        if options['check']:
+            baseline = self.read_baseline(options['baseline'])
+            if baseline['environment'] != report['environment']:
+                self.stderr.write(f"Baseline was measured with {baseline['environment']}, "
+                                  f"this run with {report['environment']}")
+            regressions = compare(report['cases'], baseline['cases'], options['time_tolerance'],
+                                  options['memory_tolerance'], options['min_regression_ms'])
+            for regression in regressions:
+                self.stderr.write(regression)
+            if regressions:
+                raise CommandError(f'{len(regressions)} regressions against {options["baseline"]}')
+            self.stdout.write(self.style.SUCCESS(
+                f'No regressions in {len(cases)} cases, baseline noise {get_noise(baseline["cases"]):.0%}'))
+
+    def read_baseline(self, path, missing_ok=False):
+        if not path:
+            raise CommandError('No baseline file, set THUMBNAIL_BENCH_BASELINE or pass --baseline')
+        if missing_ok and not os.path.exists(path):
+            return None
+        try:
+            with open(path) as baseline_file:
+                return json.load(baseline_file)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Cannot read baseline {path}: {e}')
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from image_app import jobs
+from image_app.models import ExpirationLink, RevokedLink
+from image_app.reaper import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete expired expiring links and expired revocations of signed links'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Number of rows deleted per query')
+        parser.add_argument('--max-rate', type=float, default=0,
+                            help='Maximum number of rows deleted per second, 0 disables the limit')
+        parser.add_argument('--sleep', type=float, default=0, help='Seconds to pause after every chunk')
+        parser.add_argument('--schedule', type=int, metavar='SECONDS',
+                            help='Instead of purging now, queue a `run_jobs` job repeating every SECONDS')
+
+    def handle(self, *args, **options):
+        if options['schedule']:
+            if not jobs.schedule_repeating('purge_expired_links', options['schedule'],
+                                           chunk_size=options['chunk_size'], max_rate=options['max_rate']):
+                self.stdout.write('Purge job is already scheduled')
+                return
+            self.stdout.write(self.style.SUCCESS(f"Scheduled purge every {options['schedule']} seconds"))
+            return
+
+        for model in (ExpirationLink, RevokedLink):
+            name = model._meta.verbose_name_plural
+            deleted = purge_expired(
+                model,
+                chunk_size=options['chunk_size'],
+                max_rate=options['max_rate'],
+                sleep=options['sleep'],
+                progress=lambda total: self.stdout.write(f'Deleted {total} {name}'),
+            )
+            self.stdout.write(self.style.SUCCESS(f'Done: {deleted} {name} deleted'))
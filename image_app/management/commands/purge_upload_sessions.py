@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from image_app import jobs
+from image_app.reaper import purge_upload_sessions
+
+
+class Command(BaseCommand):
+    help = 'Delete resumable upload sessions that were abandoned and their partial files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=int, metavar='SECONDS',
+                            help='Delete sessions not updated for SECONDS, defaults to UPLOAD_SESSION_MAX_AGE')
+        parser.add_argument('--schedule', type=int, metavar='SECONDS',
+                            help='Instead of purging now, queue a `run_jobs` job repeating every SECONDS')
+
+    def handle(self, *args, **options):
+        if options['schedule']:
+            if not jobs.schedule_repeating('purge_upload_sessions', options['schedule'], max_age=options['max_age']):
+                self.stdout.write('Purge job is already scheduled')
+                return
+            self.stdout.write(self.style.SUCCESS(f"Scheduled purge every {options['schedule']} seconds"))
+            return
+
+        deleted = purge_upload_sessions(max_age=options['max_age'])
+        self.stdout.write(self.style.SUCCESS(f'Done: {deleted} upload sessions deleted'))
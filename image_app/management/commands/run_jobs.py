@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from image_app import jobs
+
+
+class Command(BaseCommand):
+    help = 'Process queued background jobs such as thumbnail rendering of asynchronous uploads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10, help='Number of jobs claimed per poll')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        processed = 0
+        while True:
+            count = jobs.run_pending(options['batch_size'])
+            processed += count
+            if not count:
+                if options['burst']:
+                    break
+                time.sleep(options['sleep'])
+        self.stdout.write(f'Processed {processed} jobs')
@@ -0,0 +1,127 @@
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Prefetch
+
+from image_app.models import Image, Thumbnail
+from image_app.thumbnails import get_source_format, missing_thumbnail_specs, render_original, store_thumbnails, \
+    thumbnail_names, thumbnail_specs
+
+QUALITY_NAME_PATTERN = re.compile(r'_q\d+\.[a-z]+$')
+
+
+def plan_image(image):
+    """
+    Return (missing (height, format) pairs, obsolete thumbnails) of an image compared to its owner's account tier.
+
+    A thumbnail stored with another quality than the tier plan's quality of its height is replaced.
+    """
+    account_tier = image.user.account_tier if image.user else None
+    plan = account_tier.get_plan() if account_tier else None
+    wanted = thumbnail_names(image, thumbnail_specs(image, plan), plan) if plan else {}
+    source_format = get_source_format(image)
+
+    def is_wanted(thumbnail):
+        name = wanted.get((thumbnail.height, thumbnail.format or source_format))
+        # thumbnails stored before the tier set a quality keep their name
+        return name is not None and (thumbnail.thumbnail.name == name or (
+            plan.quality(thumbnail.height) is None and not QUALITY_NAME_PATTERN.search(thumbnail.thumbnail.name)))
+
+    kept = [thumbnail for thumbnail in image.thumbnails.all() if is_wanted(thumbnail)]
+    existing = {(thumbnail.height, thumbnail.format or source_format) for thumbnail in kept}
+    missing = [spec for spec in wanted if spec not in existing]
+    obsolete = [thumbnail for thumbnail in image.thumbnails.all()
+                if thumbnail.height is not None and thumbnail not in kept]
+    return missing, obsolete, plan
+
+
+def render_missing(image, specs, plan):
+    # images are already rendered in parallel by the command's threads, the engine's process pool is not used
+    return render_original(image, specs, workers=0, plan=plan) if specs else []
+
+
+class Command(BaseCommand):
+    help = ('Create missing and delete obsolete thumbnails after account tier sizes or formats changed. '
+            'Progress is checkpointed, an interrupted run continues where it stopped.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Number of images processed per batch')
+        parser.add_argument('--workers', type=int, default=2, help='Number of images rendered in parallel')
+        parser.add_argument('--max-rate', type=float, default=0,
+                            help='Maximum number of images processed per second, 0 disables the limit')
+        parser.add_argument('--sleep', type=float, default=0, help='Seconds to pause after every batch')
+        parser.add_argument('--checkpoint', default=os.path.join(settings.BASE_DIR, '.sync_thumbnails.json'),
+                            help='File storing the progress of the run')
+        parser.add_argument('--reset', action='store_true', help='Ignore the checkpoint and start from the first image')
+        parser.add_argument('--dry-run', action='store_true', help='Report changes without applying them')
+
+    def read_checkpoint(self, path, reset):
+        if reset or not os.path.exists(path):
+            return {'last_id': 0, 'created': 0, 'deleted': 0}
+        with open(path) as checkpoint:
+            return json.load(checkpoint)
+
+    def write_checkpoint(self, path, progress):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as checkpoint:
+            json.dump(progress, checkpoint)
+        os.replace(tmp_path, path)
+
+    def handle(self, *args, **options):
+        progress = self.read_checkpoint(options['checkpoint'], options['reset'])
+        if progress['last_id']:
+            self.stdout.write(f"Resuming after image {progress['last_id']}")
+        thumbnails = Prefetch('thumbnails',
+                              queryset=Thumbnail.objects.only('id', 'image_id', 'height', 'format', 'thumbnail'))
+        queryset = (Image.objects.filter(status=Image.Status.READY)
+                    .select_related('user__account_tier').prefetch_related(thumbnails).order_by('pk'))
+
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+            while True:
+                started = time.monotonic()
+                batch = list(queryset.filter(pk__gt=progress['last_id'])[:options['batch_size']])
+                if not batch:
+                    break
+                plans = [(image, *plan_image(image)) for image in batch]
+                plans = [(image, missing, obsolete, plan) for image, missing, obsolete, plan in plans
+                         if missing or obsolete]
+                if not options['dry_run']:
+                    self.apply(executor, plans)
+                progress['last_id'] = batch[-1].pk
+                progress['created'] += sum(len(missing) for _, missing, _, _ in plans)
+                progress['deleted'] += sum(len(obsolete) for _, _, obsolete, _ in plans)
+                if not options['dry_run']:
+                    self.write_checkpoint(options['checkpoint'], progress)
+                self.stdout.write(f"Processed images up to {progress['last_id']}: "
+                                  f"{progress['created']} created, {progress['deleted']} deleted")
+                self.throttle(started, len(batch), options)
+
+        if not options['dry_run'] and os.path.exists(options['checkpoint']):
+            os.remove(options['checkpoint'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {progress['created']} thumbnails created, {progress['deleted']} deleted"))
+
+    def apply(self, executor, plans):
+        # thumbnails stored for an identical original are reused, only the others are rendered
+        unstored = [missing_thumbnail_specs(image, missing, plan) if missing else []
+                    for image, missing, _, plan in plans]
+        rendered = executor.map(render_missing, [image for image, _, _, _ in plans], unstored,
+                                [plan for _, _, _, plan in plans])
+        for (image, missing, obsolete, plan), rendered_thumbnails in zip(plans, rendered):
+            # files of deleted thumbnails are removed with their last blob reference
+            with transaction.atomic():
+                store_thumbnails(image, missing, rendered_thumbnails, plan)
+                Thumbnail.objects.filter(pk__in=[thumbnail.pk for thumbnail in obsolete]).delete()
+
+    def throttle(self, started, count, options):
+        delay = options['sleep']
+        if options['max_rate']:
+            delay = max(delay, count / options['max_rate'] - (time.monotonic() - started))
+        if delay > 0:
+            time.sleep(delay)
@@ -0,0 +1,35 @@
+import hashlib
+
+from PIL import Image as img
+
+
+def read_metadata(file):
+    """
+    Return content type, byte size, dimensions and SHA-256 checksum of an image file.
+
+    Only the image header is parsed, the pixels are not decoded. A checksum computed while the file was
+    uploaded, see ImageUploadHandler, is used instead of reading the whole file. The file is rewound afterwards.
+    """
+    checksum = getattr(file, 'checksum', None)
+    if checksum:
+        file_size = file.size
+    else:
+        digest = hashlib.sha256()
+        file_size = 0
+        file.seek(0)
+        for chunk in iter(lambda: file.read(64 * 1024), b''):
+            digest.update(chunk)
+            file_size += len(chunk)
+        checksum = digest.hexdigest()
+    file.seek(0)
+    with img.open(file) as im:
+        width, height = im.size
+        content_type = img.MIME.get(im.format, 'application/octet-stream')
+    file.seek(0)
+    return {
+        'content_type': content_type,
+        'file_size': file_size,
+        'width': width,
+        'height': height,
+        'checksum': checksum,
+    }
@@ -0,0 +1,31 @@
+# Generated by Django 4.2 on 2026-10-18 15:24
+
+import re
+
+from django.db import migrations, models
+
+THUMBNAIL_NAME_PATTERN = re.compile(r'_thumbnail_(\d+)\.[^.]+$')
+
+
+def set_thumbnail_heights(apps, schema_editor):
+    Thumbnail = apps.get_model('image_app', 'Thumbnail')
+    for thumbnail in Thumbnail.objects.filter(height__isnull=True).only('id', 'name').iterator():
+        match = THUMBNAIL_NAME_PATTERN.search(thumbnail.name)
+        if match:
+            Thumbnail.objects.filter(pk=thumbnail.pk).update(height=int(match.group(1)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('image_app', '0004_image_status_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thumbnail',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(set_thumbnail_heights, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-18 15:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('image_app', '0005_thumbnail_height'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['user', 'id'], name='image_user_id_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2 on 2026-10-18 15:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('image_app', '0007_image_metadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevokedLink',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=32, unique=True)),
+                ('expiration_time', models.DateTimeField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
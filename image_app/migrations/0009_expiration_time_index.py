@@ -0,0 +1,23 @@
+# Generated by Django 4.2 on 2026-10-18 15:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('image_app', '0008_revokedlink'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='expirationlink',
+            name='expiration_time',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='revokedlink',
+            name='expiration_time',
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
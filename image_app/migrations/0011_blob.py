@@ -0,0 +1,35 @@
+# Generated by Django 4.2 on 2026-10-18 15:47
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_references(apps, schema_editor):
+    Blob = apps.get_model('image_app', 'Blob')
+    Image = apps.get_model('image_app', 'Image')
+    Thumbnail = apps.get_model('image_app', 'Thumbnail')
+    references = {}
+    for model, field in ((Image, 'original_image'), (Thumbnail, 'thumbnail')):
+        for row in model.objects.exclude(**{field: ''}).values(field).annotate(count=Count('id')).order_by():
+            references[row[field]] = references.get(row[field], 0) + row['count']
+    Blob.objects.bulk_create([Blob(name=name, references=count) for name, count in references.items()],
+                             batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('image_app', '0010_uploadsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('references', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
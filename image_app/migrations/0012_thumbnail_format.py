@@ -0,0 +1,27 @@
+# Generated by Django 4.2 on 2026-10-18 15:55
+
+from django.db import migrations, models
+
+IMAGE_FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.webp': 'WEBP', '.avif': 'AVIF'}
+
+
+def set_thumbnail_formats(apps, schema_editor):
+    Thumbnail = apps.get_model('image_app', 'Thumbnail')
+    for extension, image_format in IMAGE_FORMATS.items():
+        Thumbnail.objects.filter(format='', thumbnail__iendswith=extension).update(format=image_format)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('image_app', '0011_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thumbnail',
+            name='format',
+            field=models.CharField(blank=True, max_length=8),
+        ),
+        migrations.RunPython(set_thumbnail_formats, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,7 @@
+import os
 import uuid
 
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 
@@ -7,23 +9,119 @@ from user_app.models import User
 
 
 class Image(models.Model):
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        PROCESSING = 'processing', 'Processing'
+        READY = 'ready', 'Ready'
+        FAILED = 'failed', 'Failed'
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='user', null=True)
     original_image = models.ImageField(upload_to='images/original/')
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.READY)
+    content_type = models.CharField(max_length=64, blank=True)
+    file_size = models.PositiveBigIntegerField(null=True, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    checksum = models.CharField(max_length=64, blank=True, db_index=True)
 
     class Meta:
         ordering = ('id',)
+        indexes = [
+            models.Index(fields=['user', 'id'], name='image_user_id_idx'),
+        ]
 
 
 class Thumbnail(models.Model):
     name = models.CharField(max_length=255, null=False, blank=False)
     image = models.ForeignKey(Image, on_delete=models.CASCADE, related_name='thumbnails', null=False)
     thumbnail = models.ImageField(upload_to='images/thumbnails/')
+    height = models.PositiveIntegerField(null=True, blank=True)
+    format = models.CharField(max_length=8, blank=True)
 
 
 class ExpirationLink(models.Model):
     image = models.ForeignKey(Image, on_delete=models.CASCADE, related_name='img')
     token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False, db_index=True)
-    expiration_time = models.DateTimeField()
+    expiration_time = models.DateTimeField(db_index=True)
 
     def is_valid(self):
         return self.expiration_time > timezone.now()
+
+
+class RevokedLink(models.Model):
+    """
+    Revoked signed link, kept until the link would have expired anyway
+    """
+    digest = models.CharField(max_length=32, unique=True)
+    expiration_time = models.DateTimeField(db_index=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+
+class Job(models.Model):
+    """
+    Unit of background work stored in the database and drained by the `run_jobs` management command.
+    """
+    class Status(models.TextChoices):
+        QUEUED = 'queued', 'Queued'
+        RUNNING = 'running', 'Running'
+        DONE = 'done', 'Done'
+        FAILED = 'failed', 'Failed'
+
+    kind = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ('run_after', 'id')
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} #{self.pk} ({self.status})'
+
+
+class UploadSession(models.Model):
+    """
+    Resumable upload of an original image, its chunks are written to a file in UPLOAD_SESSION_ROOT.
+
+    Direct uploads are sent by the client straight to the media storage under `storage_name` instead.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    file_name = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    direct = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True, db_index=True)
+
+    @property
+    def path(self):
+        return os.path.join(settings.UPLOAD_SESSION_ROOT, f'{self.pk.hex}.part')
+
+    @property
+    def storage_name(self):
+        return f'{getattr(settings, "S3_UPLOAD_PREFIX", "uploads/")}{self.pk.hex}'
+
+    def delete_file(self):
+        if self.direct:
+            Image.original_image.field.storage.delete(self.storage_name)
+            return
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class Blob(models.Model):
+    """
+    Stored file shared by every image or thumbnail with the same content, deleted with its last reference
+    """
+    name = models.CharField(max_length=255, unique=True)
+    references = models.PositiveIntegerField(default=0)
@@ -0,0 +1,60 @@
+from image_app.thumbnail_engine import VARIANT_FORMATS, is_supported
+
+FORMAT_MEDIA_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'WEBP': 'image/webp',
+    'AVIF': 'image/avif',
+}
+
+
+def parse_accept(header):
+    """
+    Return {media type: quality} of an Accept header, malformed qualities count as 0
+    """
+    accepted = {}
+    for media_range in (header or '').split(','):
+        media_type, *params = [part.strip() for part in media_range.split(';')]
+        if not media_type:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[media_type.lower()] = max(quality, accepted.get(media_type.lower(), 0.0))
+    return accepted
+
+
+def choose_format(request, variant_formats=VARIANT_FORMATS):
+    """
+    Return the variant format the Accept header of the request prefers or None for the original's format.
+
+    Variants are only chosen when their media type is accepted explicitly, `*/*` and `image/*` are sent by
+    clients that do not decode modern formats. Ties are resolved by the order of `variant_formats` and formats
+    Pillow cannot encode are skipped.
+    """
+    accepted = parse_accept(request.headers.get('Accept'))
+    best, best_quality = None, 0.0
+    for image_format in variant_formats:
+        quality = accepted.get(FORMAT_MEDIA_TYPES.get(image_format), 0.0)
+        if quality > best_quality and is_supported(image_format):
+            best, best_quality = image_format, quality
+    return best
+
+
+def select_thumbnails(thumbnails, image_format, source_format):
+    """
+    Return one thumbnail per height, in `image_format` when it was stored and in `source_format` otherwise
+    """
+    selected = {}
+    for thumbnail in thumbnails:
+        thumbnail_format = thumbnail.format or source_format
+        current = selected.get(thumbnail.height)
+        if thumbnail_format == image_format or current is None or (
+                thumbnail_format == source_format and (current.format or source_format) != image_format):
+            selected[thumbnail.height] = thumbnail
+    return list(selected.values())
@@ -0,0 +1,67 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from image_app.models import ExpirationLink, RevokedLink, UploadSession
+
+
+def purge_expired(model, chunk_size=1000, max_rate=0, sleep=0, progress=None):
+    """
+    Delete rows of the model whose `expiration_time` passed, in chunks of at most `chunk_size` rows.
+
+    Each chunk is selected by a range scan of the `expiration_time` index. `max_rate` limits deleted rows
+    per second and `sleep` adds a pause after every chunk, so the purge does not compete with live traffic.
+    `progress` is called with the running total after every chunk. Returns the number of deleted rows.
+    """
+    now = timezone.now()
+    total = 0
+    while True:
+        started = time.monotonic()
+        ids = list(model.objects.filter(expiration_time__lte=now)
+                   .order_by('expiration_time').values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            break
+        model.objects.filter(pk__in=ids).delete()
+        total += len(ids)
+        if progress is not None:
+            progress(total)
+        if len(ids) < chunk_size:
+            break
+        delay = sleep
+        if max_rate:
+            delay = max(delay, len(ids) / max_rate - (time.monotonic() - started))
+        if delay > 0:
+            time.sleep(delay)
+    return total
+
+
+def purge_expired_links(**options):
+    """
+    Purge expired ExpirationLink rows and revocations of signed links that expired, returns both counts
+    """
+    return purge_expired(ExpirationLink, **options), purge_expired(RevokedLink, **options)
+
+
+def purge_upload_sessions(max_age=None, chunk_size=1000):
+    """
+    Delete upload sessions not updated for `max_age` seconds and their files, returns the number of sessions.
+
+    `max_age` defaults to UPLOAD_SESSION_MAX_AGE.
+    """
+    if max_age is None:
+        max_age = getattr(settings, 'UPLOAD_SESSION_MAX_AGE', 24 * 60 * 60)
+    stale_before = timezone.now() - timedelta(seconds=max_age)
+    total = 0
+    while True:
+        sessions = list(UploadSession.objects.filter(updated__lt=stale_before).order_by('updated')[:chunk_size])
+        if not sessions:
+            break
+        for session in sessions:
+            session.delete_file()
+        UploadSession.objects.filter(pk__in=[session.pk for session in sessions]).delete()
+        total += len(sessions)
+        if len(sessions) < chunk_size:
+            break
+    return total
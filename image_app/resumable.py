@@ -0,0 +1,134 @@
+import os
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.utils import timezone
+
+from image_app.models import UploadSession
+from image_app.upload_handlers import ImageSniffer, normalize_file_name
+
+READ_SIZE = 64 * 1024
+
+
+class UploadSessionError(Exception):
+    pass
+
+
+class ChunkConflict(UploadSessionError):
+    pass
+
+
+class SessionUploadedFile(UploadedFile):
+    """
+    Assembled file of an upload session, storages supporting it move the file instead of copying it
+    """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def get_chunk_size():
+    return getattr(settings, 'UPLOAD_CHUNK_SIZE', 1024 * 1024)
+
+
+def write_chunk(session, index, stream, length):
+    """
+    Write chunk number `index` read from the stream at its offset in the session file.
+
+    Chunks have UPLOAD_CHUNK_SIZE bytes except the last one and are accepted in order, a chunk that was
+    already received is ignored so clients can safely retry. The first chunk is checked by ImageSniffer
+    to reject files that are not images before the rest is uploaded. The data is copied to disk in small
+    reads, a chunk is never held in memory.
+    """
+    chunk_size = get_chunk_size()
+    offset = index * chunk_size
+    if offset >= session.size:
+        raise UploadSessionError('Chunk index out of range')
+    if offset < session.received:
+        return
+    if offset > session.received:
+        raise ChunkConflict(f'Expected chunk {session.received // chunk_size}')
+    expected_length = min(chunk_size, session.size - offset)
+    if length != expected_length:
+        raise UploadSessionError(f'Chunk {index} must be {expected_length} bytes')
+
+    sniffer = ImageSniffer() if index == 0 else None
+    os.makedirs(os.path.dirname(session.path), exist_ok=True)
+    with open(session.path, 'r+b' if offset else 'wb') as file:
+        file.seek(offset)
+        remaining = length
+        while remaining > 0:
+            data = stream.read(min(READ_SIZE, remaining))
+            if not data:
+                file.truncate(offset)
+                raise UploadSessionError('Chunk incomplete')
+            if sniffer is not None and not sniffer.done:
+                error = sniffer.feed(data)
+                if error is not None:
+                    file.truncate(offset)
+                    raise UploadSessionError(error)
+            file.write(data)
+            remaining -= len(data)
+        file.truncate()
+
+    # a retried chunk racing with the original request carries the same bytes, only one of them counts,
+    # update() skips auto_now, `updated` is the last activity of the session the purge looks at
+    UploadSession.objects.filter(pk=session.pk, received=offset).update(received=offset + length,
+                                                                        updated=timezone.now())
+    session.received = offset + length
+
+
+def _sniff(file):
+    """
+    Return the content type of an image file opened for reading, the file is rewound
+    """
+    sniffer = ImageSniffer()
+    for data in iter(lambda: file.read(READ_SIZE), b''):
+        error = sniffer.feed(data)
+        if error is not None or sniffer.done:
+            break
+    else:
+        error = sniffer.complete()
+    if error is not None:
+        raise UploadSessionError(error)
+    file.seek(0)
+    return sniffer.content_type
+
+
+def open_upload(session):
+    """
+    Return the assembled file of a complete session as an UploadedFile for ImageSerializer
+    """
+    if session.received != session.size:
+        raise ChunkConflict(f'Received {session.received} of {session.size} bytes')
+    file = open(session.path, 'rb')
+    try:
+        content_type = _sniff(file)
+    except Exception:
+        file.close()
+        raise
+    return SessionUploadedFile(file, normalize_file_name(session.file_name, content_type), content_type, session.size)
+
+
+def open_direct_upload(session, storage):
+    """
+    Return the file a client uploaded to the storage for a direct upload session as an UploadedFile.
+
+    The file is downloaded once to render the thumbnails, its `storage_name` lets the original be copied
+    inside the storage instead of being uploaded again.
+    """
+    try:
+        size = storage.size(session.storage_name)
+    except FileNotFoundError:
+        raise ChunkConflict('File not uploaded yet')
+    if size != session.size:
+        raise UploadSessionError(f'Uploaded {size} of {session.size} bytes')
+    file = storage.open(session.storage_name, 'rb')
+    try:
+        content_type = _sniff(file)
+    except Exception:
+        file.close()
+        raise
+    upload = UploadedFile(file.file, normalize_file_name(session.file_name, content_type), content_type, size)
+    upload.storage_name = session.storage_name
+    return upload
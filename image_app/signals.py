@@ -0,0 +1,38 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from image_app import blobs, list_cache
+from image_app.link_cache import get_token_cache
+from image_app.models import ExpirationLink, Image, Thumbnail
+
+
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Image)
+def invalidate_image_list(sender, instance, **kwargs):
+    list_cache.bump_version(instance.user_id)
+
+
+@receiver(post_save, sender=Thumbnail)
+@receiver(post_delete, sender=Thumbnail)
+def invalidate_thumbnail_image_list(sender, instance, **kwargs):
+    if Thumbnail.image.is_cached(instance):
+        user_id = instance.image.user_id
+    else:
+        user_id = Image.objects.filter(pk=instance.image_id).values_list('user_id', flat=True).first()
+    list_cache.bump_version(user_id)
+
+
+@receiver(post_save, sender=ExpirationLink)
+@receiver(post_delete, sender=ExpirationLink)
+def invalidate_cached_link(sender, instance, **kwargs):
+    get_token_cache().invalidate(instance.token)
+
+
+@receiver(post_delete, sender=Image)
+def release_original(sender, instance, **kwargs):
+    blobs.release(Image.original_image.field.storage, [instance.original_image.name])
+
+
+@receiver(post_delete, sender=Thumbnail)
+def release_thumbnail(sender, instance, **kwargs):
+    blobs.release(Thumbnail.thumbnail.field.storage, [instance.thumbnail.name])
@@ -0,0 +1,81 @@
+import hashlib
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+from image_app.models import RevokedLink
+
+SALT = 'image_app.signed_link'
+
+SignedLink = namedtuple('SignedLink', ['image_id', 'name', 'content_type', 'expiration_time', 'digest'])
+
+
+def make_token(image, expiration_time):
+    """
+    Return a signed token granting access to the original image until `expiration_time`.
+
+    The token carries everything needed to deliver the file, so it is verified without database access.
+    """
+    payload = [image.pk, int(expiration_time.timestamp()), image.original_image.name, image.content_type]
+    return signing.dumps(payload, salt=SALT, compress=True)
+
+
+def load_token(token):
+    """
+    Verify the token signature and return its SignedLink, raises signing.BadSignature for invalid tokens
+    """
+    image_id, expiration_time, name, content_type = signing.loads(token, salt=SALT)
+    digest = hashlib.sha256(token.rsplit(':', 1)[-1].encode()).hexdigest()[:32]
+    return SignedLink(image_id, name, content_type,
+                      datetime.fromtimestamp(expiration_time, tz=dt_timezone.utc), digest)
+
+
+class RevocationSet:
+    """
+    In-memory set of revoked link digests reloaded from the database every `refresh_interval` seconds
+    """
+
+    def __init__(self, refresh_interval):
+        self.refresh_interval = refresh_interval
+        self._digests = frozenset()
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        digests = RevokedLink.objects.filter(expiration_time__gt=timezone.now()).values_list('digest', flat=True)
+        self._digests = frozenset(bytes.fromhex(digest) for digest in digests)
+        self._loaded_at = time.monotonic()
+
+    def __contains__(self, digest):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_interval:
+            with self._lock:
+                if self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_interval:
+                    self.refresh()
+        return bytes.fromhex(digest) in self._digests
+
+    def add(self, digest):
+        with self._lock:
+            self._digests = self._digests | {bytes.fromhex(digest)}
+
+
+_revocations = None
+
+
+def get_revocations():
+    global _revocations
+    if _revocations is None:
+        _revocations = RevocationSet(getattr(settings, 'SIGNED_LINK_REVOCATION_REFRESH', 60))
+    return _revocations
+
+
+def revoke(link):
+    """
+    Revoke a loaded SignedLink in the database and in the revocation set of this process
+    """
+    RevokedLink.objects.get_or_create(digest=link.digest, defaults={'expiration_time': link.expiration_time})
+    get_revocations().add(link.digest)
@@ -0,0 +1,150 @@
+import mimetypes
+import tempfile
+from urllib.parse import quote
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import Storage
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import cached_property
+
+NOT_FOUND_CODES = ('404', 'NoSuchKey', 'NotFound')
+
+
+@deconstructible
+class S3Storage(Storage):
+    """
+    Storage of media files in a bucket of an S3 compatible object store (AWS S3, MinIO, ...).
+
+    Files over S3_MULTIPART_THRESHOLD bytes are uploaded, downloaded and copied in parts of
+    S3_MULTIPART_CHUNK_SIZE bytes, S3_MAX_CONCURRENCY parts at a time. Names are stored unchanged, existing
+    objects are overwritten, which is safe for the content addressed names of originals and thumbnails.
+    `url` returns presigned GET URLs valid for S3_PRESIGNED_EXPIRY seconds unless S3_QUERYSTRING_AUTH
+    is disabled for public buckets.
+    """
+
+    def __init__(self, bucket=None, endpoint_url=None, region=None):
+        self.bucket = bucket or settings.S3_BUCKET
+        self.endpoint_url = endpoint_url or getattr(settings, 'S3_ENDPOINT_URL', None)
+        self.region = region or getattr(settings, 'S3_REGION', None)
+
+    @cached_property
+    def client(self):
+        # boto3 clients are thread safe, one is shared by the transfer threads and request threads
+        return boto3.session.Session().client(
+            's3',
+            endpoint_url=self.endpoint_url,
+            region_name=self.region,
+            aws_access_key_id=getattr(settings, 'S3_ACCESS_KEY_ID', None) or None,
+            aws_secret_access_key=getattr(settings, 'S3_SECRET_ACCESS_KEY', None) or None,
+            config=Config(signature_version='s3v4', max_pool_connections=self.max_concurrency * 2),
+        )
+
+    @property
+    def max_concurrency(self):
+        return getattr(settings, 'S3_MAX_CONCURRENCY', 10)
+
+    @cached_property
+    def transfer_config(self):
+        chunk_size = getattr(settings, 'S3_MULTIPART_CHUNK_SIZE', 8 * 1024 * 1024)
+        return TransferConfig(
+            multipart_threshold=getattr(settings, 'S3_MULTIPART_THRESHOLD', 8 * 1024 * 1024),
+            multipart_chunksize=chunk_size,
+            max_concurrency=self.max_concurrency,
+            io_chunksize=min(chunk_size, 256 * 1024),
+        )
+
+    def _head(self, name):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=name)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in NOT_FOUND_CODES:
+                raise FileNotFoundError(name) from e
+            raise
+
+    def _open(self, name, mode='rb'):
+        if 'w' in mode or 'a' in mode or '+' in mode:
+            raise ValueError('S3Storage files can only be opened for reading')
+        file = tempfile.SpooledTemporaryFile(max_size=getattr(settings, 'FILE_UPLOAD_MAX_MEMORY_SIZE', 2621440))
+        try:
+            self.client.download_fileobj(self.bucket, name, file, Config=self.transfer_config)
+        except ClientError as e:
+            file.close()
+            if e.response.get('Error', {}).get('Code') in NOT_FOUND_CODES:
+                raise FileNotFoundError(name) from e
+            raise
+        file.seek(0)
+        return File(file, name=name)
+
+    def _save(self, name, content):
+        extra_args = {'ContentType': getattr(content, 'content_type', None)
+                      or mimetypes.guess_type(name)[0] or 'application/octet-stream'}
+        if hasattr(content, 'temporary_file_path'):
+            # parts are read from the file by the transfer threads in parallel
+            self.client.upload_file(content.temporary_file_path(), self.bucket, name,
+                                    ExtraArgs=extra_args, Config=self.transfer_config)
+        else:
+            content.seek(0)
+            self.client.upload_fileobj(content, self.bucket, name, ExtraArgs=extra_args, Config=self.transfer_config)
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        # objects are overwritten instead of being saved under another name
+        return self.generate_filename(name)
+
+    def copy(self, source_name, name):
+        """
+        Copy an object inside the bucket, large objects are copied in parallel parts by the store itself
+        """
+        self.client.copy({'Bucket': self.bucket, 'Key': source_name}, self.bucket, name, Config=self.transfer_config)
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=name)
+
+    def exists(self, name):
+        try:
+            self._head(name)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def size(self, name):
+        return self._head(name)['ContentLength']
+
+    def get_modified_time(self, name):
+        return self._head(name)['LastModified']
+
+    @property
+    def url_expiry(self):
+        """
+        Return the number of seconds URLs returned by `url` stay valid, None when they do not expire
+        """
+        if not getattr(settings, 'S3_QUERYSTRING_AUTH', True):
+            return None
+        return int(getattr(settings, 'S3_PRESIGNED_EXPIRY', 3600))
+
+    def url(self, name, expire=None):
+        if not getattr(settings, 'S3_QUERYSTRING_AUTH', True):
+            if self.endpoint_url:
+                return f'{self.endpoint_url.rstrip("/")}/{self.bucket}/{quote(name)}'
+            return f'https://{self.bucket}.s3.amazonaws.com/{quote(name)}'
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': name},
+            ExpiresIn=int(expire or self.url_expiry),
+        )
+
+    def presigned_post(self, name, size, expire=None):
+        """
+        Return the `url` and form `fields` of a presigned POST uploading exactly `size` bytes to `name`
+        """
+        return self.client.generate_presigned_post(
+            self.bucket,
+            name,
+            Conditions=[['content-length-range', size, size]],
+            ExpiresIn=int(expire or getattr(settings, 'S3_PRESIGNED_EXPIRY', 3600)),
+        )
@@ -0,0 +1,63 @@
+from django.db import transaction
+
+from image_app import list_cache
+from image_app.jobs import register, schedule_next
+from image_app.models import Image
+from image_app.reaper import purge_expired_links as purge, purge_upload_sessions as purge_sessions
+from image_app.thumbnails import create_thumbnails
+
+
+def set_image_status(image_id, image_status):
+    # queryset updates skip post_save, the list cache of the owner is invalidated explicitly
+    Image.objects.filter(pk=image_id).update(status=image_status)
+    list_cache.bump_version(Image.objects.filter(pk=image_id).values_list('user_id', flat=True).first())
+
+
+def mark_image_failed(image_id):
+    set_image_status(image_id, Image.Status.FAILED)
+
+
+@register('process_image', on_failure=mark_image_failed)
+def process_image(image_id):
+    """
+    Render thumbnails of an image uploaded in asynchronous mode
+    """
+    try:
+        image_obj = Image.objects.select_related('user__account_tier').get(pk=image_id)
+    except Image.DoesNotExist:
+        return
+    set_image_status(image_id, Image.Status.PROCESSING)
+    with transaction.atomic():
+        image_obj.thumbnails.all().delete()
+        create_thumbnails(image_obj, image_obj.user.account_tier.get_plan())
+        set_image_status(image_id, Image.Status.READY)
+
+
+def schedule_purge_expired_links(chunk_size=1000, max_rate=0, interval=None):
+    schedule_next('purge_expired_links', interval, chunk_size=chunk_size, max_rate=max_rate)
+
+
+@register('purge_expired_links', on_failure=schedule_purge_expired_links)
+def purge_expired_links(chunk_size=1000, max_rate=0, interval=None):
+    """
+    Purge expired links, with `interval` the job schedules its next run that many seconds later.
+
+    A failed run is retried by the job queue first, the next run is only scheduled after the last attempt so
+    retries do not start additional repeating jobs.
+    """
+    purge(chunk_size=chunk_size, max_rate=max_rate)
+    schedule_purge_expired_links(chunk_size=chunk_size, max_rate=max_rate, interval=interval)
+
+
+def schedule_purge_upload_sessions(max_age=None, interval=None):
+    schedule_next('purge_upload_sessions', interval, max_age=max_age)
+
+
+@register('purge_upload_sessions', on_failure=schedule_purge_upload_sessions)
+def purge_upload_sessions(max_age=None, interval=None):
+    """
+    Remove stale upload sessions, with `interval` the job schedules its next run that many seconds later,
+    after the last attempt of a failing run like `purge_expired_links`
+    """
+    purge_sessions(max_age=max_age)
+    schedule_purge_upload_sessions(max_age=max_age, interval=interval)
@@ -1,19 +1,49 @@
 import io
+import json
+import os
+import shutil
+import tempfile
 import uuid
 from datetime import timedelta
+from unittest import mock, skipUnless
 
-from PIL import Image as img
+from PIL import Image as img, ImageChops, ImageStat
 
+try:
+    import moto
+except ImportError:
+    moto = None
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
 from django.utils import timezone
-from rest_framework.test import APITestCase, APIClient
+from rest_framework.test import APITestCase
 from rest_framework import status
 from django.core.files.uploadedfile import SimpleUploadedFile, InMemoryUploadedFile
+from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from user_app.models import AccountTier
-from .models import Image, ExpirationLink
+from core.throttling import TokenBucketThrottle
+from core.testing import QueryBudgetAPIClient, QueryBudgetExceeded, create_tier, get_views_without_query_budget, \
+    set_thumbnail_sizes
+from user_app.models import ThumbnailSize
+from user_app.tiers import SizeRule, TierPlan, get_plan_cache
+from . import blobs, jobs, negotiation, signed_links, thumbnail_engine
+from .api import views
+from .benchmark import SCENARIOS, LoadBenchmark, generate_image, percentile
+from .link_cache import MISSING, CachedLink, TokenCache, get_token_cache
+from .thumbnail_bench import Source, Variant, compare, get_cases, get_noise, run_case
+from .thumbnail_cache import ThumbnailCache
+from .upload_handlers import ImageUploadHandler
+from .thumbnails import create_thumbnails, thumbnail_specs
+from .models import Blob, Image, ExpirationLink, Job, RevokedLink, Thumbnail, UploadSession
 
 UPLOAD_IMAGE_URL = reverse('image_create')
 LIST_IMAGE_URL = reverse('image_list')
@@ -29,31 +59,42 @@ def generate_photo_file():
     return uploaded_file
 
 
+def generate_detailed_image(size, image_format='JPEG', mode='RGB'):
+    width, height = size
+    detail = img.effect_mandelbrot(size, (-2.0, -1.25, 0.75, 1.25), 100)
+    gradient = img.linear_gradient('L').resize(size)
+    image = img.merge('RGB', (detail, gradient, gradient.transpose(img.Transpose.FLIP_LEFT_RIGHT)))
+    if mode == 'RGBA':
+        image.putalpha(gradient)
+    file = io.BytesIO()
+    image.save(file, image_format, quality=95)
+    file.seek(0)
+    return file
+
+
 class ImageUploadViewTest(APITestCase):
 
     def setUp(self):
+        cache.clear()
         User = get_user_model()
-        self.basic = AccountTier.objects.create(name='Basic',
-                                                thumbnail_size='200',
-                                                original_link=False,
-                                                expiring_link=False
-                                                )
-        self.premium = AccountTier.objects.create(name='Premium',
-                                                  thumbnail_size='200,400',
-                                                  original_link=True,
-                                                  expiring_link=False
-                                                  )
-        self.enterprise = AccountTier.objects.create(name='Enterprise',
-                                                     thumbnail_size='200,400',
-                                                     original_link=True,
-                                                     expiring_link=True
-                                                     )
+        self.basic = create_tier('Basic', [200],
+                                 original_link=False,
+                                 expiring_link=False
+                                 )
+        self.premium = create_tier('Premium', [200, 400],
+                                   original_link=True,
+                                   expiring_link=False
+                                   )
+        self.enterprise = create_tier('Enterprise', [200, 400],
+                                      original_link=True,
+                                      expiring_link=True
+                                      )
 
         self.user = User.objects.create_user(username='test',
                                              email='test@test.com',
                                              password='foo',
                                              account_tier=self.basic)
-        self.client = APIClient(enforce_csrf_checks=True)
+        self.client = QueryBudgetAPIClient(enforce_csrf_checks=True)
 
     def test_image_upload_valid_file(self):
         self.client.force_authenticate(user=self.user)
@@ -67,6 +108,60 @@ class ImageUploadViewTest(APITestCase):
         self.assertTrue(Image.objects.filter(user=self.user).exists())
         self.assertTrue(len(response.data['thumbnails']), 1)
         self.assertNotIn('original_link', response.data)
+        image = Image.objects.get(user=self.user)
+        self.assertEqual(image.content_type, 'image/png')
+        self.assertEqual((image.width, image.height), (100, 100))
+        self.assertEqual(image.file_size, image.original_image.size)
+        self.assertEqual(len(image.checksum), 64)
+
+    def test_image_upload_with_token_and_cold_plan(self):
+        set_thumbnail_sizes(self.enterprise, [200, 400], 'webp')
+        self.user.account_tier = self.enterprise
+        self.user.save()
+        get_plan_cache().clear()
+        # the user and its tier are loaded from the token and the plan is compiled within the view budget,
+        # the thumbnails of all sizes and formats are inserted at once
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        response = self.client.post(UPLOAD_IMAGE_URL, {'original_image': generate_photo_file()}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Thumbnail.objects.filter(image__user=self.user).count(), 4)
+
+    def test_original_not_served_from_media(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(UPLOAD_IMAGE_URL, {'original_image': generate_photo_file()}, format='multipart')
+        self.assertNotIn('original_image', response.data)
+        thumbnail_path = response.data['thumbnails'][0]['thumbnail'].split(settings.MEDIA_URL, 1)[1]
+        self.assertEqual(self.client.get(reverse('media', args=[thumbnail_path])).status_code, status.HTTP_200_OK)
+        # the original path derived from the thumbnail name is not public
+        checksum = os.path.basename(thumbnail_path).split('_')[0]
+        original_path = f'images/original/{checksum[:2]}/{checksum}.png'
+        response = self.client.get(reverse('media', args=[original_path]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        image = Image.objects.get(user=self.user)
+        # and the original is not stored under the checksum of its thumbnails
+        self.assertEqual(image.checksum, checksum)
+        self.assertNotIn(checksum, image.original_image.name)
+        response = self.client.get(reverse('image_original', args=[image.pk]))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_original_view(self):
+        self.user.account_tier = self.premium
+        self.user.save()
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(UPLOAD_IMAGE_URL, {'original_image': generate_photo_file()}, format='multipart')
+        image = Image.objects.get(user=self.user)
+        url = reverse('image_original', args=[image.pk])
+        self.assertEqual(response.data['original_image'], f'http://testserver{url}')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(b''.join(response.streaming_content)[:8], b'\x89PNG\r\n\x1a\n')
+
+        other = get_user_model().objects.create_user(username='other', email='other@test.com', password='foo',
+                                                     account_tier=self.premium)
+        self.client.force_authenticate(user=other)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
 
     def test_image_upload_invalid_file(self):
         self.client.force_authenticate(user=self.user)
@@ -77,6 +172,68 @@ class ImageUploadViewTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertFalse(Image.objects.filter(user=self.user).exists())
 
+    def test_rejected_upload_stops_reading(self):
+        def parse(files, **kwargs):
+            # the field after the files is only parsed when the body is read to its end
+            request = RequestFactory().post('/', {**files, 'after': 'x'})
+            handler = ImageUploadHandler(request, **kwargs)
+            request.upload_handlers = [handler]
+            return request, handler
+
+        text_file = SimpleUploadedFile('test.txt', b'not an image' * 1000)
+        request, handler = parse({'original_image': text_file})
+        self.assertNotIn('after', request.POST)
+        self.assertEqual([file.upload_error for file in handler.uploads], ['File type not allowed'])
+
+        # batches only skip the rejected file
+        text_file.seek(0)
+        request, handler = parse({'original_images': [text_file, generate_photo_file()]}, skip_rejected=True)
+        self.assertEqual(request.POST['after'], 'x')
+        self.assertEqual([file.upload_error for file in handler.uploads], ['File type not allowed', None])
+        self.assertEqual(request.FILES.getlist('original_images'), handler.uploads[1:])
+
+        with override_settings(UPLOAD_MAX_FILE_SIZE=1000):
+            large_file = SimpleUploadedFile('large.png', generate_photo_file().read() + b'\0' * 2000)
+            request, handler = parse({'original_images': large_file}, skip_rejected=True)
+            self.assertNotIn('after', request.POST)
+            self.assertEqual(handler.uploads[0].upload_error, 'File too large')
+
+    def test_image_upload_sniffs_content_type(self):
+        self.client.force_authenticate(user=self.user)
+        disguised_file = SimpleUploadedFile('photo.jpg', generate_photo_file().read(), content_type='image/jpeg')
+        response = self.client.post(UPLOAD_IMAGE_URL, {'original_image': disguised_file}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        image = Image.objects.get(user=self.user)
+        self.assertTrue(image.original_image.name.endswith('.png'))
+        self.assertEqual(image.content_type, 'image/png')
+
+        text_file = SimpleUploadedFile('photo.png', b'not_an_image_content', content_type='image/png')
+        response = self.client.post(UPLOAD_IMAGE_URL, {'original_image': text_file}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(str(response.data[0]), 'File type not allowed')
+
+    def test_image_upload_truncated_file(self):
+        self.client.force_authenticate(user=self.user)
+        truncated_file = SimpleUploadedFile('photo.png', generate_photo_file().read()[:20], content_type='image/png')
+        response = self.client.post(UPLOAD_IMAGE_URL, {'original_image': truncated_file}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(str(response.data[0]), 'Incorrect file')
+
+    @override_settings(UPLOAD_MAX_PIXELS=5000)
+    def test_image_upload_pixel_limit(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(UPLOAD_IMAGE_URL, {'original_image': generate_photo_file()}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(str(response.data[0]), 'Image dimensions too large')
+        self.assertFalse(Image.objects.filter(user=self.user).exists())
+
+    @override_settings(UPLOAD_MAX_FILE_SIZE=100)
+    def test_image_upload_size_limit(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(UPLOAD_IMAGE_URL, {'original_image': generate_photo_file()}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(str(response.data[0]), 'File too large')
+
     def test_image_upload_no_file(self):
         self.client.force_authenticate(user=self.user)
         response = self.client.post(UPLOAD_IMAGE_URL, {}, format='multipart')
@@ -86,6 +243,37 @@ class ImageUploadViewTest(APITestCase):
         response = self.client.post(UPLOAD_IMAGE_URL, {}, format='multipart')
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+    def test_duplicate_upload_reuses_stored_files(self):
+        self.user.account_tier = self.premium
+        self.user.save()
+        self.client.force_authenticate(user=self.user)
+        content = generate_photo_file().read()
+        first = self.client.post(UPLOAD_IMAGE_URL, {'original_image': SimpleUploadedFile('a.png', content)},
+                                 format='multipart')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        with mock.patch('image_app.thumbnails.render_thumbnails') as render:
+            second = self.client.post(UPLOAD_IMAGE_URL, {'original_image': SimpleUploadedFile('b.png', content)},
+                                      format='multipart')
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        render.assert_not_called()
+
+        first_image, second_image = Image.objects.filter(user=self.user)
+        self.assertEqual(first_image.original_image.name, second_image.original_image.name)
+        self.assertEqual(first_image.original_image.name, blobs.original_name(first_image.checksum, '.png'))
+        self.assertEqual(sorted(first_image.thumbnails.values_list('thumbnail', flat=True)),
+                         sorted(second_image.thumbnails.values_list('thumbnail', flat=True)))
+        names = [first_image.original_image.name, *first_image.thumbnails.values_list('thumbnail', flat=True)]
+        self.assertEqual(list(Blob.objects.filter(name__in=names).values_list('references', flat=True)), [2, 2, 2])
+
+        storage = first_image.original_image.storage
+        with self.captureOnCommitCallbacks(execute=True):
+            first_image.delete()
+        self.assertTrue(all(storage.exists(name) for name in names))
+        with self.captureOnCommitCallbacks(execute=True):
+            second_image.delete()
+        self.assertFalse(Blob.objects.filter(name__in=names).exists())
+        self.assertFalse(any(storage.exists(name) for name in names))
+
     def test_image_upload_basic_tier(self):
         self.client.force_authenticate(user=self.user)
         photo_file = generate_photo_file()
@@ -124,22 +312,406 @@ class ImageUploadViewTest(APITestCase):
         self.assertTrue(len(response.data['thumbnails']), 2)
         self.assertTrue('original_link', response.data)
 
+    @override_settings(IMAGE_PROCESSING_ASYNC=True)
+    def test_image_upload_async(self):
+        self.user.account_tier = self.premium
+        self.user.save()
+        self.client.force_authenticate(user=self.user)
+        data = {
+            "original_image": generate_photo_file()
+        }
+        response = self.client.post(UPLOAD_IMAGE_URL, data=data, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], Image.Status.PENDING)
+        self.assertEqual(len(response.data['thumbnails']), 0)
+        self.assertEqual(Job.objects.filter(kind='process_image', status=Job.Status.QUEUED).count(), 1)
+
+        call_command('run_jobs', burst=True, stdout=io.StringIO())
+        image = Image.objects.get(pk=response.data['id'])
+        self.assertEqual(image.status, Image.Status.READY)
+        self.assertEqual(image.thumbnails.count(), 2)
+        self.assertEqual(Job.objects.get().status, Job.Status.DONE)
+
+    def test_image_upload_format_variants(self):
+        set_thumbnail_sizes(self.basic, [200], 'webp')
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(UPLOAD_IMAGE_URL, {'original_image': generate_photo_file()}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([thumbnail['format'] for thumbnail in response.data['thumbnails']], ['PNG'])
+        image = Image.objects.get(user=self.user)
+        self.assertEqual(sorted(image.thumbnails.values_list('format', flat=True)), ['PNG', 'WEBP'])
+
+        response = self.client.get(LIST_IMAGE_URL, HTTP_ACCEPT='application/json, image/webp')
+        self.assertIn('Accept', response['Vary'])
+        thumbnails = response.data['results'][0]['thumbnails']
+        self.assertEqual([thumbnail['format'] for thumbnail in thumbnails], ['WEBP'])
+        self.assertTrue(thumbnails[0]['thumbnail'].endswith('.webp'))
+        etag = response['ETag']
+        response = self.client.get(LIST_IMAGE_URL, HTTP_ACCEPT='application/json')
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['results'][0]['thumbnails'][0]['format'], 'PNG')
+
+    def test_image_upload_lazy_size(self):
+        ThumbnailSize.objects.create(account_tier=self.basic, height=400, eager=False)
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(UPLOAD_IMAGE_URL, {'original_image': generate_photo_file()}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        image = Image.objects.get(user=self.user)
+        self.assertEqual(list(image.thumbnails.values_list('height', flat=True)), [200])
+        lazy = response.data['thumbnails'][1]
+        self.assertIsNone(lazy['id'])
+        self.assertTrue(lazy['thumbnail'].endswith(reverse('render_thumbnail', args=[image.pk, 400])))
+
+    def test_image_upload_size_quality(self):
+        set_thumbnail_sizes(self.basic, [200], quality=50)
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(UPLOAD_IMAGE_URL, {'original_image': generate_photo_file()}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Image.objects.get(user=self.user).thumbnails.get().thumbnail.name.endswith('_200_q50.png'))
+
+    @override_settings(IMAGE_PROCESSING_ASYNC=True, JOB_MAX_ATTEMPTS=1)
+    def test_image_upload_async_failed(self):
+        self.client.force_authenticate(user=self.user)
+        data = {
+            "original_image": generate_photo_file()
+        }
+        response = self.client.post(UPLOAD_IMAGE_URL, data=data, format='multipart')
+        image = Image.objects.get(pk=response.data['id'])
+        image.original_image.delete(save=False)
+
+        with self.assertLogs('image_app.jobs', 'ERROR'):
+            call_command('run_jobs', burst=True, stdout=io.StringIO())
+        image.refresh_from_db()
+        self.assertEqual(image.status, Image.Status.FAILED)
+        self.assertEqual(Job.objects.get().status, Job.Status.FAILED)
+
+    def tearDown(self):
+        for image in Image.objects.all():
+            if image.original_image:
+                image.original_image.delete(save=False)
+        Image.objects.all().delete()
+
+
+class BatchImageUploadViewTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.premium = create_tier('Premium', [20, 40],
+                                   original_link=True,
+                                   expiring_link=False
+                                   )
+        self.user = User.objects.create_user(username='test',
+                                             email='test@test.com',
+                                             password='foo',
+                                             account_tier=self.premium)
+        self.url = reverse('image_batch_create')
+        self.client = QueryBudgetAPIClient(enforce_csrf_checks=True)
+        self.client.force_authenticate(user=self.user)
+
+    def test_batch_upload(self):
+        files = [generate_photo_file(), generate_photo_file(),
+                 SimpleUploadedFile('test.txt', b'not_an_image_content', content_type='text/plain'),
+                 SimpleUploadedFile('broken.png', b'not_an_image_content', content_type='image/png')]
+        response = self.client.post(self.url, {'original_images': files}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        results = response.data['results']
+        self.assertEqual(len(results[0]['image']['thumbnails']), 2)
+        self.assertEqual(len(results[1]['image']['thumbnails']), 2)
+        self.assertEqual(results[2], {'file': 'test.txt', 'error': 'File type not allowed'})
+        self.assertEqual(results[3], {'file': 'broken.png', 'error': 'File type not allowed'})
+        self.assertEqual(Image.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(Thumbnail.objects.filter(image__user=self.user).count(), 4)
+        image = Image.objects.get(pk=results[0]['image']['id'])
+        self.assertEqual(image.content_type, 'image/png')
+        thumbnail = image.thumbnails.get(height=20).thumbnail
+        self.assertTrue(thumbnail.storage.exists(thumbnail.name))
+
+    @override_settings(IMAGE_PROCESSING_ASYNC=True)
+    def test_batch_upload_async(self):
+        response = self.client.post(self.url, {'original_images': [generate_photo_file(), generate_photo_file()]},
+                                    format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(Job.objects.filter(kind='process_image').count(), 2)
+        self.user.save()
+        call_command('run_jobs', burst=True, stdout=io.StringIO())
+        self.assertEqual(Thumbnail.objects.filter(image__user=self.user).count(), 4)
+
+    def test_batch_upload_all_invalid(self):
+        files = [SimpleUploadedFile('test.txt', b'not_an_image_content', content_type='text/plain')]
+        response = self.client.post(self.url, {'original_images': files}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(self.url, {}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def tearDown(self):
         for image in Image.objects.all():
             if image.original_image:
                 image.original_image.delete(save=False)
+            for thumbnail in image.thumbnails.all():
+                thumbnail.thumbnail.delete(save=False)
         Image.objects.all().delete()
 
 
+class ResumableUploadTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.upload_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(UPLOAD_SESSION_ROOT=self.upload_root, UPLOAD_CHUNK_SIZE=1024)
+        self.settings_override.enable()
+        User = get_user_model()
+        self.premium = create_tier('Premium', [20, 40],
+                                   original_link=True,
+                                   expiring_link=False
+                                   )
+        self.user = User.objects.create_user(username='test',
+                                             email='test@test.com',
+                                             password='foo',
+                                             account_tier=self.premium)
+        self.client = QueryBudgetAPIClient(enforce_csrf_checks=True)
+        self.client.force_authenticate(user=self.user)
+        self.content = generate_detailed_image((120, 80), 'PNG').read()
+
+    def test_direct_upload_needs_s3_storage(self):
+        response = self.client.post(reverse('direct_upload_create'), {'file_name': 'photo.jpg', 'size': 100})
+        self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def start_session(self, size):
+        response = self.client.post(reverse('upload_session_create'), {'file_name': 'photo.jpg', 'size': size})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def put_chunk(self, session_id, index, data):
+        return self.client.put(reverse('upload_session_chunk', args=[session_id, index]), data,
+                               content_type='application/octet-stream')
+
+    def test_resumable_upload(self):
+        session_id = self.start_session(len(self.content))
+        chunks = [self.content[i:i + 1024] for i in range(0, len(self.content), 1024)]
+        self.assertGreater(len(chunks), 2)
+
+        response = self.put_chunk(session_id, 1, chunks[1])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['offset'], 0)
+        self.assertEqual(self.put_chunk(session_id, 0, chunks[0]).data['offset'], 1024)
+        # a retried chunk is acknowledged without moving the offset
+        self.assertEqual(self.put_chunk(session_id, 0, chunks[0]).data['offset'], 1024)
+        response = self.put_chunk(session_id, 1, chunks[1][:100])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        finalize_url = reverse('upload_session_finalize', args=[session_id])
+        self.assertEqual(self.client.post(finalize_url).status_code, status.HTTP_409_CONFLICT)
+        response = self.client.get(reverse('upload_session', args=[session_id]))
+        self.assertEqual(response.data['offset'], 1024)
+
+        for index, chunk in enumerate(chunks[1:], start=1):
+            self.assertEqual(self.put_chunk(session_id, index, chunk).status_code, status.HTTP_200_OK)
+        response = self.client.post(finalize_url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['thumbnails']), 2)
+        image = Image.objects.get(user=self.user)
+        self.assertTrue(image.original_image.name.endswith('.png'))
+        self.assertEqual(image.file_size, len(self.content))
+        with image.original_image.open('rb') as file:
+            self.assertEqual(file.read(), self.content)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(os.listdir(self.upload_root), [])
+
+    def test_first_chunk_is_sniffed(self):
+        session_id = self.start_session(2000)
+        response = self.put_chunk(session_id, 0, b'x' * 1024)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'File type not allowed')
+        self.assertEqual(UploadSession.objects.get().received, 0)
+
+    def test_session_of_other_user(self):
+        session_id = self.start_session(len(self.content))
+        other = get_user_model().objects.create_user(username='other', email='other@test.com', password='foo',
+                                                          account_tier=self.premium)
+        self.client.force_authenticate(user=other)
+        self.assertEqual(self.client.get(reverse('upload_session', args=[session_id])).status_code,
+                         status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.put_chunk(session_id, 0, self.content[:1024]).status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(UPLOAD_MAX_FILE_SIZE=1000)
+    def test_session_size_limit(self):
+        response = self.client.post(reverse('upload_session_create'), {'file_name': 'photo.png', 'size': 2000})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_purge_upload_sessions(self):
+        stale_id = self.start_session(len(self.content))
+        self.put_chunk(stale_id, 0, self.content[:1024])
+        fresh_id = self.start_session(len(self.content))
+        UploadSession.objects.filter(pk=stale_id).update(updated=timezone.now() - timedelta(days=2))
+
+        out = io.StringIO()
+        call_command('purge_upload_sessions', stdout=out)
+        self.assertIn('Done: 1 upload sessions deleted', out.getvalue())
+        self.assertEqual([str(pk) for pk in UploadSession.objects.values_list('pk', flat=True)], [fresh_id])
+        self.assertEqual(os.listdir(self.upload_root), [])
+
+    def test_purge_keeps_sessions_receiving_chunks(self):
+        session_id = self.start_session(len(self.content))
+        UploadSession.objects.filter(pk=session_id).update(updated=timezone.now() - timedelta(days=2))
+        self.assertEqual(self.put_chunk(session_id, 0, self.content[:1024]).status_code, status.HTTP_200_OK)
+
+        call_command('purge_upload_sessions', stdout=io.StringIO())
+        self.assertTrue(UploadSession.objects.filter(pk=session_id).exists())
+
+    @override_settings(JOB_MAX_ATTEMPTS=2)
+    def test_schedule_purge_upload_sessions(self):
+        call_command('purge_upload_sessions', schedule=600, stdout=io.StringIO())
+        job = Job.objects.get()
+        job.status = Job.Status.RUNNING
+        job.save()
+        call_command('purge_upload_sessions', schedule=600, stdout=io.StringIO())
+        self.assertEqual(Job.objects.count(), 1)
+
+        with mock.patch('image_app.tasks.purge_sessions', side_effect=OSError), \
+                self.assertLogs('image_app.jobs', 'ERROR'):
+            jobs.run(job)
+            self.assertEqual(Job.objects.count(), 1)
+            jobs.run(job)
+        self.assertEqual(job.status, Job.Status.FAILED)
+        self.assertEqual(Job.objects.filter(status=Job.Status.QUEUED).count(), 1)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.upload_root)
+        for image in Image.objects.all():
+            image.original_image.delete(save=False)
+            for thumbnail in image.thumbnails.all():
+                thumbnail.thumbnail.delete(save=False)
+
+
+@skipUnless(moto, 'moto is not installed')
+class S3StorageTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        get_token_cache().clear()
+        self.mock = (getattr(moto, 'mock_aws', None) or moto.mock_s3)()
+        self.mock.start()
+        self.settings_override = override_settings(
+            S3_BUCKET='media', S3_REGION='us-east-1', S3_ACCESS_KEY_ID='testing', S3_SECRET_ACCESS_KEY='testing',
+            S3_MULTIPART_THRESHOLD=5 * 1024 * 1024, S3_MULTIPART_CHUNK_SIZE=5 * 1024 * 1024,
+            MEDIA_DELIVERY_MODE='redirect',
+            STORAGES={'default': {'BACKEND': 'image_app.storage.S3Storage'},
+                      'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}},
+        )
+        self.settings_override.enable()
+        default_storage.client.create_bucket(Bucket='media')
+        User = get_user_model()
+        self.enterprise = create_tier('Enterprise', [20, 40],
+                                      original_link=True,
+                                      expiring_link=True
+                                      )
+        self.user = User.objects.create_user(username='test',
+                                             email='test@test.com',
+                                             password='foo',
+                                             account_tier=self.enterprise)
+        self.client = QueryBudgetAPIClient(enforce_csrf_checks=True)
+        self.client.force_authenticate(user=self.user)
+
+    def test_storage_multipart_round_trip(self):
+        content = os.urandom(11 * 1024 * 1024)
+        name = default_storage.save('images/original/large.bin', ContentFile(content))
+        self.assertEqual(name, 'images/original/large.bin')
+        head = default_storage.client.head_object(Bucket='media', Key=name)
+        self.assertTrue(head['ETag'].endswith('-3"'))
+        self.assertEqual(default_storage.size(name), len(content))
+        with default_storage.open(name) as file:
+            self.assertEqual(file.read(), content)
+
+        default_storage.copy(name, 'images/original/copy.bin')
+        self.assertEqual(default_storage.size('images/original/copy.bin'), len(content))
+        default_storage.delete(name)
+        self.assertFalse(default_storage.exists(name))
+        self.assertIn('X-Amz-Signature=', default_storage.url('images/original/copy.bin'))
+
+    def test_upload_and_presigned_link(self):
+        response = self.client.post(UPLOAD_IMAGE_URL, {'original_image': generate_photo_file()}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn('X-Amz-Signature=', response.data['original_image'])
+        image = Image.objects.get(user=self.user)
+        self.assertTrue(default_storage.exists(image.original_image.name))
+        self.assertTrue(all(default_storage.exists(thumbnail.thumbnail.name) for thumbnail in image.thumbnails.all()))
+
+        link = ExpirationLink.objects.create(image=image, expiration_time=timezone.now() + timedelta(hours=2))
+        response = self.client.get(reverse('retrieve_expiring_image', kwargs={'token': link.token}))
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertIn(image.original_image.name, response['Location'])
+        # presigned URLs are valid for S3_PRESIGNED_EXPIRY seconds at most
+        self.assertIn('X-Amz-Expires=3600', response['Location'])
+
+    @override_settings(S3_PRESIGNED_EXPIRY=3600)
+    def test_image_list_renewed_before_urls_expire(self):
+        self.client.post(UPLOAD_IMAGE_URL, {'original_image': generate_photo_file()}, format='multipart')
+        now = 1_800_000_000
+        with mock.patch('time.time', return_value=now):
+            etag = self.client.get(LIST_IMAGE_URL)['ETag']
+            response = self.client.get(LIST_IMAGE_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        # half of the expiry later the list is sent again with new URLs
+        with mock.patch('time.time', return_value=now + 1800):
+            response = self.client.get(LIST_IMAGE_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+        with override_settings(S3_QUERYSTRING_AUTH=False):
+            etag = self.client.get(LIST_IMAGE_URL)['ETag']
+            with mock.patch('time.time', return_value=now + 7200):
+                response = self.client.get(LIST_IMAGE_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_direct_upload(self):
+        content = generate_detailed_image((120, 80), 'PNG').read()
+        response = self.client.post(reverse('direct_upload_create'), {'file_name': 'photo.jpg', 'size': len(content)})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn('url', response.data['upload'])
+        session = UploadSession.objects.get(pk=response.data['id'])
+        self.assertEqual(response.data['upload']['fields']['key'], session.storage_name)
+        complete_url = reverse('direct_upload_complete', args=[session.pk])
+        self.assertEqual(self.client.post(complete_url).status_code, status.HTTP_409_CONFLICT)
+
+        # the client posts the form to the storage, the object is put directly here
+        default_storage.client.put_object(Bucket='media', Key=session.storage_name, Body=content)
+        response = self.client.post(complete_url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['thumbnails']), 2)
+        image = Image.objects.get(user=self.user)
+        self.assertTrue(image.original_image.name.endswith('.png'))
+        with image.original_image.open('rb') as file:
+            self.assertEqual(file.read(), content)
+        self.assertFalse(default_storage.exists(session.storage_name))
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_direct_upload_rejects_other_files(self):
+        response = self.client.post(reverse('direct_upload_create'), {'file_name': 'photo.png', 'size': 20})
+        session = UploadSession.objects.get(pk=response.data['id'])
+        default_storage.client.put_object(Bucket='media', Key=session.storage_name, Body=b'not_an_image_content')
+        response = self.client.post(reverse('direct_upload_complete', args=[session.pk]))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'File type not allowed')
+        self.assertFalse(default_storage.exists(session.storage_name))
+        self.assertFalse(Image.objects.exists())
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.mock.stop()
+
+
 class ImageListViewTest(APITestCase):
 
     def setUp(self):
+        cache.clear()
         User = get_user_model()
-        self.basic = AccountTier.objects.create(name='Basic',
-                                                thumbnail_size='200',
-                                                original_link=False,
-                                                expiring_link=False
-                                                )
+        self.basic = create_tier('Basic', [200],
+                                 original_link=False,
+                                 expiring_link=False
+                                 )
         self.user = User.objects.create_user(username='test',
                                              email='test@test.com',
                                              password='foo',
@@ -148,7 +720,7 @@ class ImageListViewTest(APITestCase):
         photo_file = generate_photo_file()
         Image.objects.create(user=self.user, original_image=photo_file)
         self.refresh = RefreshToken.for_user(self.user)
-        self.client = APIClient(enforce_csrf_checks=True)
+        self.client = QueryBudgetAPIClient(enforce_csrf_checks=True)
 
     def test_image_list_authenticated(self):
         self.client.force_authenticate(user=self.user)
@@ -156,6 +728,65 @@ class ImageListViewTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 4)
         self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['status'], Image.Status.READY)
+
+    def test_image_list_cursor_pagination(self):
+        for _ in range(2):
+            Image.objects.create(user=self.user, original_image=generate_photo_file())
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(LIST_IMAGE_URL, {'pagination': 'cursor', 'size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+        self.assertIsNone(response.data['previous'])
+        self.assertEqual(len(response.data['results']), 2)
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['next'])
+        self.assertIsNotNone(response.data['previous'])
+        self.assertEqual([image['id'] for image in response.data['results']],
+                         [Image.objects.filter(user=self.user).last().pk])
+
+    def test_image_list_not_modified(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(LIST_IMAGE_URL)
+        etag = response['ETag']
+        self.assertIn('private', response['Cache-Control'])
+
+        with self.assertNumQueries(0):
+            response = self.client.get(LIST_IMAGE_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(LIST_IMAGE_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 1)
+
+        response = self.client.get(LIST_IMAGE_URL, {'page': 1}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_image_list_invalidated_on_change(self):
+        self.client.force_authenticate(user=self.user)
+        etag = self.client.get(LIST_IMAGE_URL)['ETag']
+        with self.captureOnCommitCallbacks() as callbacks:
+            Image.objects.create(user=self.user, original_image=generate_photo_file())
+            # the version changes only after the commit, a list read before it is cached under the old version
+            response = self.client.get(LIST_IMAGE_URL, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        for callback in callbacks:
+            callback()
+        response = self.client.get(LIST_IMAGE_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.data['results']), 2)
+
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Image.objects.filter(user=self.user).first().delete()
+        response = self.client.get(LIST_IMAGE_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(len(response.data['results']), 1)
 
     def test_image_list_unauthenticated(self):
         self.client.logout()
@@ -172,11 +803,10 @@ class ImageListViewTest(APITestCase):
 class ExpirationLinkCreateAPIViewTest(APITestCase):
     def setUp(self):
         User = get_user_model()
-        self.basic = AccountTier.objects.create(name='Basic',
-                                                thumbnail_size='200',
-                                                original_link=False,
-                                                expiring_link=False
-                                                )
+        self.basic = create_tier('Basic', [200],
+                                 original_link=False,
+                                 expiring_link=False
+                                 )
         self.user = User.objects.create_user(username='test',
                                              email='test@test.com',
                                              password='foo',
@@ -185,7 +815,7 @@ class ExpirationLinkCreateAPIViewTest(APITestCase):
         photo_file = generate_photo_file()
         self.image = Image.objects.create(user=self.user, original_image=photo_file)
         self.url = reverse('create_expiring_link', kwargs={'pk': self.image.pk})
-        self.client = APIClient(enforce_csrf_checks=True)
+        self.client = QueryBudgetAPIClient(enforce_csrf_checks=True)
 
     def test_unauthenticated_request(self):
         response = self.client.post(self.url)
@@ -208,15 +838,142 @@ class ExpirationLinkCreateAPIViewTest(APITestCase):
         Image.objects.all().delete()
 
 
+class SignedLinkTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.enterprise = create_tier('Enterprise', [200, 400],
+                                      original_link=True,
+                                      expiring_link=True
+                                      )
+        self.user = User.objects.create_user(username='test',
+                                             email='test@test.com',
+                                             password='foo',
+                                             account_tier=self.enterprise
+                                             )
+        self.image = Image.objects.create(user=self.user, original_image=generate_photo_file(),
+                                          content_type='image/png')
+        self.client = QueryBudgetAPIClient(enforce_csrf_checks=True)
+        self.client.force_authenticate(user=self.user)
+
+    def create_link(self):
+        url = reverse('create_expiring_link', kwargs={'pk': self.image.pk})
+        response = self.client.post(url, {'expiration-time': 3600, 'link-type': 'signed'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['link']
+
+    def test_create_and_retrieve_signed_link(self):
+        link = self.create_link()
+        self.assertFalse(ExpirationLink.objects.exists())
+        self.client.logout()
+        signed_links.get_revocations().refresh()
+        with self.assertNumQueries(0):
+            response = self.client.get(link)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/png')
+
+    def test_tampered_signed_link(self):
+        link = self.create_link()
+        token = link.rstrip('/').rsplit('/', 1)[1]
+        response = self.client.get(reverse('retrieve_signed_image', kwargs={'token': token[:-2] + 'xx'}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_expired_signed_link(self):
+        token = signed_links.make_token(self.image, timezone.now() - timedelta(seconds=1))
+        response = self.client.get(reverse('retrieve_signed_image', kwargs={'token': token}))
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+
+    def test_revoke_signed_link(self):
+        link = self.create_link()
+        token = link.rstrip('/').rsplit('/', 1)[1]
+        response = self.client.post(reverse('revoke_signed_link'), {'token': token})
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.get(link).status_code, status.HTTP_410_GONE)
+        revocations = signed_links.RevocationSet(refresh_interval=60)
+        self.assertIn(signed_links.load_token(token).digest, revocations)
+
+    def test_revoke_other_users_link(self):
+        User = get_user_model()
+        other = User.objects.create_user(username='other', email='other@test.com', password='foo',
+                                         account_tier=self.enterprise)
+        token = signed_links.make_token(self.image, timezone.now() + timedelta(hours=1))
+        self.client.force_authenticate(user=other)
+        response = self.client.post(reverse('revoke_signed_link'), {'token': token})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def tearDown(self):
+        for image in Image.objects.all():
+            if image.original_image:
+                image.original_image.delete(save=False)
+        Image.objects.all().delete()
+
+
+class ExpirationLinkBulkCreateAPIViewTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.basic = create_tier('Basic', [200],
+                                 original_link=False,
+                                 expiring_link=False
+                                 )
+        self.user = User.objects.create_user(username='test',
+                                             email='test@test.com',
+                                             password='foo',
+                                             account_tier=self.basic
+                                             )
+        other = User.objects.create_user(username='other',
+                                         email='other@test.com',
+                                         password='foo',
+                                         account_tier=self.basic
+                                         )
+        self.images = [Image.objects.create(user=self.user, original_image='images/original/test.png')
+                       for _ in range(3)]
+        self.other_image = Image.objects.create(user=other, original_image='images/original/other.png')
+        self.url = reverse('create_expiring_links')
+        self.client = QueryBudgetAPIClient(enforce_csrf_checks=True)
+        self.client.force_authenticate(user=self.user)
+
+    def test_create_links(self):
+        image_ids = [image.pk for image in self.images] + [self.other_image.pk, 999999]
+        response = self.client.post(self.url, {'images': image_ids, 'expiration-time': 3600}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([link['image'] for link in response.data['links']], image_ids[:3])
+        self.assertEqual(ExpirationLink.objects.count(), 3)
+        self.assertEqual(response.data['errors'][0]['image'], self.other_image.pk)
+        self.assertEqual(response.data['errors'][1], {'image': 999999, 'error': 'Photo not found'})
+        link = ExpirationLink.objects.get(image=self.images[0])
+        self.assertTrue(response.data['links'][0]['link'].endswith(f'/api/expiring-images/{link.token}/'))
+
+    def test_create_signed_links(self):
+        response = self.client.post(self.url, {'images': [self.images[0].pk], 'expiration-time': 3600,
+                                               'link-type': 'signed'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn('/api/signed-images/', response.data['links'][0]['link'])
+        self.assertFalse(ExpirationLink.objects.exists())
+
+    def test_create_links_invalid_request(self):
+        response = self.client.post(self.url, {'expiration-time': 3600}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(self.url, {'images': ['x'], 'expiration-time': 3600}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(self.url, {'images': [self.images[0].pk], 'expiration-time': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(self.url, {'images': [self.other_image.pk], 'expiration-time': 3600},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(response.data['errors']), 1)
+
+
 class ExpirationLinkRetrieveViewTest(APITestCase):
 
     def setUp(self):
+        cache.clear()
         User = get_user_model()
-        self.basic = AccountTier.objects.create(name='Basic',
-                                                thumbnail_size='200',
-                                                original_link=False,
-                                                expiring_link=False
-                                                )
+        self.basic = create_tier('Basic', [200],
+                                 original_link=False,
+                                 expiring_link=False
+                                 )
         self.user = User.objects.create_user(username='test',
                                              email='test@test.com',
                                              password='foo',
@@ -230,12 +987,115 @@ class ExpirationLinkRetrieveViewTest(APITestCase):
             expiration_time=timezone.now() + timedelta(hours=1)
         )
         self.url = reverse('retrieve_expiring_image', kwargs={'token': self.exp_link.token})
-        self.client = APIClient(enforce_csrf_checks=True)
+        self.client = QueryBudgetAPIClient(enforce_csrf_checks=True)
 
     def test_retrieve_valid_link(self):
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_retrieve_valid_link_content_type(self):
+        self.image.content_type = 'image/png'
+        self.image.save()
+        with mock.patch.object(views.magic, 'from_file') as from_file:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        from_file.assert_not_called()
+
+    @override_settings(MEDIA_DELIVERY_MODE='x-accel-redirect')
+    def test_retrieve_valid_link_x_accel_redirect(self):
+        self.image.content_type = 'image/png'
+        self.image.save()
+        with mock.patch('django.core.files.storage.FileSystemStorage.open') as storage_open:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.image.original_image.name)
+        self.assertEqual(response.content, b'')
+        storage_open.assert_not_called()
+
+    @override_settings(MEDIA_DELIVERY_MODE='x-sendfile')
+    def test_retrieve_valid_link_x_sendfile(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Sendfile'], self.image.original_image.path)
+
+    def test_retrieve_range(self):
+        content = self.image.original_image.open('rb').read()
+        self.image.original_image.close()
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(content)}')
+        self.assertEqual(b''.join(response.streaming_content), content[10:20])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-1,-2')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertTrue(response['Content-Type'].startswith('multipart/byteranges; boundary='))
+        body = b''.join(response.streaming_content)
+        self.assertIn(f'Content-Range: bytes 0-1/{len(content)}'.encode(), body)
+        self.assertIn(f'Content-Range: bytes {len(content) - 2}-{len(content) - 1}/{len(content)}'.encode(), body)
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(content)}-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(content)}')
+
+    def test_retrieve_conditional(self):
+        response = self.client.get(self.url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertTrue(response['Cache-Control'].startswith('private, max-age='))
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+
+    def test_retrieve_cached_link(self):
+        get_token_cache().clear()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        url = reverse('retrieve_expiring_image', kwargs={'token': uuid.uuid4()})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(get_token_cache().stats()['hits'], 1)
+        self.assertEqual(get_token_cache().stats()['negative_hits'], 1)
+
+        self.exp_link.delete()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_retrieve_cached_link_of_deleted_image(self):
+        get_token_cache().clear()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        # deleted by another process, the token stays in the cache of this one
+        with mock.patch.object(get_token_cache(), 'invalidate'):
+            self.image.delete()
+        self.image.original_image.delete(save=False)
+        self.assertIsNotNone(get_token_cache().get(self.exp_link.token))
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data, {'error': 'Photo not found'})
+        self.assertIsNone(get_token_cache().get(self.exp_link.token))
+        self.assertEqual(self.client.get(self.url).data, {'error': 'Invalid or expired link'})
+
+    def test_link_cache_stats(self):
+        stats_url = reverse('link_cache_stats')
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.client.get(stats_url).status_code, status.HTTP_403_FORBIDDEN)
+        self.user.is_staff = True
+        response = self.client.get(stats_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data), {'entries', 'negative_entries', 'hits', 'negative_hits', 'misses',
+                                              'evictions'})
+
     def test_retrieve_invalid_link(self):
         token = uuid.uuid4()
         url = reverse('retrieve_expiring_image', kwargs={'token': token})
@@ -253,3 +1113,647 @@ class ExpirationLinkRetrieveViewTest(APITestCase):
             if image.original_image:
                 image.original_image.delete(save=False)
         Image.objects.all().delete()
+
+
+class ThumbnailEngineTest(SimpleTestCase):
+
+    def assertSimilar(self, image, reference):
+        difference = ImageStat.Stat(ImageChops.difference(image.convert('RGB'), reference.convert('RGB')))
+        self.assertLess(sum(difference.mean) / len(difference.mean), 255 * 0.02)
+
+    def test_target_size(self):
+        self.assertEqual(thumbnail_engine.target_size((4000, 3000), 200), (267, 200))
+        self.assertEqual(thumbnail_engine.target_size((3000, 1), 200), (3000, 1))
+        self.assertEqual(thumbnail_engine.target_size((1, 3000), 200), (1, 200))
+        self.assertEqual(thumbnail_engine.target_size((100, 100), 200), (100, 100))
+
+    def test_render_jpeg_quality_contract(self):
+        source = generate_detailed_image((4000, 3000))
+        rendered = thumbnail_engine.render(source, [200, 400], 'JPEG', workers=0)
+        self.assertEqual([thumbnail.height for thumbnail in rendered], [400, 200])
+        source.seek(0)
+        with img.open(source) as original:
+            original.load()
+            for thumbnail in rendered:
+                with img.open(io.BytesIO(thumbnail.data)) as im:
+                    self.assertEqual(im.format, 'JPEG')
+                    self.assertEqual(im.mode, 'RGB')
+                    self.assertEqual(im.size, thumbnail.size)
+                    self.assertEqual(im.size, thumbnail_engine.target_size(original.size, thumbnail.height))
+                    self.assertSimilar(im, original.resize(im.size, img.Resampling.LANCZOS))
+
+    def test_thumbnail_specs_ignore_unknown_formats(self):
+        image = Image(original_image='images/original/ab/photo.jpeg')
+        plan = TierPlan([SizeRule(200, ('GIF', 'BMP', 'WEBP'), None, True), SizeRule(400, ('GIF',), None, False)])
+        self.assertEqual(thumbnail_specs(image, plan), [(200, 'JPEG'), (200, 'WEBP')])
+
+    def test_render_png_keeps_transparency(self):
+        source = generate_detailed_image((900, 600), image_format='PNG', mode='RGBA')
+        rendered = thumbnail_engine.render(source, [200], 'PNG', workers=0)
+        with img.open(io.BytesIO(rendered[0].data)) as im:
+            self.assertEqual(im.format, 'PNG')
+            self.assertEqual(im.mode, 'RGBA')
+            self.assertEqual(im.size, (300, 200))
+
+    def test_render_does_not_upscale(self):
+        rendered = thumbnail_engine.render(generate_detailed_image((100, 100)), [200, 400], 'JPEG', workers=0)
+        self.assertEqual([thumbnail.size for thumbnail in rendered], [(100, 100), (100, 100)])
+
+    def test_render_parallel_matches_inline(self):
+        source = generate_detailed_image((1600, 1200))
+        inline = thumbnail_engine.render(source, [200, 400], 'JPEG', workers=0)
+        source.seek(0)
+        parallel = thumbnail_engine.render(source, [200, 400], 'JPEG', workers=2)
+        self.assertEqual(inline, parallel)
+
+    def test_render_variants(self):
+        source = generate_detailed_image((900, 600), image_format='PNG', mode='RGBA')
+        rendered = thumbnail_engine.render(source, [200], 'PNG', workers=0, variants=[('WEBP', 80)])
+        self.assertEqual([thumbnail.format for thumbnail in rendered], ['PNG', 'WEBP'])
+        with img.open(io.BytesIO(rendered[1].data)) as im:
+            self.assertEqual(im.format, 'WEBP')
+            self.assertEqual(im.mode, 'RGBA')
+            self.assertEqual(im.size, (300, 200))
+
+    def test_choose_format(self):
+        def choose(accept, formats=thumbnail_engine.VARIANT_FORMATS):
+            return negotiation.choose_format(RequestFactory().get('/', HTTP_ACCEPT=accept), formats)
+
+        self.assertIsNone(choose('*/*'))
+        self.assertIsNone(choose('image/*'))
+        self.assertEqual(choose('image/webp,*/*'), 'WEBP')
+        self.assertIsNone(choose('image/webp;q=0'))
+        self.assertIsNone(choose('image/webp', ()))
+        with mock.patch.object(negotiation, 'is_supported', lambda fmt: fmt == 'WEBP'):
+            self.assertEqual(choose('image/avif,image/webp'), 'WEBP')
+        with mock.patch.object(negotiation, 'is_supported', lambda fmt: True):
+            self.assertEqual(choose('image/avif,image/webp'), 'AVIF')
+            self.assertEqual(choose('image/avif;q=0.5,image/webp'), 'WEBP')
+
+
+class ThumbnailRenderViewTest(APITestCase):
+
+    def setUp(self):
+        User = get_user_model()
+        self.cache_root = tempfile.mkdtemp()
+        self.premium = create_tier('Premium', [200, 400],
+                                   original_link=True,
+                                   expiring_link=False
+                                   )
+        self.user = User.objects.create_user(username='test',
+                                             email='test@test.com',
+                                             password='foo',
+                                             account_tier=self.premium
+                                             )
+        self.other_user = User.objects.create_user(username='other',
+                                                   email='other@test.com',
+                                                   password='foo',
+                                                   account_tier=self.premium
+                                                   )
+        self.image = Image.objects.create(user=self.user, original_image=generate_photo_file())
+        self.client = QueryBudgetAPIClient(enforce_csrf_checks=True)
+        self.settings_override = override_settings(THUMBNAIL_CACHE_ROOT=self.cache_root)
+        self.settings_override.enable()
+
+    def get_url(self, height, image=None):
+        return reverse('render_thumbnail', kwargs={'image_id': (image or self.image).pk, 'height': height})
+
+    def test_render_and_cache_hit(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(self.get_url(200))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        with img.open(io.BytesIO(b''.join(response.streaming_content))) as im:
+            self.assertEqual(im.size, (100, 100))
+
+        with mock.patch.object(thumbnail_engine, 'render') as render:
+            response = self.client.get(self.get_url(200))
+            b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        render.assert_not_called()
+
+    def test_render_negotiated_format(self):
+        set_thumbnail_sizes(self.premium, [200, 400], 'webp')
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(self.get_url(200), HTTP_ACCEPT='image/avif,image/webp,*/*')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('Accept', response['Vary'])
+        with img.open(io.BytesIO(b''.join(response.streaming_content))) as im:
+            self.assertEqual(im.format, 'WEBP')
+
+        response = self.client.get(self.get_url(200), HTTP_ACCEPT='*/*')
+        self.assertEqual(response['Content-Type'], 'image/png')
+        b''.join(response.streaming_content)
+
+    def test_size_outside_tier(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(self.get_url(300))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_other_users_image(self):
+        self.client.force_authenticate(user=self.other_user)
+        response = self.client.get(self.get_url(200))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_unauthenticated_request(self):
+        response = self.client.get(self.get_url(200))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.cache_root, ignore_errors=True)
+        for image in Image.objects.all():
+            if image.original_image:
+                image.original_image.delete(save=False)
+        Image.objects.all().delete()
+
+
+class ThumbnailCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = ThumbnailCache(self.root, max_bytes=250)
+        first = cache.put('a' * 64, '.png', b'x' * 100)
+        second = cache.put('b' * 64, '.png', b'x' * 100)
+        os.utime(first, (1, 1))
+        os.utime(second, (2, 2))
+        self.assertEqual(cache.get('a' * 64, '.png'), first)
+        cache.put('c' * 64, '.png', b'x' * 100)
+        self.assertIsNotNone(cache.get('a' * 64, '.png'))
+        self.assertIsNone(cache.get('b' * 64, '.png'))
+        self.assertIsNotNone(cache.get('c' * 64, '.png'))
+
+    def test_eviction_goes_down_to_low_water_mark(self):
+        cache = ThumbnailCache(self.root, max_bytes=1000, low_water=0.5)
+        for index, key in enumerate('abcdefghij'):
+            os.utime(cache.put(key * 64, '.png', b'x' * 100), (index, index))
+        with mock.patch.object(cache, 'evict', wraps=cache.evict) as evict:
+            cache.put('k' * 64, '.png', b'x' * 100)
+            self.assertEqual(cache._size, 500)
+            for key in 'lmnop':
+                cache.put(key * 64, '.png', b'x' * 100)
+        # the misses after an eviction fit under the budget without scanning the cache
+        self.assertEqual(evict.call_count, 1)
+        self.assertIsNone(cache.get('a' * 64, '.png'))
+        self.assertIsNotNone(cache.get('k' * 64, '.png'))
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+class SyncThumbnailsCommandTest(TestCase):
+
+    def setUp(self):
+        User = get_user_model()
+        self.tier = create_tier('Custom', [50],
+                                original_link=False,
+                                expiring_link=False
+                                )
+        self.user = User.objects.create_user(username='test',
+                                             email='test@test.com',
+                                             password='foo',
+                                             account_tier=self.tier
+                                             )
+        self.images = [Image.objects.create(user=self.user, original_image=generate_photo_file()) for _ in range(3)]
+        for image in self.images:
+            create_thumbnails(image, self.tier.get_plan())
+        set_thumbnail_sizes(self.tier, [20, 40])
+        self.checkpoint = os.path.join(tempfile.mkdtemp(), 'checkpoint.json')
+
+    def test_sync_thumbnails(self):
+        obsolete = Thumbnail.objects.first().thumbnail
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('sync_thumbnails', batch_size=2, checkpoint=self.checkpoint, stdout=io.StringIO())
+        for image in self.images:
+            self.assertEqual(sorted(image.thumbnails.values_list('height', flat=True)), [20, 40])
+        self.assertFalse(obsolete.storage.exists(obsolete.name))
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_sync_thumbnails_resumes_from_checkpoint(self):
+        with open(self.checkpoint, 'w') as checkpoint:
+            checkpoint.write(f'{{"last_id": {self.images[1].pk}, "created": 4, "deleted": 2}}')
+        out = io.StringIO()
+        call_command('sync_thumbnails', checkpoint=self.checkpoint, stdout=out)
+        self.assertEqual(list(self.images[0].thumbnails.values_list('height', flat=True)), [50])
+        self.assertEqual(sorted(self.images[2].thumbnails.values_list('height', flat=True)), [20, 40])
+        self.assertIn('6 thumbnails created, 3 deleted', out.getvalue())
+
+    def test_sync_thumbnails_dry_run(self):
+        call_command('sync_thumbnails', dry_run=True, checkpoint=self.checkpoint, stdout=io.StringIO())
+        self.assertEqual(Thumbnail.objects.filter(height=50).count(), 3)
+
+    def tearDown(self):
+        for image in Image.objects.all():
+            if image.original_image:
+                image.original_image.delete(save=False)
+            for thumbnail in image.thumbnails.all():
+                thumbnail.thumbnail.delete(save=False)
+        Image.objects.all().delete()
+
+
+class QueryBudgetTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.basic = create_tier('Basic', [200],
+                                 original_link=False,
+                                 expiring_link=False
+                                 )
+        self.user = User.objects.create_user(username='test',
+                                             email='test@test.com',
+                                             password='foo',
+                                             account_tier=self.basic
+                                             )
+        self.client = QueryBudgetAPIClient(enforce_csrf_checks=True)
+        self.client.force_authenticate(user=self.user)
+
+    def test_all_views_declare_query_budget(self):
+        self.assertEqual(get_views_without_query_budget(views), [])
+
+    def test_query_count_headers(self):
+        # the tier plan is compiled by the first request of the process
+        self.basic.get_plan()
+        with override_settings(DEBUG=True):
+            response = self.client.get(LIST_IMAGE_URL)
+        self.assertEqual(response['X-Query-Count'], '1')
+        self.assertIn('X-Query-Time', response)
+
+    def test_query_budget_exceeded(self):
+        for _ in range(3):
+            Image.objects.create(user=self.user, original_image=generate_photo_file())
+        with mock.patch.object(views.ListImageView, 'query_budget', 2):
+            with self.assertRaises(QueryBudgetExceeded), self.assertLogs('core.queries', 'WARNING'):
+                self.client.get(LIST_IMAGE_URL)
+
+    def tearDown(self):
+        for image in Image.objects.all():
+            if image.original_image:
+                image.original_image.delete(save=False)
+        Image.objects.all().delete()
+
+
+class TokenBucketThrottleTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.basic = create_tier('Basic', [200],
+                                 original_link=False,
+                                 expiring_link=False
+                                 )
+        self.enterprise = create_tier('Enterprise', [200],
+                                      original_link=True,
+                                      expiring_link=True,
+                                      throttle_rates={'images_list': '3/min'}
+                                      )
+        self.user = User.objects.create_user(username='test',
+                                             email='test@test.com',
+                                             password='foo',
+                                             account_tier=self.basic
+                                             )
+        self.client = QueryBudgetAPIClient(enforce_csrf_checks=True)
+
+    def get_throttle(self, now):
+        throttle = TokenBucketThrottle()
+        throttle.timer = lambda: now
+        return throttle
+
+    def test_token_bucket(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        view = mock.Mock(throttle_scope='images_list')
+        with mock.patch.dict(TokenBucketThrottle.THROTTLE_RATES, {'images_list': '3/min'}):
+            self.assertTrue(all(self.get_throttle(1000.0).allow_request(request, view) for _ in range(3)))
+            throttle = self.get_throttle(1000.0)
+            self.assertFalse(throttle.allow_request(request, view))
+            self.assertAlmostEqual(throttle.wait(), 20.0)
+            # one token is refilled every 20 seconds, rejected requests do not use any
+            self.assertTrue(self.get_throttle(1020.0).allow_request(request, view))
+            self.assertFalse(self.get_throttle(1020.0).allow_request(request, view))
+            # an idle bucket refills up to its size only
+            self.assertTrue(all(self.get_throttle(5000.0).allow_request(request, view) for _ in range(3)))
+            self.assertFalse(self.get_throttle(5000.0).allow_request(request, view))
+
+    def test_token_bucket_concurrent_requests(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        view = mock.Mock(throttle_scope='images_list')
+        throttle_cache = self.get_throttle(1000.0).cache
+        get = throttle_cache.get
+        allowed = []
+        racing = [5]
+
+        def interleave(key, *args):
+            # another worker runs its whole request between the read and the increment of this one
+            value = get(key, *args)
+            if racing[0]:
+                racing[0] -= 1
+                allowed.append(self.get_throttle(5000.0).allow_request(request, view))
+            return value
+
+        with mock.patch.dict(TokenBucketThrottle.THROTTLE_RATES, {'images_list': '3/min'}):
+            self.assertTrue(self.get_throttle(1000.0).allow_request(request, view))
+            # the bucket refilled while idle, the requests race on its stale arrival time
+            with mock.patch.object(throttle_cache, 'get', side_effect=interleave):
+                allowed.append(self.get_throttle(5000.0).allow_request(request, view))
+            allowed += [self.get_throttle(5000.0).allow_request(request, view) for _ in range(3)]
+        self.assertEqual(allowed.count(True), 3)
+
+    def test_account_tier_rates(self):
+        self.client.force_authenticate(user=self.user)
+        for _ in range(4):
+            self.assertEqual(self.client.get(LIST_IMAGE_URL).status_code, status.HTTP_200_OK)
+
+        self.user.account_tier = self.enterprise
+        self.user.save()
+        cache.clear()
+        for _ in range(3):
+            self.assertEqual(self.client.get(LIST_IMAGE_URL).status_code, status.HTTP_200_OK)
+        response = self.client.get(LIST_IMAGE_URL)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+
+    def test_account_tier_rates_validation(self):
+        for rates in [{'images_list': 'many'}, {'images_list': '0/min'}, {'images_list': '5/mxyz'},
+                      {'unknown': '5/min'}]:
+            self.enterprise.throttle_rates = rates
+            with self.assertRaises(DjangoValidationError, msg=rates):
+                self.enterprise.full_clean()
+        self.enterprise.throttle_rates = {'images_list': '5/minute', 'image_upload': '100/day'}
+        self.enterprise.full_clean()
+
+    def test_zero_rate_blocks_scope(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        view = mock.Mock(throttle_scope='images_list')
+        with mock.patch.dict(TokenBucketThrottle.THROTTLE_RATES, {'images_list': '0/min'}):
+            throttle = self.get_throttle(1000.0)
+            self.assertFalse(throttle.allow_request(request, view))
+            self.assertEqual(throttle.wait(), 60)
+
+
+class BackfillImageMetadataCommandTest(TestCase):
+
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username='test', email='test@test.com', password='foo')
+        self.image = Image.objects.create(user=self.user, original_image=generate_photo_file())
+
+    def test_backfill_image_metadata(self):
+        call_command('backfill_image_metadata', stdout=io.StringIO())
+        self.image.refresh_from_db()
+        self.assertEqual(self.image.content_type, 'image/png')
+        self.assertEqual((self.image.width, self.image.height), (100, 100))
+        self.assertEqual(self.image.file_size, self.image.original_image.size)
+        self.assertEqual(len(self.image.checksum), 64)
+
+    def tearDown(self):
+        for image in Image.objects.all():
+            if image.original_image:
+                image.original_image.delete(save=False)
+        Image.objects.all().delete()
+
+
+class MediaViewTest(TestCase):
+
+    def setUp(self):
+        self.image = Image.objects.create(original_image=generate_photo_file())
+        create_thumbnails(self.image, TierPlan([SizeRule(50, (), None, True)]))
+        self.url = reverse('media', kwargs={'path': self.image.thumbnails.get().thumbnail.name})
+
+    def test_serve_media(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=86400')
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-7')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), b'\x89PNG\r\n\x1a\n')
+
+    def test_serve_media_negotiates_variant(self):
+        self.image.thumbnails.all().delete()
+        create_thumbnails(self.image, TierPlan([SizeRule(50, ('WEBP',), None, True)]))
+        thumbnail = self.image.thumbnails.get(format='PNG')
+        url = reverse('media', kwargs={'path': thumbnail.thumbnail.name})
+        response = self.client.get(url, HTTP_ACCEPT='image/webp,*/*')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('Accept', response['Vary'])
+
+        response = self.client.get(url, HTTP_ACCEPT='*/*')
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('Accept', response['Vary'])
+
+    def test_serve_media_legacy_name(self):
+        thumbnail = self.image.thumbnails.get()
+        name = default_storage.save('images/thumbnails/photo_thumbnail_50.png', thumbnail.thumbnail.file)
+        self.addCleanup(default_storage.delete, name)
+        url = reverse('media', kwargs={'path': name})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+        Thumbnail.objects.filter(pk=thumbnail.pk).update(thumbnail=name)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/png')
+
+    def test_serve_media_not_found(self):
+        response = self.client.get(reverse('media', kwargs={'path': 'images/original/missing.png'}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse('media', kwargs={'path': self.image.original_image.name}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse('media', kwargs={'path': '../core/settings.py'}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def tearDown(self):
+        for thumbnail in self.image.thumbnails.all():
+            thumbnail.thumbnail.delete(save=False)
+        self.image.original_image.delete(save=False)
+
+
+class TokenCacheTest(SimpleTestCase):
+
+    def make_link(self, seconds):
+        return CachedLink('images/original/test.png', 'image/png', '', timezone.now() + timedelta(seconds=seconds))
+
+    def test_least_recently_used_links_are_evicted(self):
+        cache = TokenCache(max_entries=2, ttl=60, negative_ttl=60)
+        cache.set('a', self.make_link(60))
+        cache.set('b', self.make_link(60))
+        cache.get('a')
+        cache.set('c', self.make_link(60))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_ttl_is_capped_at_expiration_time(self):
+        cache = TokenCache(max_entries=2, ttl=60, negative_ttl=60)
+        cache.set('a', self.make_link(-1))
+        self.assertIsNone(cache.get('a'))
+        with mock.patch('image_app.link_cache.time.monotonic', return_value=0):
+            cache.set('b', self.make_link(5))
+        with mock.patch('image_app.link_cache.time.monotonic', return_value=10):
+            self.assertIsNone(cache.get('b'))
+
+    def test_negative_entries_do_not_evict_links(self):
+        cache = TokenCache(max_entries=1, ttl=60, negative_ttl=60)
+        cache.set('a', self.make_link(60))
+        cache.set_missing('x')
+        cache.set_missing('y')
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIs(cache.get('y'), MISSING)
+        self.assertIsNone(cache.get('x'))
+
+
+class PurgeExpiredLinksCommandTest(TestCase):
+
+    def setUp(self):
+        self.image = Image.objects.create(original_image='images/original/test.png')
+        now = timezone.now()
+        for hours in (-3, -2, -1, 1):
+            ExpirationLink.objects.create(image=self.image, expiration_time=now + timedelta(hours=hours))
+        RevokedLink.objects.create(digest='a' * 32, expiration_time=now - timedelta(hours=1))
+        RevokedLink.objects.create(digest='b' * 32, expiration_time=now + timedelta(hours=1))
+
+    def test_purge_expired_links(self):
+        out = io.StringIO()
+        call_command('purge_expired_links', chunk_size=2, stdout=out)
+        self.assertEqual(ExpirationLink.objects.count(), 1)
+        self.assertTrue(ExpirationLink.objects.get().is_valid())
+        self.assertEqual(list(RevokedLink.objects.values_list('digest', flat=True)), ['b' * 32])
+        self.assertIn('Deleted 2 expiration links', out.getvalue())
+        self.assertIn('Done: 3 expiration links deleted', out.getvalue())
+
+    def test_schedule_purge(self):
+        call_command('purge_expired_links', schedule=3600, stdout=io.StringIO())
+        call_command('purge_expired_links', schedule=3600, stdout=io.StringIO())
+        job = Job.objects.get()
+        self.assertEqual(job.payload['interval'], 3600)
+
+        call_command('run_jobs', burst=True, stdout=io.StringIO())
+        self.assertEqual(ExpirationLink.objects.count(), 1)
+        next_job = Job.objects.get(status=Job.Status.QUEUED)
+        self.assertGreater(next_job.run_after, timezone.now() + timedelta(minutes=59))
+
+        # a running purge is not scheduled twice
+        Job.objects.update(status=Job.Status.RUNNING)
+        call_command('purge_expired_links', schedule=3600, stdout=io.StringIO())
+        self.assertEqual(Job.objects.count(), 2)
+
+    @override_settings(JOB_MAX_ATTEMPTS=3)
+    def test_failed_purge_is_rescheduled_once(self):
+        job = jobs.enqueue('purge_expired_links', interval=3600)
+        with mock.patch('image_app.tasks.purge', side_effect=RuntimeError), self.assertLogs('image_app.jobs', 'ERROR'):
+            for _ in range(3):
+                jobs.run(job)
+                # retries reuse the job instead of scheduling the next run
+                self.assertEqual(Job.objects.count(), 1 if job.status == Job.Status.QUEUED else 2)
+        self.assertEqual(job.status, Job.Status.FAILED)
+        self.assertEqual(Job.objects.filter(status=Job.Status.QUEUED).count(), 1)
+
+
+class LoadBenchmarkTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        get_plan_cache().clear()
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual((percentile(values, 50), percentile(values, 95), percentile(values, 99)), (50, 95, 99))
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertIsNone(percentile([], 50))
+
+    @override_settings(QUERY_COUNT_HEADERS=True)
+    def test_run_scenarios(self):
+        benchmark = LoadBenchmark(users=1, images=1, image_sizes=[(64, 48), (48, 64)], requests=4, concurrency=1,
+                                  warmup=1)
+        with mock.patch.object(APIView, 'throttle_classes', []):
+            benchmark.seed()
+            report = benchmark.run()
+        self.assertEqual(list(report['scenarios']), SCENARIOS)
+        for scenario, result in report['scenarios'].items():
+            self.assertEqual((result['requests'], result['errors']), (4, 0), scenario)
+            self.assertLessEqual(result['latency_ms']['p50'], result['latency_ms']['p99'])
+            self.assertIsNotNone(result['queries_per_request'])
+        self.assertEqual(Image.objects.filter(user__email__endswith='@bench.local').count(), 3 + 4 + 1)
+
+    def tearDown(self):
+        for image in Image.objects.all():
+            image.original_image.delete(save=False)
+
+
+class ThumbnailBenchTest(SimpleTestCase):
+
+    def test_cases(self):
+        variants = [Variant('LANCZOS', 'JPEG', 85), Variant('LANCZOS', 'PNG', None)]
+        cases = get_cases([Source(640, 480, 'JPEG')], variants)
+        self.assertEqual([case for case, _, _ in cases], ['640x480.jpeg/lanczos/jpeg-q85', '640x480.jpeg/lanczos/png'])
+
+    def test_run_case(self):
+        data = generate_image((120, 90))
+        variants = [Variant('LANCZOS', 'JPEG', 85), Variant('BILINEAR', 'WEBP', 80), Variant('LANCZOS', 'PNG', None)]
+        for variant in variants:
+            result = run_case(data, variant, heights=(30, 60), repeat=2, min_time=0)
+            for stage in ('decode', 'resize', 'encode', 'save', 'total'):
+                self.assertGreaterEqual(result[f'{stage}_ms'], 0, variant)
+            self.assertGreater(result['bytes'], 0)
+            self.assertGreater(result['peak_rss_kb'], 0)
+            self.assertGreater(result['calibration_ms'], 0)
+        lower = run_case(data, Variant('LANCZOS', 'JPEG', 20), heights=(60,), repeat=1, min_time=0)
+        higher = run_case(data, Variant('LANCZOS', 'JPEG', 95), heights=(60,), repeat=1, min_time=0)
+        self.assertLess(lower['bytes'], higher['bytes'])
+
+    def test_compare(self):
+        baseline = {'a': {'total_ms': 100.0, 'peak_rss_kb': 1000}, 'b': {'total_ms': 8.0, 'peak_rss_kb': 1000}}
+        results = {
+            'a': {'total_ms': 124.0, 'peak_rss_kb': 1099},
+            'b': {'total_ms': 16.0, 'peak_rss_kb': 1000},
+            'c': {'total_ms': 500.0, 'peak_rss_kb': 5000},
+        }
+        # within tolerance, below the noise floor and without a baseline
+        self.assertEqual(compare(results, baseline, 0.25, 0.1), [])
+        results['a'] = {'total_ms': 126.0, 'peak_rss_kb': 1101}
+        self.assertEqual(compare(results, baseline, 0.25, 0.1),
+                         ['a: 126.0ms, baseline 100.0ms', 'a: peak RSS 1101KB, baseline 1000KB'])
+        self.assertEqual(compare(results, baseline, 0.25, 0.1, min_time_ms=1.0)[-1], 'b: 16.0ms, baseline 8.0ms')
+
+        # a machine running twice as slow doubles the baseline
+        baseline['a']['calibration_ms'] = 10.0
+        results['a'] = {'total_ms': 240.0, 'peak_rss_kb': 1000, 'calibration_ms': 20.0}
+        self.assertEqual(compare(results, baseline, 0.25, 0.1), [])
+        results['a']['total_ms'] = 260.0
+        self.assertEqual(compare(results, baseline, 0.25, 0.1), ['a: 260.0ms, baseline 200.0ms'])
+        # and the spread of the baseline cases widens the tolerance of all of them
+        baseline['b']['noise_ms'] = 4.0
+        self.assertEqual(compare(results, baseline, 0.25, 0.1), [])
+        self.assertEqual(get_noise(baseline), 0.5)
+
+    def test_check_command(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        baseline = os.path.join(directory, 'benchmarks', 'thumbnails.json')
+        options = {'case': ['640x480.jpeg/bilinear/jpeg-q85'], 'repeat': 1, 'min_time': 0, 'samples': 2,
+                   'baseline': baseline, 'stdout': io.StringIO()}
+        with self.assertRaisesMessage(CommandError, 'Cannot read baseline'):
+            call_command('bench_thumbnails', check=True, **options)
+        call_command('bench_thumbnails', save_baseline=True, output=os.path.join(directory, 'report.json'), **options)
+        with open(baseline) as baseline_file:
+            self.assertEqual(list(json.load(baseline_file)['cases']), options['case'])
+        with open(baseline) as baseline_file:
+            saved = json.load(baseline_file)
+        self.assertIn('noise_ms', saved['cases'][options['case'][0]])
+        call_command('bench_thumbnails', check=True, time_tolerance=100, **options)
+        saved['cases'][options['case'][0]].update(peak_rss_kb=1000, rss_noise_kb=0)
+        with open(baseline, 'w') as baseline_file:
+            json.dump(saved, baseline_file)
+        with self.assertRaisesMessage(CommandError, '1 regressions'):
+            call_command('bench_thumbnails', check=True, time_tolerance=100, stderr=io.StringIO(), **options)
@@ -0,0 +1,220 @@
+"""
+Microbenchmarks of the thumbnail engine over a fixed corpus of synthetic images.
+
+Every case renders the thumbnail heights of one corpus image with one resample filter, output format and quality,
+and times the decode, resize, encode and save stages separately. Cases run in a fresh process each, so the peak
+resident set size of a case is not hidden by the high-water mark of earlier cases.
+"""
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from PIL import Image as img
+
+from image_app import thumbnail_engine
+
+Source = namedtuple('Source', ['width', 'height', 'format'])
+Variant = namedtuple('Variant', ['resample', 'format', 'quality'])
+
+CORPUS = [
+    Source(640, 480, 'JPEG'),
+    Source(1920, 1080, 'JPEG'),
+    Source(4000, 3000, 'JPEG'),
+    Source(1920, 1080, 'PNG'),
+]
+
+# the default rendering first, then one parameter changed at a time
+VARIANTS = [
+    Variant('LANCZOS', 'JPEG', 85),
+    Variant('BICUBIC', 'JPEG', 85),
+    Variant('BILINEAR', 'JPEG', 85),
+    Variant('LANCZOS', 'JPEG', 75),
+    Variant('LANCZOS', 'JPEG', 95),
+    Variant('LANCZOS', 'WEBP', 80),
+    Variant('LANCZOS', 'PNG', None),
+]
+
+HEIGHTS = (200, 400)
+STAGES = ('decode', 'resize', 'encode', 'save')
+CALIBRATION_SIZE = (1024, 768)
+
+
+def case_id(source, variant):
+    quality = f'-q{variant.quality}' if variant.quality is not None else ''
+    return f'{source.width}x{source.height}.{source.format.lower()}/{variant.resample.lower()}/' \
+           f'{variant.format.lower()}{quality}'
+
+
+def get_cases(corpus=CORPUS, variants=VARIANTS):
+    return [(case_id(source, variant), source, variant) for source in corpus for variant in variants]
+
+
+def peak_rss_kb():
+    # ru_maxrss survives fork and exec on Linux, a spawned process would report the peak of its parent,
+    # the high-water mark of /proc belongs to the address space of this process only
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def calibrate(min_time=0.2):
+    """
+    Return the fastest milliseconds of a fixed resize and encode, the speed of the machine at the moment.
+
+    Shared and virtual machines change speed over minutes, case times are compared relative to it.
+    """
+    image = img.effect_mandelbrot(CALIBRATION_SIZE, (-2.0, -1.25, 0.75, 1.25), 100).convert('RGB')
+    timings = []
+    measured_from = time.perf_counter()
+    while len(timings) < 5 or time.perf_counter() - measured_from < min_time:
+        started = time.perf_counter()
+        thumbnail_engine.encode(image.resize((400, 300), img.Resampling.LANCZOS), 'JPEG', 85)
+        timings.append(time.perf_counter() - started)
+    return round(min(timings) * 1000, 3)
+
+
+def run_case(data, variant, heights=HEIGHTS, repeat=5, min_time=0.2):
+    """
+    Render the heights of an encoded corpus image at least `repeat` times and for at least `min_time` seconds
+    and return the fastest milliseconds of every stage, the total output bytes and the peak RSS of the process
+    in kilobytes.
+
+    Like timeit the minimum is reported, other load on the machine only ever adds time. Small images are
+    rendered many more times than `repeat` within `min_time`, the fastest of a few runs of a case taking
+    milliseconds is mostly noise. An unmeasured first run loads the codecs.
+    """
+    resample = img.Resampling[variant.resample]
+    heights = sorted(heights, reverse=True)
+    timings = {stage: [] for stage in STAGES}
+    output_bytes = 0
+    directory = tempfile.mkdtemp(prefix='thumbnail-bench-')
+    run = 0
+    measured_from = None
+    try:
+        while run <= repeat or time.perf_counter() - measured_from < min_time:
+            started = time.perf_counter()
+            with img.open(BytesIO(data)) as im:
+                original_size = im.size
+                decoded = thumbnail_engine.decode(im, heights[0])
+                decoded_at = time.perf_counter()
+                levels = thumbnail_engine.resize_levels(decoded, original_size, heights, resample)
+            resized_at = time.perf_counter()
+            quality = variant.quality or thumbnail_engine.JPEG_QUALITY
+            encoded = [thumbnail_engine.encode(level, variant.format, quality) for _, level in levels]
+            encoded_at = time.perf_counter()
+            for (height, _), thumbnail in zip(levels, encoded):
+                with open(os.path.join(directory, f'{run}_{height}'), 'wb') as file:
+                    file.write(thumbnail)
+            saved_at = time.perf_counter()
+
+            run += 1
+            if measured_from is None:
+                measured_from = time.perf_counter()
+                continue
+            timings['decode'].append(decoded_at - started)
+            timings['resize'].append(resized_at - decoded_at)
+            timings['encode'].append(encoded_at - resized_at)
+            timings['save'].append(saved_at - encoded_at)
+            output_bytes = sum(len(thumbnail) for thumbnail in encoded)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    result = {f'{stage}_ms': round(min(timings[stage]) * 1000, 3) for stage in STAGES}
+    result['total_ms'] = round(sum(result[f'{stage}_ms'] for stage in STAGES), 3)
+    result['bytes'] = output_bytes
+    result['peak_rss_kb'] = peak_rss_kb()
+    result['calibration_ms'] = calibrate(min_time)
+    return result
+
+
+def merge_samples(samples):
+    """
+    Return the fastest of the results of a case measured several times, with the spread of its total time in
+    `noise_ms` and of its peak RSS in `rss_noise_kb`
+    """
+    result = dict(min(samples, key=lambda sample: sample['total_ms']))
+    totals = [sample['total_ms'] for sample in samples]
+    peaks = [sample['peak_rss_kb'] for sample in samples]
+    result['peak_rss_kb'] = min(peaks)
+    result['calibration_ms'] = min(sample['calibration_ms'] for sample in samples)
+    result['noise_ms'] = round(max(totals) - min(totals), 3)
+    result['rss_noise_kb'] = max(peaks) - min(peaks)
+    return result
+
+
+def run_cases(cases, images, heights=HEIGHTS, repeat=5, min_time=0.2, samples=3):
+    """
+    Return {case id: result} of the cases, each one measured in its own spawned process `samples` times.
+
+    Load on shared machines changes over seconds, which more runs in one process do not average out. The
+    cases are measured in `samples` passes over all of them instead, see `merge_samples`. `images` maps
+    every source of the cases to its encoded bytes, they are generated by the caller so the peak RSS of
+    a case only covers rendering.
+    """
+    measured = {case: [] for case, _, _ in cases}
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context, max_tasks_per_child=1) as executor:
+        for _ in range(samples):
+            for case, source, variant in cases:
+                measured[case].append(
+                    executor.submit(run_case, images[source], variant, heights, repeat, min_time).result())
+    return {case: merge_samples(results) for case, results in measured.items()}
+
+
+def get_speed(results):
+    # the fastest calibration of a run, single calibrations vary as much as the cases
+    calibrations = [result['calibration_ms'] for result in results.values() if result.get('calibration_ms')]
+    return min(calibrations) if calibrations else None
+
+
+def get_noise(baseline):
+    """
+    Return the largest spread of the total time of a baseline case relative to its time.
+
+    The spread of a single case over a few passes underestimates the noise of the machine, cases of similar
+    time vary from a tenth to more than half of it on a shared machine.
+    """
+    return max((result['noise_ms'] / result['total_ms'] for result in baseline.values()
+                if result.get('noise_ms') and result['total_ms']), default=0)
+
+
+def compare(results, baseline, time_tolerance, memory_tolerance, min_time_ms=10.0):
+    """
+    Return messages of the cases regressing against the baseline.
+
+    A case regresses when its total time grows by more than `time_tolerance` (a fraction of the baseline),
+    the noise of the baseline machine (see `get_noise`) and `min_time_ms`, or its peak RSS by more than
+    `memory_tolerance` and its `rss_noise_kb`. The baseline times are scaled by the calibration times of
+    both runs, so a machine running slower than when the baseline was saved does not fail every case.
+    Cases missing from either side are not compared.
+    """
+    speed, baseline_speed = get_speed(results), get_speed(baseline)
+    scale = speed / baseline_speed if speed and baseline_speed else 1
+    tolerance = max(time_tolerance, get_noise(baseline))
+    regressions = []
+    for case, result in results.items():
+        expected = baseline.get(case)
+        if expected is None:
+            continue
+        expected_ms = expected['total_ms'] * scale
+        growth = result['total_ms'] - expected_ms
+        if growth > max(expected_ms * tolerance, min_time_ms):
+            regressions.append(f"{case}: {result['total_ms']:.1f}ms, baseline {expected_ms:.1f}ms")
+        growth = result['peak_rss_kb'] - expected['peak_rss_kb']
+        if growth > max(expected['peak_rss_kb'] * memory_tolerance, expected.get('rss_noise_kb', 0)):
+            regressions.append(f"{case}: peak RSS {result['peak_rss_kb']}KB, baseline {expected['peak_rss_kb']}KB")
+    return regressions
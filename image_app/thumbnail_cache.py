@@ -0,0 +1,109 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+
+
+class ThumbnailCache:
+    """
+    Disk cache of rendered thumbnails with least recently used eviction under a byte budget.
+
+    Entries are files named after the hash of their key. Reading an entry refreshes its modification time,
+    which is the recency used by eviction, so the cache can be shared by every process on the host.
+    Eviction goes down to `low_water` of the budget, so a full cache is not scanned again on every miss.
+    """
+
+    def __init__(self, root, max_bytes, low_water=0.9):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self._size = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(*parts):
+        return hashlib.sha256('\0'.join(str(part) for part in parts).encode()).hexdigest()
+
+    def path(self, key, extension):
+        return os.path.join(self.root, key[:2], f'{key}{extension}')
+
+    def get(self, key, extension):
+        """
+        Return the path of a cached entry or None, a hit marks the entry as recently used
+        """
+        path = self.path(key, extension)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, extension, data):
+        """
+        Atomically store an entry and evict the least recently used entries over the budget
+        """
+        path = self.path(key, extension)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._size = self.evict()
+        return path
+
+    def _entries(self):
+        for directory in os.scandir(self.root):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits in the low-water mark of the budget, returns the
+        remaining size
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * self.low_water
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
+
+
+_caches = {}
+
+
+def get_thumbnail_cache():
+    """
+    Return the cache configured by THUMBNAIL_CACHE_ROOT and THUMBNAIL_CACHE_MAX_BYTES settings
+    """
+    root = settings.THUMBNAIL_CACHE_ROOT
+    max_bytes = settings.THUMBNAIL_CACHE_MAX_BYTES
+    if (root, max_bytes) not in _caches:
+        _caches[(root, max_bytes)] = ThumbnailCache(root, max_bytes)
+    return _caches[(root, max_bytes)]
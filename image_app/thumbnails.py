@@ -0,0 +1,251 @@
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+from image_app import blobs, list_cache, thumbnail_engine
+from image_app.metadata import read_metadata
+from image_app.models import Image, Thumbnail
+from image_app.thumbnail_cache import get_thumbnail_cache
+
+IMAGE_FORMATS = {
+    '.jpeg': 'JPEG',
+    '.png': 'PNG',
+    '.webp': 'WEBP',
+    '.avif': 'AVIF',
+}
+
+FORMAT_EXTENSIONS = {image_format: extension for extension, image_format in IMAGE_FORMATS.items()}
+
+CONTENT_TYPES = {
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.webp': 'image/webp',
+    '.avif': 'image/avif',
+}
+
+QUALITY_SETTINGS = {
+    'JPEG': ('THUMBNAIL_JPEG_QUALITY', thumbnail_engine.JPEG_QUALITY),
+    'WEBP': ('THUMBNAIL_WEBP_QUALITY', 80),
+    'AVIF': ('THUMBNAIL_AVIF_QUALITY', 60),
+}
+
+
+def get_image_extension(filename):
+    """
+    Return normalized lowercase extension of the file, `.jpg` is stored as `.jpeg`
+    """
+    image_extension = os.path.splitext(filename)[1].lower()
+    if image_extension == '.jpg':
+        image_extension = '.jpeg'
+    return image_extension
+
+
+def get_quality(image_format):
+    setting, default = QUALITY_SETTINGS.get(image_format, ('THUMBNAIL_JPEG_QUALITY', thumbnail_engine.JPEG_QUALITY))
+    return getattr(settings, setting, default)
+
+
+def get_source_format(image_obj):
+    image_extension = get_image_extension(image_obj.original_image.name)
+    return IMAGE_FORMATS.get(image_extension, image_extension.replace('.', '').upper())
+
+
+def render_thumbnails(source, thumbnail_sizes, image_extension, workers=None, variant_formats=(), quality=None):
+    """
+    Render thumbnails with the engine configured by THUMBNAIL_ENGINE_* settings, `workers` overrides the pool size.
+
+    Every size is rendered in the format of the `image_extension` and in each of `variant_formats`. `quality`
+    overrides the quality settings of the lossy formats.
+    """
+    if workers is None:
+        workers = getattr(settings, 'THUMBNAIL_ENGINE_WORKERS', None)
+    image_format = IMAGE_FORMATS.get(image_extension, image_extension.replace('.', '').upper())
+    return thumbnail_engine.render(
+        source,
+        thumbnail_sizes,
+        image_format,
+        quality=quality or get_quality(image_format),
+        workers=workers,
+        parallel_min_pixels=getattr(settings, 'THUMBNAIL_ENGINE_PARALLEL_MIN_PIXELS', 0),
+        variants=[(variant, quality or get_quality(variant)) for variant in variant_formats if variant != image_format],
+    )
+
+
+def thumbnail_specs(image_obj, plan):
+    """
+    Return (height, format) pairs of the thumbnails of an image rendered at upload by the tier plan.
+
+    Every eager height is stored in the format of the original and in each variant format of the height
+    Pillow can encode, formats other than VARIANT_FORMATS are ignored.
+    """
+    source_format = get_source_format(image_obj)
+    specs = []
+    for height in plan.eager_heights:
+        variants = [image_format for image_format in plan.formats(height)
+                    if image_format != source_format and image_format in thumbnail_engine.VARIANT_FORMATS
+                    and thumbnail_engine.is_supported(image_format)]
+        specs.extend((height, image_format) for image_format in [source_format, *variants])
+    return specs
+
+
+def thumbnail_names(image_obj, specs, plan=None):
+    """
+    Return {(height, format): storage name} of the thumbnails, addressed by content hash of the original,
+    height, quality of the tier plan and format
+    """
+    return {(height, image_format): blobs.thumbnail_name(image_obj.checksum, height, FORMAT_EXTENSIONS[image_format],
+                                                         plan.quality(height) if plan else None)
+            for height, image_format in specs}
+
+
+def ensure_checksum(image_obj):
+    """
+    Compute and store the checksum of an original uploaded before checksums were recorded
+    """
+    if not image_obj.checksum:
+        with image_obj.original_image.open('rb') as original:
+            image_obj.checksum = read_metadata(original)['checksum']
+        Image.objects.filter(pk=image_obj.pk).update(checksum=image_obj.checksum)
+
+
+def missing_thumbnail_specs(image_obj, specs, plan=None):
+    """
+    Return the (height, format) pairs of thumbnails whose blob is not stored yet
+    """
+    ensure_checksum(image_obj)
+    names = thumbnail_names(image_obj, specs, plan)
+    existing = blobs.stored(names.values())
+    return [spec for spec in specs if names[spec] not in existing]
+
+
+def render_original(image_obj, specs, source=None, workers=None, plan=None):
+    """
+    Render thumbnails of the (height, format) pairs from `source`, an optional file object with the original,
+    or the stored original.
+
+    Heights sharing the quality of the tier plan are rendered from one decode of the original.
+    """
+    image_extension = get_image_extension(image_obj.original_image.name)
+    groups = {}
+    for height, image_format in specs:
+        heights, variant_formats = groups.setdefault(plan.quality(height) if plan else None, (set(), set()))
+        heights.add(height)
+        variant_formats.add(image_format)
+
+    def render(original):
+        rendered = []
+        for quality, (heights, variant_formats) in groups.items():
+            original.seek(0)
+            rendered.extend(render_thumbnails(original, sorted(heights), image_extension, workers,
+                                              sorted(variant_formats), quality))
+        return rendered
+
+    if source is None:
+        with image_obj.original_image.open('rb') as original:
+            return render(original)
+    return render(source)
+
+
+def build_thumbnails(image_obj, specs, rendered_thumbnails=(), existing=None, plan=None):
+    """
+    Reference the thumbnail blobs of the (height, format) pairs and return unsaved Thumbnail objects.
+
+    Blobs stored for an identical original are reused, new blobs are written from `rendered_thumbnails`.
+    A blob deleted after the thumbnails were rendered is rendered again from the stored original.
+    `existing` is the result of a `blobs.acquire` call the caller made for the thumbnails, they are
+    acquired here otherwise.
+    """
+    ensure_checksum(image_obj)
+    names = thumbnail_names(image_obj, specs, plan)
+    storage = Thumbnail.thumbnail.field.storage
+    if existing is None:
+        existing = blobs.acquire(names.values())
+    rendered = {(thumbnail.height, thumbnail.format): thumbnail for thumbnail in rendered_thumbnails}
+    missing = [spec for spec in specs
+               if spec not in rendered and (names[spec] not in existing or not storage.exists(names[spec]))]
+    if missing:
+        rendered.update(((thumbnail.height, thumbnail.format), thumbnail)
+                        for thumbnail in render_original(image_obj, missing, plan=plan))
+    for spec, thumbnail in rendered.items():
+        if spec in names:
+            blobs.write(storage, names[spec], ContentFile(thumbnail.data))
+
+    image_name = os.path.splitext(os.path.basename(image_obj.original_image.name))[0]
+    return [Thumbnail(name=f'{image_name}_thumbnail_{height}{FORMAT_EXTENSIONS[image_format]}', image=image_obj,
+                      height=height, format=image_format, thumbnail=names[(height, image_format)])
+            for height, image_format in specs]
+
+
+def save_thumbnails(image_obj, thumbnails):
+    """
+    Insert the Thumbnail objects of the image with one query
+    """
+    if thumbnails:
+        Thumbnail.objects.bulk_create(thumbnails)
+        # bulk_create sends no post_save, the image list of the owner is invalidated here
+        list_cache.bump_version(image_obj.user_id)
+
+
+def store_thumbnails(image_obj, specs, rendered_thumbnails=(), plan=None):
+    """
+    Save thumbnails of the (height, format) pairs as Thumbnail objects, see `build_thumbnails`
+    """
+    with transaction.atomic(savepoint=False):
+        thumbnails = build_thumbnails(image_obj, specs, rendered_thumbnails, plan=plan)
+        save_thumbnails(image_obj, thumbnails)
+    return thumbnails
+
+
+def create_thumbnails(image_obj, plan, source=None):
+    """
+    Create the thumbnails a tier plan renders at upload for the image and store them as Thumbnail objects.
+
+    Parameters:
+    - image_obj: Image instance the thumbnails belong to.
+    - plan: TierPlan of the account tier, see `AccountTier.get_plan`.
+    - source: Optional file object with the original image, defaults to the stored original.
+
+    Thumbnails already stored for an identical original are reused without rendering them. Lazy sizes
+    of the plan are rendered on request by `get_cached_thumbnail`.
+    """
+    ensure_checksum(image_obj)
+    specs = thumbnail_specs(image_obj, plan)
+    names = thumbnail_names(image_obj, specs, plan)
+    storage = Thumbnail.thumbnail.field.storage
+    with transaction.atomic(savepoint=False):
+        existing = blobs.acquire(names.values())
+        missing = [spec for spec in specs if names[spec] not in existing or not storage.exists(names[spec])]
+        rendered_thumbnails = render_original(image_obj, missing, source, plan=plan) if missing else []
+        thumbnails = build_thumbnails(image_obj, specs, rendered_thumbnails, existing=existing, plan=plan)
+        save_thumbnails(image_obj, thumbnails)
+    return thumbnails
+
+
+def get_cached_thumbnail(image_obj, height, image_format=None, quality=None):
+    """
+    Return (path, content type) of the thumbnail from the disk cache, the thumbnail is rendered on a miss.
+
+    The thumbnail is encoded in `image_format`, by default the format of the original, with `quality`
+    overriding the quality settings. The cache key is
+    derived from the checksum of the original and the render options, so replacing the original
+    or changing the quality never serves a stale thumbnail. Originals without a stored checksum
+    are identified by their name, size and modification time.
+    """
+    name = image_obj.original_image.name
+    image_extension = FORMAT_EXTENSIONS[image_format] if image_format else get_image_extension(name)
+    if image_obj.checksum:
+        source_key = (image_obj.checksum,)
+    else:
+        storage = image_obj.original_image.storage
+        source_key = (name, storage.size(name), storage.get_modified_time(name).timestamp())
+    quality = quality or get_quality(IMAGE_FORMATS.get(image_extension, image_extension.replace('.', '').upper()))
+    cache = get_thumbnail_cache()
+    key = cache.make_key(*source_key, image_extension, height, quality)
+    path = cache.get(key, image_extension)
+    if path is None:
+        with image_obj.original_image.open('rb') as original:
+            rendered = render_thumbnails(original, [height], image_extension, quality=quality)[0]
+        path = cache.put(key, image_extension, rendered.data)
+    return path, CONTENT_TYPES.get(image_extension, 'application/octet-stream')
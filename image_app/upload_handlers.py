@@ -0,0 +1,163 @@
+import hashlib
+import io
+import os
+import warnings
+
+import magic
+from django.conf import settings
+from django.core.files.uploadhandler import SkipFile, StopUpload, TemporaryFileUploadHandler
+from PIL import Image as img
+
+ALLOWED_CONTENT_TYPES = {
+    'image/jpeg': ('JPEG', '.jpeg'),
+    'image/png': ('PNG', '.png'),
+}
+EXTENSION_ALIASES = {'.jpg': '.jpeg'}
+
+
+def read_image_header(data):
+    """
+    Return (format, (width, height)) of an image from its first bytes or None if the header is incomplete.
+
+    Only the header is parsed, the pixels are not decoded.
+    """
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', img.DecompressionBombWarning)
+            with img.open(io.BytesIO(data)) as im:
+                return im.format, im.size
+    except img.DecompressionBombError:
+        raise
+    except Exception:
+        return None
+
+
+def normalize_file_name(file_name, content_type):
+    """
+    Return the file name with an extension matching the detected content type
+    """
+    stem, extension = os.path.splitext(file_name)
+    extension = extension.lower()
+    expected_extension = ALLOWED_CONTENT_TYPES[content_type][1]
+    if EXTENSION_ALIASES.get(extension, extension) != expected_extension:
+        return stem + expected_extension
+    return file_name
+
+
+class ImageSniffer:
+    """
+    Check the beginning of an image file fed in consecutive chunks.
+
+    The content type is sniffed from the magic bytes of the first chunk and the image header is parsed from
+    at most UPLOAD_HEADER_MAX_BYTES to check the dimensions against UPLOAD_MAX_PIXELS.
+    """
+
+    def __init__(self):
+        self.max_pixels = getattr(settings, 'UPLOAD_MAX_PIXELS', 50_000_000)
+        self.header_max_bytes = getattr(settings, 'UPLOAD_HEADER_MAX_BYTES', 1024 * 1024)
+        self.header = b''
+        self.content_type = None
+        self.image_format = None
+
+    @property
+    def done(self):
+        return self.image_format is not None
+
+    def feed(self, data):
+        """
+        Return the reason to reject the file or None
+        """
+        if self.content_type is None:
+            content_type = magic.from_buffer(data, mime=True)
+            if content_type not in ALLOWED_CONTENT_TYPES:
+                return 'File type not allowed'
+            self.content_type = content_type
+        self.header += data[:self.header_max_bytes - len(self.header)]
+        try:
+            header = read_image_header(self.header)
+        except img.DecompressionBombError:
+            return 'Image dimensions too large'
+        if header is None:
+            if len(self.header) >= self.header_max_bytes:
+                return 'Incorrect file'
+            return None
+        image_format, (width, height) = header
+        if image_format != ALLOWED_CONTENT_TYPES[self.content_type][0]:
+            return 'Incorrect file'
+        if width * height > self.max_pixels:
+            return 'Image dimensions too large'
+        self.image_format = image_format
+        self.header = b''
+        return None
+
+    def complete(self):
+        """
+        Return the reason to reject the file once all of it was fed or None
+        """
+        return None if self.done else 'Incorrect file'
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Upload handler streaming image uploads to a temporary file and rejecting them as early as possible.
+
+    Every upload is checked by ImageSniffer while it is streamed and uploads over UPLOAD_MAX_FILE_SIZE are
+    cut off. The rest of a rejected upload is not read: a file over the size limit stops reading the request,
+    other rejections skip the rest of the file when `skip_rejected` is set, otherwise they stop reading the
+    request as well. The extension of accepted files is normalized to their real type and the SHA-256 checksum
+    of accepted files is computed while they stream in and set as their `checksum` attribute.
+
+    Rejected files are missing from request.FILES, `uploads` lists every file of the request in order with
+    rejected files empty and the reason in their `upload_error` attribute.
+    """
+
+    def __init__(self, request=None, skip_rejected=False):
+        super().__init__(request)
+        self.max_file_size = getattr(settings, 'UPLOAD_MAX_FILE_SIZE', 20 * 1024 * 1024)
+        self.skip_rejected = skip_rejected
+        self.uploads = []
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file.field_name = self.field_name
+        self.file.upload_error = None
+        self.sniffer = ImageSniffer()
+        self.digest = hashlib.sha256()
+        if self.content_length is not None and self.content_length > self.max_file_size:
+            self.reject('File too large', stop=True)
+
+    def reject(self, error, stop=False):
+        self.file.upload_error = error
+        self.file.seek(0)
+        self.file.truncate()
+        self.uploads.append(self.file)
+        if stop or not self.skip_rejected:
+            # the client is still sending, the connection is closed instead of reading the rest of the body
+            raise StopUpload(connection_reset=True)
+        raise SkipFile()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_file_size:
+            self.reject('File too large', stop=True)
+        if not self.sniffer.done:
+            error = self.sniffer.feed(raw_data)
+            if error is not None:
+                self.reject(error)
+        self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        error = self.sniffer.complete()
+        if error is not None:
+            # the whole file was read already, it is returned empty with the reason
+            self.file.upload_error = error
+            self.file.seek(0)
+            self.file.truncate()
+            file_size = 0
+        else:
+            self.file.content_type = self.sniffer.content_type
+            self.file.checksum = self.digest.hexdigest()
+            self.file.name = normalize_file_name(self.file_name, self.sniffer.content_type)
+        file = super().file_complete(file_size)
+        self.uploads.append(file)
+        return file
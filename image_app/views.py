@@ -0,0 +1,65 @@
+import mimetypes
+import os
+import re
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import Http404
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import require_safe
+
+from image_app.delivery import StoredFile, file_response
+from image_app.models import Thumbnail
+from image_app.negotiation import choose_format
+from image_app.thumbnail_engine import VARIANT_FORMATS
+
+THUMBNAIL_PATH_PATTERN = re.compile(r'^images/thumbnails/[0-9a-f]{2}/[0-9a-f]{64}_\d+(_q\d+)?\.[a-z]+$')
+VARIANT_EXTENSIONS = {'AVIF': '.avif', 'WEBP': '.webp'}
+
+
+def negotiate_variant(request, path):
+    """
+    Return the path of a stored variant of a thumbnail in a format the client accepts or None
+    """
+    if choose_format(request) is None:
+        return None
+    stem = os.path.splitext(path)[0]
+    stored_formats = [image_format for image_format in VARIANT_FORMATS
+                      if default_storage.exists(stem + VARIANT_EXTENSIONS[image_format])]
+    image_format = choose_format(request, stored_formats)
+    return stem + VARIANT_EXTENSIONS[image_format] if image_format else None
+
+
+def is_public(path):
+    """
+    Return whether the path is a stored thumbnail
+    """
+    if THUMBNAIL_PATH_PATTERN.match(path) is not None:
+        return True
+    # thumbnails created before content addressing keep their legacy names
+    return Thumbnail.objects.filter(thumbnail=path).exists()
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Serve thumbnails with Range and conditional request support.
+
+    Replaces `django.views.static.serve`, which only works with DEBUG enabled. Only the thumbnails tree is
+    public, originals are delivered by the original and expiring link views which check access to them.
+    Thumbnails are served in a stored WebP or AVIF variant when the Accept header of the client lists its
+    media type.
+    """
+    if not is_public(path):
+        raise Http404('File not found')
+    try:
+        if not default_storage.exists(path):
+            raise Http404('File not found')
+    except SuspiciousFileOperation:
+        raise Http404('File not found')
+    path = negotiate_variant(request, path) or path
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    response = file_response(request, StoredFile(default_storage, path), content_type,
+                             cache_control='public, max-age=86400')
+    patch_vary_headers(response, ['Accept'])
+    return response
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from user_app.models import User, AccountTier
+from user_app.models import User, AccountTier, ThumbnailSize
 
 fields = list(UserAdmin.fieldsets)
 fields[0] = ('Login info', {'fields': ('email', 'password')})
@@ -8,4 +8,13 @@ fields[1] = ('Personal info', {'fields': ('first_name', 'last_name', 'username',
 UserAdmin.fieldsets = tuple(fields)
 
 admin.site.register(User, UserAdmin)
-admin.site.register(AccountTier)
+
+
+class ThumbnailSizeInline(admin.TabularInline):
+    model = ThumbnailSize
+    extra = 1
+
+
+@admin.register(AccountTier)
+class AccountTierAdmin(admin.ModelAdmin):
+    inlines = [ThumbnailSizeInline]
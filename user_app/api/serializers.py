@@ -1,8 +1,11 @@
 from rest_framework import serializers
 from user_app.models import User, AccountTier
 import django.contrib.auth.password_validation as validators
+from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.core import exceptions
 from rest_framework.exceptions import ValidationError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from user_app.authentication import ClaimsRefreshToken
 
 
 class RegistrationSerializer(serializers.ModelSerializer):
@@ -50,8 +53,41 @@ class RegistrationSerializer(serializers.ModelSerializer):
         return account
 
 
+class ProvisionUserSerializer(serializers.Serializer):
+    """
+    Row of a bulk provisioning file, uniqueness is checked for all rows of a chunk at once
+    """
+    email = serializers.EmailField(max_length=254)
+    username = serializers.CharField(max_length=150, required=False, allow_blank=True, allow_null=True,
+                                     validators=[UnicodeUsernameValidator()])
+    password = serializers.CharField(required=False, allow_blank=True, allow_null=True, trim_whitespace=False)
+    first_name = serializers.CharField(max_length=32, required=False, allow_blank=True, allow_null=True)
+    last_name = serializers.CharField(max_length=32, required=False, allow_blank=True, allow_null=True)
+    account_tier = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+    def validate_password(self, value):
+        if value:
+            try:
+                validators.validate_password(password=value)
+            except exceptions.ValidationError as e:
+                raise serializers.ValidationError(list(e.messages))
+        return value
+
+    def validate(self, attrs):
+        # the email is the username of rows without one
+        max_length = User._meta.get_field('username').max_length
+        if not attrs.get('username') and len(attrs['email']) > max_length:
+            raise serializers.ValidationError(
+                {'username': f'Required for emails longer than {max_length} characters'})
+        return attrs
+
+
 class UserSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = User
         exclude = ('id',)
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = ClaimsRefreshToken
@@ -1,7 +1,8 @@
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from django.urls import path
+from .views import LoginView, RefreshView, UserProvisionView
 
 urlpatterns = [
-    path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh')
+    path('api/token/', LoginView.as_view(), name='token_obtain_pair'),
+    path('api/token/refresh/', RefreshView.as_view(), name='token_refresh'),
+    path('api/users/bulk/', UserProvisionView.as_view(), name='user_provision'),
 ]
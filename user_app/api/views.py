@@ -1,3 +1,81 @@
-from django.shortcuts import render
+import os
 
-# Create your views here.
+from django.conf import settings
+from rest_framework import status
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+
+from user_app.api.serializers import ClaimsTokenObtainPairSerializer
+from user_app.models import AccountTier
+from user_app.provisioning import chunked, get_file_format, provision_users, read_rows
+
+
+class LoginView(TokenObtainPairView):
+    """
+    Obtain an access and refresh token pair.
+
+    Parameters:
+    - email: Email of the user.
+    - password: Password of the user.
+
+    The tokens carry the account tier and flags of the user for ClaimsJWTAuthentication.
+    """
+    serializer_class = ClaimsTokenObtainPairSerializer
+    query_budget = 1
+
+
+class RefreshView(TokenRefreshView):
+    """
+    Obtain a new access token.
+
+    Parameters:
+    - refresh: Valid refresh token.
+    """
+    query_budget = 0
+
+
+class UserProvisionView(APIView):
+    """
+    Create many users from an uploaded CSV or JSONL file, available to admins.
+
+    Parameters:
+    - file: CSV or JSONL file with `email` and optional `username`, `password`, `first_name`, `last_name`
+      and `account_tier` of every user.
+    - account_tier: Optional name of the account tier of rows without one, defaults to Basic.
+
+    The response holds the number of `created` users and the `errors` of the skipped rows.
+    """
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser]
+    # account tiers, then an existence check and an insert per PROVISIONING_CHUNK_SIZE of PROVISIONING_MAX_ROWS rows
+    query_budget = 12
+
+    def post(self, request):
+        file = request.FILES.get('file')
+        if file is None:
+            return Response({'error': 'File not uploaded'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            file_format = get_file_format(file.name)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        account_tier = None
+        if request.data.get('account_tier'):
+            account_tier = AccountTier.objects.filter(name=request.data['account_tier']).first()
+            if account_tier is None:
+                return Response({'error': 'Account tier does not exist'}, status=status.HTTP_400_BAD_REQUEST)
+
+        max_rows = getattr(settings, 'PROVISIONING_MAX_ROWS', 5000)
+        rows = next(chunked(read_rows(file, file_format), max_rows + 1), [])
+        if len(rows) > max_rows:
+            return Response({'error': f'At most {max_rows} users can be provisioned at once'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # the hashing processes are started for the request, few of them leave the other requests some CPU
+        workers = min(getattr(settings, 'PROVISIONING_WORKERS', os.cpu_count() or 1),
+                      getattr(settings, 'PROVISIONING_HTTP_WORKERS', 2))
+        report = provision_users(rows, account_tier, workers=workers)
+        response_status = status.HTTP_201_CREATED if report.created else status.HTTP_400_BAD_REQUEST
+        return Response(report.as_dict(), status=response_status)
@@ -0,0 +1,118 @@
+import threading
+
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from user_app.models import AccountTier, ClaimsUser
+from user_app.tiers import TIERS_VERSION_KEY, get_cache
+
+TIER_CLAIM = 'tier'
+ACTIVE_CLAIM = 'active'
+STAFF_CLAIM = 'staff'
+
+USER_STATE_KEY = 'auth_user_state:{}'
+
+
+def get_user_state(user):
+    return (user.account_tier_id, user.is_active, user.is_staff)
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """
+    Refresh token carrying the account tier, active and staff flags of the user, access tokens copy them
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token[TIER_CLAIM], token[ACTIVE_CLAIM], token[STAFF_CLAIM] = get_user_state(user)
+        return token
+
+
+class TierCache:
+    """
+    In-process cache of AccountTier rows invalidated by a version number in the shared cache.
+
+    Saving or deleting a tier bumps the version, every process drops its tiers on its next lookup.
+    """
+
+    def __init__(self):
+        self._tiers = {}
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self, tier_id, version):
+        with self._lock:
+            if version != self._version:
+                self._tiers.clear()
+                self._version = version
+            tier = self._tiers.get(tier_id)
+        if tier is None:
+            tier = AccountTier.objects.filter(pk=tier_id).first()
+            with self._lock:
+                if version == self._version:
+                    self._tiers[tier_id] = tier
+        return tier
+
+    def clear(self):
+        with self._lock:
+            self._tiers.clear()
+            self._version = None
+
+
+_tier_cache = TierCache()
+
+
+def get_tier_cache():
+    return _tier_cache
+
+
+def set_user_state(user_id, state, replace=True):
+    """
+    Override the claims of the user's tokens until all of them expired, with `replace` unset a state stored
+    meanwhile is kept
+    """
+    lifetime = max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME)
+    store = get_cache().set if replace else get_cache().add
+    store(USER_STATE_KEY.format(user_id), state, int(lifetime.total_seconds()))
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication building the user from the claims of the token instead of loading it.
+
+    The user is a ClaimsUser with only its id, account tier, active and staff flags set, the account tier
+    comes from the in-process TierCache. The state of the user is kept in the shared cache, saving or
+    deleting a user replaces it, so a request costs one cache lookup and no queries. When the state is not
+    cached, because it was never stored or was evicted, the user is loaded once and its state cached again,
+    the claims of a token are never trusted on their own. Tokens issued without the claims always load the
+    user.
+    """
+
+    def get_user(self, validated_token):
+        if TIER_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise AuthenticationFailed(_('Token contained no recognizable user identification'))
+
+        state_key = USER_STATE_KEY.format(user_id)
+        cached = get_cache().get_many([TIERS_VERSION_KEY, state_key])
+        state = cached.get(state_key)
+        if state is None:
+            # a deactivated or deleted user fails here, its tokens still claim an active user
+            state = get_user_state(super().get_user(validated_token))
+            set_user_state(user_id, state, replace=False)
+        tier_id, is_active, is_staff = state
+        if not is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        user = ClaimsUser(**{api_settings.USER_ID_FIELD: user_id}, is_active=True, is_staff=is_staff)
+        user.account_tier_id = tier_id
+        if tier_id is not None:
+            user.account_tier = get_tier_cache().get(tier_id, cached.get(TIERS_VERSION_KEY))
+        return user
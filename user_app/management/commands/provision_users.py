@@ -0,0 +1,45 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from user_app.models import AccountTier
+from user_app.provisioning import FILE_FORMATS, get_file_format, provision_users, read_rows
+
+
+class Command(BaseCommand):
+    help = ('Create users from a CSV or JSONL file with email and optional username, password, first_name, '
+            'last_name and account_tier columns. Rows that cannot be created are reported and skipped.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file with one user per row')
+        parser.add_argument('--format', choices=sorted(set(FILE_FORMATS.values())),
+                            help='Format of the file, detected from its extension by default')
+        parser.add_argument('--tier', help='Name of the account tier of rows without one, defaults to Basic')
+        parser.add_argument('--workers', type=int, help='Number of processes hashing passwords')
+        parser.add_argument('--chunk-size', type=int, help='Number of users checked and inserted at once')
+        parser.add_argument('--report', help='Write the errors of skipped rows to this file as JSON lines')
+
+    def handle(self, *args, **options):
+        try:
+            file_format = options['format'] or get_file_format(options['path'])
+        except ValueError as e:
+            raise CommandError(e)
+        account_tier = None
+        if options['tier']:
+            account_tier = AccountTier.objects.filter(name=options['tier']).first()
+            if account_tier is None:
+                raise CommandError(f"Account tier {options['tier']} does not exist")
+
+        with open(options['path'], 'rb') as file:
+            report = provision_users(read_rows(file, file_format), account_tier, workers=options['workers'],
+                                     chunk_size=options['chunk_size'])
+
+        errors = report.as_dict()['errors']
+        if options['report']:
+            with open(options['report'], 'w') as report_file:
+                for error in errors:
+                    report_file.write(json.dumps(error) + '\n')
+        else:
+            for error in errors:
+                self.stderr.write(f"Row {error['row']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(f'Done: {report.created} users created, {len(errors)} rows skipped'))
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 15:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accounttier',
+            name='thumbnail_formats',
+            field=models.CharField(blank=True, default='', help_text='Comma separated formats of thumbnail variants, e.g. webp,avif', max_length=255),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 16:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_app', '0002_accounttier_thumbnail_formats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accounttier',
+            name='throttle_rates',
+            field=models.JSONField(blank=True, default=dict, help_text='Request rates per throttle scope overriding the defaults, e.g. {"image_upload": "30/min"}'),
+        ),
+    ]
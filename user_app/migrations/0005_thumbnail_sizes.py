@@ -0,0 +1,91 @@
+# Generated by Django 4.2 on 2026-10-18 16:10
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+# variant formats when the migration was written, the migration does not follow later changes
+VARIANT_FORMATS = ('avif', 'webp')
+
+
+def parse_heights(thumbnail_size):
+    heights = set()
+    for size in thumbnail_size.split(','):
+        try:
+            height = int(size)
+        except ValueError:
+            continue
+        if 0 < height <= 4000:
+            heights.add(height)
+    return sorted(heights)
+
+
+def parse_formats(thumbnail_formats):
+    # thumbnail_formats was not validated, only known variant formats fit in ThumbnailSize.formats
+    formats = []
+    for image_format in thumbnail_formats.split(','):
+        image_format = image_format.strip().lower()
+        if image_format in VARIANT_FORMATS and image_format not in formats:
+            formats.append(image_format)
+    return ','.join(formats)
+
+
+def create_thumbnail_sizes(apps, schema_editor):
+    AccountTier = apps.get_model('user_app', 'AccountTier')
+    ThumbnailSize = apps.get_model('user_app', 'ThumbnailSize')
+    ThumbnailSize.objects.bulk_create([
+        ThumbnailSize(account_tier=tier, height=height, formats=parse_formats(tier.thumbnail_formats))
+        for tier in AccountTier.objects.all() for height in parse_heights(tier.thumbnail_size)
+    ])
+
+
+def restore_thumbnail_size(apps, schema_editor):
+    AccountTier = apps.get_model('user_app', 'AccountTier')
+    for tier in AccountTier.objects.prefetch_related('thumbnail_sizes'):
+        sizes = list(tier.thumbnail_sizes.all())
+        tier.thumbnail_size = ','.join(str(size.height) for size in sizes)
+        tier.thumbnail_formats = sizes[0].formats if sizes else ''
+        tier.save(update_fields=['thumbnail_size', 'thumbnail_formats'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_app', '0004_claimsuser'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThumbnailSize',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('height', models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(4000)])),
+                ('formats', models.CharField(blank=True, default='', help_text='Comma separated formats of variants stored next to the thumbnail in the format of the original, e.g. webp,avif', max_length=64)),
+                ('quality', models.PositiveSmallIntegerField(blank=True, help_text='Encoder quality of lossy formats, defaults to the THUMBNAIL_*_QUALITY setting of each format', null=True, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(100)])),
+                ('eager', models.BooleanField(default=True, help_text='Render when the image is uploaded, other sizes are rendered on request')),
+                ('account_tier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='thumbnail_sizes', to='user_app.accounttier')),
+            ],
+            options={
+                'ordering': ['height'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='thumbnailsize',
+            constraint=models.UniqueConstraint(fields=('account_tier', 'height'), name='unique_thumbnail_size'),
+        ),
+        migrations.RunPython(create_thumbnail_sizes, restore_thumbnail_size),
+        # a default lets the column be added back before the sizes are restored when migrating backwards
+        migrations.AlterField(
+            model_name='accounttier',
+            name='thumbnail_size',
+            field=models.CharField(default='', max_length=255),
+        ),
+        migrations.RemoveField(
+            model_name='accounttier',
+            name='thumbnail_formats',
+        ),
+        migrations.RemoveField(
+            model_name='accounttier',
+            name='thumbnail_size',
+        ),
+    ]
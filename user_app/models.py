@@ -1,20 +1,86 @@
+import re
+
 from django.contrib.auth.models import AbstractUser
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.utils.translation import gettext_lazy as _
+from rest_framework.settings import api_settings
+from image_app.thumbnail_engine import VARIANT_FORMATS
 from user_app.api.managers import CustomUserManager
+from user_app.tiers import get_plan_cache
+
+# DRF reads the period from the first letter, the full names it documents are accepted
+RATE_PATTERN = re.compile(r'^[1-9]\d*/(s|sec|second|m|min|minute|h|hour|d|day)$')
+MAX_THUMBNAIL_HEIGHT = 4000
 
 
 class AccountTier(models.Model):
     name = models.CharField(max_length=255, null=False, blank=False)
-    thumbnail_size = models.CharField(max_length=255, null=False, blank=False)
     original_link = models.BooleanField(default=False)
     expiring_link = models.BooleanField(default=False)
     expiring_link_duration_min = models.IntegerField(default=300)
     expiring_link_duration_max = models.IntegerField(default=30000)
+    throttle_rates = models.JSONField(default=dict, blank=True,
+                                      help_text='Request rates per throttle scope overriding the defaults, '
+                                                'e.g. {"image_upload": "30/min"}')
 
     def __str__(self):
         return self.name
 
+    def clean(self):
+        if not isinstance(self.throttle_rates, dict) or not all(
+                isinstance(rate, str) and RATE_PATTERN.match(rate) for rate in self.throttle_rates.values()):
+            raise ValidationError({'throttle_rates': 'Rates need to be a mapping of scopes to rates like "30/min"'})
+        unknown = sorted(set(self.throttle_rates) - set(api_settings.DEFAULT_THROTTLE_RATES))
+        if unknown:
+            raise ValidationError({'throttle_rates': f'Unknown throttle scopes {", ".join(unknown)}, use '
+                                                     f'{", ".join(sorted(api_settings.DEFAULT_THROTTLE_RATES))}'})
+
+    def get_plan(self):
+        """
+        Return the compiled TierPlan of the thumbnail sizes, cached per process until a tier changes
+        """
+        return get_plan_cache().get(self)
+
+
+class ThumbnailSize(models.Model):
+    """
+    Thumbnail height of an account tier with its rendering options
+    """
+    account_tier = models.ForeignKey(AccountTier, on_delete=models.CASCADE, related_name='thumbnail_sizes')
+    height = models.PositiveIntegerField(validators=[MinValueValidator(1), MaxValueValidator(MAX_THUMBNAIL_HEIGHT)])
+    formats = models.CharField(max_length=64, blank=True, default='',
+                               help_text='Comma separated formats of variants stored next to the thumbnail in the '
+                                         'format of the original, e.g. webp,avif')
+    quality = models.PositiveSmallIntegerField(null=True, blank=True,
+                                               validators=[MinValueValidator(1), MaxValueValidator(100)],
+                                               help_text='Encoder quality of lossy formats, defaults to the '
+                                                         'THUMBNAIL_*_QUALITY setting of each format')
+    eager = models.BooleanField(default=True,
+                                help_text='Render when the image is uploaded, other sizes are rendered on request')
+
+    class Meta:
+        ordering = ['height']
+        constraints = [
+            models.UniqueConstraint(fields=['account_tier', 'height'], name='unique_thumbnail_size'),
+        ]
+
+    def __str__(self):
+        return f'{self.height}px'
+
+    def get_formats(self):
+        """
+        Return Pillow names of the variant formats in order of preference
+        """
+        return tuple(image_format.strip().upper() for image_format in self.formats.split(',') if image_format.strip())
+
+    def clean(self):
+        unknown = [image_format for image_format in self.get_formats() if image_format not in VARIANT_FORMATS]
+        if unknown:
+            raise ValidationError({'formats': f'Unknown formats {", ".join(unknown)}, '
+                                              f'use {", ".join(VARIANT_FORMATS).lower()}'})
+
 
 class User(AbstractUser):
     email = models.EmailField(_('email address'), unique=True)
@@ -29,3 +95,19 @@ class User(AbstractUser):
 
     def __str__(self):
         return self.username
+
+
+class ClaimsUser(User):
+    """
+    User built from the claims of an access token by ClaimsJWTAuthentication, only its id, account tier,
+    active and staff flags are set so it can never be saved
+    """
+
+    class Meta:
+        proxy = True
+
+    def save(self, *args, **kwargs):
+        raise TypeError('Users built from token claims cannot be saved')
+
+    def delete(self, *args, **kwargs):
+        raise TypeError('Users built from token claims cannot be deleted')
@@ -0,0 +1,194 @@
+import csv
+import io
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from user_app.api.serializers import ProvisionUserSerializer
+from user_app.models import AccountTier, User
+
+FILE_FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+
+
+class ProvisionReport:
+    def __init__(self):
+        self.created = 0
+        self.errors = []
+
+    def add_error(self, row, error):
+        self.errors.append({'row': row, 'error': error})
+
+    def as_dict(self):
+        return {'created': self.created, 'errors': sorted(self.errors, key=lambda error: error['row'])}
+
+
+def get_file_format(name):
+    """
+    Return the format of a users file from its extension
+    """
+    file_format = FILE_FORMATS.get(os.path.splitext(name)[1].lower())
+    if file_format is None:
+        raise ValueError(f'Unsupported file {name}, use {", ".join(FILE_FORMATS)}')
+    return file_format
+
+
+def read_rows(file, file_format):
+    """
+    Yield (row number, row) pairs of a binary CSV or JSONL file, malformed JSONL rows are None
+    """
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    try:
+        if file_format == 'csv':
+            yield from enumerate(csv.DictReader(text), start=1)
+            return
+        number = 0
+        for line in text:
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield number, row if isinstance(row, dict) else None
+    finally:
+        # the caller owns the file
+        text.detach()
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def hash_passwords(passwords, executor=None, workers=1):
+    """
+    Return encoded passwords, hashed by the `workers` processes of the executor when there is one
+    """
+    hasher = get_hasher()
+    salts = [hasher.salt() for _ in passwords]
+    if executor is None:
+        return list(map(hasher.encode, passwords, salts))
+    return list(executor.map(hasher.encode, passwords, salts, chunksize=max(1, len(passwords) // (workers * 4))))
+
+
+def provision_users(rows, account_tier=None, workers=None, chunk_size=None):
+    """
+    Create users from (row number, row) pairs and return a ProvisionReport.
+
+    Parameters:
+    - rows: Pairs of a row number and a dict with `email` and optional `username`, `password`, `first_name`,
+      `last_name` and `account_tier` name, see `read_rows`.
+    - account_tier: AccountTier of rows without one, defaults to the Basic tier.
+    - workers: Number of processes hashing passwords, defaults to PROVISIONING_WORKERS, 0 hashes in this process.
+    - chunk_size: Number of rows checked and inserted at once, defaults to PROVISIONING_CHUNK_SIZE.
+
+    Rows are processed in chunks: a chunk is validated, checked against existing users with one query,
+    its passwords are hashed in parallel and its users are inserted with one bulk insert. Invalid rows,
+    rows repeating an email or username and rows of existing users are reported in `errors` and skipped.
+    Users without a password get an unusable one.
+    """
+    if workers is None:
+        workers = getattr(settings, 'PROVISIONING_WORKERS', os.cpu_count() or 1)
+    chunk_size = chunk_size or getattr(settings, 'PROVISIONING_CHUNK_SIZE', 1000)
+    tiers = {tier.name: tier for tier in AccountTier.objects.all()}
+    if account_tier is None:
+        account_tier = tiers.get('Basic')
+
+    report = ProvisionReport()
+    seen_emails, seen_usernames = set(), set()
+    context = multiprocessing.get_context('spawn')
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=context) if workers else None
+    with pool or nullcontext() as executor:
+        for chunk in chunked(rows, chunk_size):
+            candidates = []
+            for number, row in chunk:
+                if row is None:
+                    report.add_error(number, 'Malformed row')
+                    continue
+                serializer = ProvisionUserSerializer(data=row)
+                if not serializer.is_valid():
+                    report.add_error(number, serializer.errors)
+                    continue
+                data = serializer.validated_data
+                email = User.objects.normalize_email(data['email'])
+                username = data.get('username') or email
+                tier = tiers.get(data['account_tier']) if data.get('account_tier') else account_tier
+                if data.get('account_tier') and tier is None:
+                    report.add_error(number, 'Account tier does not exist')
+                elif email in seen_emails:
+                    report.add_error(number, 'Duplicate email')
+                elif username in seen_usernames:
+                    report.add_error(number, 'Duplicate username')
+                else:
+                    seen_emails.add(email)
+                    seen_usernames.add(username)
+                    candidates.append((number, User(email=email, username=username, account_tier=tier,
+                                                    first_name=data.get('first_name') or None,
+                                                    last_name=data.get('last_name') or None),
+                                       data.get('password')))
+
+            existing = User.objects.filter(Q(email__in=[user.email for _, user, _ in candidates]) |
+                                           Q(username__in=[user.username for _, user, _ in candidates]))
+            existing_emails, existing_usernames = set(), set()
+            for email, username in existing.values_list('email', 'username'):
+                existing_emails.add(email)
+                existing_usernames.add(username)
+            users = []
+            for number, user, password in candidates:
+                if user.email in existing_emails:
+                    report.add_error(number, 'Email already exists')
+                elif user.username in existing_usernames:
+                    report.add_error(number, 'Username already exists')
+                else:
+                    users.append((number, user, password))
+
+            hashed = [user for _, user, password in users if password]
+            passwords = hash_passwords([password for _, _, password in users if password], executor, workers)
+            for user, password in zip(hashed, passwords):
+                user.password = password
+            for _, user, password in users:
+                if not password:
+                    user.password = make_password(None)
+            report.created += insert_users(users, report)
+    return report
+
+
+def insert_users(users, report):
+    """
+    Insert (row number, user, password) triples with one query and return the number of created users.
+
+    When a concurrent signup takes an email or username of the chunk, its users are inserted one at a time
+    to report the conflicting rows.
+    """
+    if not users:
+        return 0
+    try:
+        with transaction.atomic():
+            User.objects.bulk_create([user for _, user, _ in users])
+        return len(users)
+    except IntegrityError:
+        pass
+    created = 0
+    for number, user, _ in users:
+        user.pk = None
+        try:
+            with transaction.atomic():
+                user.save(force_insert=True)
+            created += 1
+        except IntegrityError:
+            report.add_error(number, 'User already exists')
+    return created
@@ -0,0 +1,29 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from user_app.authentication import get_user_state, set_user_state
+from user_app.models import AccountTier, ThumbnailSize, User
+from user_app.tiers import bump_tiers_version
+
+
+@receiver(post_save, sender=AccountTier)
+@receiver(post_delete, sender=AccountTier)
+@receiver(post_save, sender=ThumbnailSize)
+@receiver(post_delete, sender=ThumbnailSize)
+def invalidate_account_tiers(sender, instance, **kwargs):
+    # after the commit, a request in between would cache the old rows under the new version
+    transaction.on_commit(bump_tiers_version)
+
+
+@receiver(post_save, sender=User)
+def update_user_state(sender, instance, created, **kwargs):
+    if not created:
+        state = get_user_state(instance)
+        transaction.on_commit(lambda: set_user_state(instance.pk, state))
+
+
+@receiver(post_delete, sender=User)
+def disable_deleted_user(sender, instance, **kwargs):
+    user_id = instance.pk
+    transaction.on_commit(lambda: set_user_state(user_id, (None, False, False)))
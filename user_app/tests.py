@@ -1,9 +1,27 @@
+import io
+import json
+import os
+import tempfile
+from unittest import mock
+
 from django.urls import reverse
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.exceptions import ValidationError
+from django.test import TestCase, override_settings
 from rest_framework import status
-from rest_framework.test import APITestCase, APIClient
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.test import APITestCase
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from core.testing import QueryBudgetAPIClient, create_tier, get_views_without_query_budget, set_thumbnail_sizes
+from user_app.api import views
+from user_app.authentication import ClaimsJWTAuthentication, ClaimsRefreshToken, get_tier_cache
+from user_app.models import ThumbnailSize
+from user_app.provisioning import provision_users
+from user_app.tiers import get_plan_cache
 
 LOGIN_USER_URL = reverse('token_obtain_pair')
 
@@ -52,7 +70,7 @@ class BaseTestCase(APITestCase):
             'email': self.email,
             'password': self.password
         }
-        self.client = APIClient(enforce_csrf_checks=True)
+        self.client = QueryBudgetAPIClient(enforce_csrf_checks=True)
 
 
 class UserAPITests(BaseTestCase):
@@ -61,3 +79,215 @@ class UserAPITests(BaseTestCase):
         response = self.client.post(LOGIN_USER_URL, self.data)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class ClaimsAuthenticationTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        get_tier_cache().clear()
+        self.basic = create_tier('Basic', [200])
+        self.premium = create_tier('Premium', [200, 400])
+        self.user = get_user_model().objects.create_user(username='test', email='test@test.com', password='foo',
+                                                         account_tier=self.basic)
+        self.client = QueryBudgetAPIClient(enforce_csrf_checks=True)
+        self.authentication = mock.patch.object(APIView, 'authentication_classes', [ClaimsJWTAuthentication])
+        self.authentication.start()
+        self.authenticate()
+
+    def authenticate(self):
+        token = ClaimsRefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def get_thumbnail(self, height):
+        return self.client.get(reverse('render_thumbnail', kwargs={'image_id': 1, 'height': height}))
+
+    def test_login_tokens_carry_claims(self):
+        response = self.client.post(LOGIN_USER_URL, {'email': 'test@test.com', 'password': 'foo'})
+        access = AccessToken(response.data['access'])
+        self.assertEqual((access['tier'], access['active'], access['staff']), (self.basic.pk, True, False))
+
+    def test_tier_gated_request_without_queries(self):
+        self.get_thumbnail(400)
+        with self.assertNumQueries(0):
+            response = self.get_thumbnail(400)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_tier_change_invalidates_cache(self):
+        self.assertEqual(self.get_thumbnail(400).status_code, status.HTTP_403_FORBIDDEN)
+        set_thumbnail_sizes(self.basic, [200, 400])
+        self.assertEqual(self.get_thumbnail(400).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_user_change_overrides_claims(self):
+        self.assertEqual(self.get_thumbnail(400).status_code, status.HTTP_403_FORBIDDEN)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.account_tier = self.premium
+            self.user.save()
+        self.assertEqual(self.get_thumbnail(400).status_code, status.HTTP_404_NOT_FOUND)
+
+        # a change is only published once it is committed
+        with self.captureOnCommitCallbacks(execute=False):
+            self.user.is_active = False
+            self.user.save()
+            self.assertEqual(self.get_thumbnail(400).status_code, status.HTTP_404_NOT_FOUND)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.get_thumbnail(400).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_evicted_state_loads_the_user(self):
+        get_user_model().objects.filter(pk=self.user.pk).update(is_active=False)
+        cache.clear()
+        # the token still claims an active user
+        self.assertEqual(self.get_thumbnail(400).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        get_user_model().objects.filter(pk=self.user.pk).update(is_active=True)
+        cache.clear()
+        self.assertEqual(self.get_thumbnail(400).status_code, status.HTTP_403_FORBIDDEN)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_thumbnail(400).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_tokens_without_claims_load_the_user(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.assertEqual(self.get_thumbnail(400).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_claims_user_cannot_be_saved(self):
+        user = ClaimsJWTAuthentication().get_user(ClaimsRefreshToken.for_user(self.user).access_token)
+        self.assertEqual(user.pk, self.user.pk)
+        with self.assertRaises(TypeError):
+            user.save()
+
+    def tearDown(self):
+        self.authentication.stop()
+
+
+class TierPlanTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        get_plan_cache().clear()
+        self.tier = create_tier('Custom', [400, 200], 'webp')
+        ThumbnailSize.objects.create(account_tier=self.tier, height=100, formats='avif,webp', quality=60, eager=False)
+
+    def test_compile_plan(self):
+        plan = self.tier.get_plan()
+        self.assertEqual(plan.heights, (100, 200, 400))
+        self.assertEqual(plan.eager_heights, (200, 400))
+        self.assertEqual(plan.lazy_heights, (100,))
+        self.assertEqual(plan.variant_formats, ('AVIF', 'WEBP'))
+        self.assertEqual(plan.formats(100), ('AVIF', 'WEBP'))
+        self.assertEqual((plan.quality(100), plan.quality(200), plan.quality(300)), (60, None, None))
+        self.assertIn(200, plan)
+        self.assertNotIn(300, plan)
+
+    def test_plan_cached_until_sizes_change(self):
+        plan = self.tier.get_plan()
+        with self.assertNumQueries(0):
+            self.assertIs(self.tier.get_plan(), plan)
+        set_thumbnail_sizes(self.tier, [300])
+        self.assertEqual(self.tier.get_plan().heights, (300,))
+        self.assertNotEqual(self.tier.get_plan().digest, plan.digest)
+
+    def test_plan_invalidated_after_commit(self):
+        plan = self.tier.get_plan()
+        with self.captureOnCommitCallbacks(execute=True):
+            ThumbnailSize.objects.create(account_tier=self.tier, height=300)
+            # other requests cannot see the new size before the commit, they keep the current plan
+            self.assertIs(self.tier.get_plan(), plan)
+        self.assertEqual(self.tier.get_plan().heights, (100, 200, 300, 400))
+
+    def test_validate_thumbnail_size(self):
+        ThumbnailSize(account_tier=self.tier, height=50, formats='webp, AVIF').full_clean()
+        with self.assertRaises(ValidationError):
+            ThumbnailSize(account_tier=self.tier, height=50, formats='gif').full_clean()
+        with self.assertRaises(ValidationError):
+            ThumbnailSize(account_tier=self.tier, height=0).full_clean()
+        with self.assertRaises(ValidationError):
+            ThumbnailSize(account_tier=self.tier, height=50, quality=101).full_clean()
+
+
+class ProvisionUsersTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.basic = create_tier('Basic', [200])
+        self.premium = create_tier('Premium', [200, 400])
+        self.admin = get_user_model().objects.create_superuser(email='admin@test.com', password='foo')
+        self.client = QueryBudgetAPIClient(enforce_csrf_checks=True)
+
+    def test_provision_users(self):
+        rows = [
+            {'email': 'one@test.com', 'password': 'zaq1@WSX'},
+            {'email': 'two@test.com', 'username': 'two', 'account_tier': 'Premium'},
+            {'email': 'one@test.com'},
+            {'email': 'admin@test.com'},
+            {'email': 'not an email'},
+            {'email': 'three@test.com', 'password': '1234'},
+            {'email': 'four@test.com', 'account_tier': 'Gold'},
+            None,
+            {'email': 'five' * 40 + '@test.com'},
+        ]
+        report = provision_users(enumerate(rows, start=1), workers=0, chunk_size=3)
+        self.assertEqual(report.created, 2)
+        errors = report.as_dict()['errors']
+        self.assertEqual([error['row'] for error in errors], [3, 4, 5, 6, 7, 8, 9])
+        self.assertEqual(errors[0]['error'], 'Duplicate email')
+        self.assertEqual(errors[1]['error'], 'Email already exists')
+        self.assertIn('email', errors[2]['error'])
+        self.assertIn('username', errors[6]['error'])
+
+        User = get_user_model()
+        one, two = User.objects.get(email='one@test.com'), User.objects.get(email='two@test.com')
+        self.assertEqual((one.username, one.account_tier), ('one@test.com', self.basic))
+        self.assertTrue(one.check_password('zaq1@WSX'))
+        self.assertEqual((two.username, two.account_tier), ('two', self.premium))
+        self.assertFalse(two.has_usable_password())
+
+    def test_provision_users_command(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'users.csv')
+        with open(path, 'w') as users:
+            users.write('email,password,account_tier\none@test.com,zaq1@WSX,\ntwo@test.com,xsw2!QAZ,Premium\n'
+                        'admin@test.com,,\n')
+        report = os.path.join(directory, 'report.jsonl')
+        stdout = io.StringIO()
+        call_command('provision_users', path, workers=2, report=report, stdout=stdout)
+        self.assertIn('2 users created, 1 rows skipped', stdout.getvalue())
+        with open(report) as report_file:
+            self.assertEqual([json.loads(line) for line in report_file], [{'row': 3, 'error': 'Email already exists'}])
+        self.assertTrue(get_user_model().objects.get(email='two@test.com').check_password('xsw2!QAZ'))
+
+    @override_settings(PROVISIONING_WORKERS=0)
+    def test_provision_users_view(self):
+        lines = [json.dumps({'email': f'user{number}@test.com'}) for number in range(5)] + ['{broken']
+        file = SimpleUploadedFile('users.jsonl', '\n'.join(lines).encode())
+        url = reverse('user_provision')
+        self.client.force_authenticate(user=get_user_model().objects.create_user(email='test@test.com', password='foo'))
+        response = self.client.post(url, {'file': file}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.admin)
+        file.seek(0)
+        response = self.client.post(url, {'file': file, 'account_tier': 'Premium'}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {'created': 5, 'errors': [{'row': 6, 'error': 'Malformed row'}]})
+        self.assertEqual(get_user_model().objects.filter(account_tier=self.premium).count(), 5)
+
+        file.seek(0)
+        with override_settings(PROVISIONING_MAX_ROWS=3):
+            response = self.client.post(url, {'file': file}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(PROVISIONING_WORKERS=8, PROVISIONING_HTTP_WORKERS=2)
+    def test_provision_users_view_caps_workers(self):
+        file = SimpleUploadedFile('users.jsonl', json.dumps({'email': 'one@test.com'}).encode())
+        self.client.force_authenticate(user=self.admin)
+        with mock.patch('user_app.api.views.provision_users', wraps=provision_users) as provision:
+            response = self.client.post(reverse('user_provision'), {'file': file}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(provision.call_args.kwargs['workers'], 2)
+
+
+class QueryBudgetTest(TestCase):
+
+    def test_all_views_declare_query_budget(self):
+        self.assertEqual(get_views_without_query_budget(views), [])
@@ -0,0 +1,105 @@
+import hashlib
+import random
+import threading
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+TIERS_VERSION_KEY = 'account_tiers_version'
+
+SizeRule = namedtuple('SizeRule', ['height', 'formats', 'quality', 'eager'])
+
+
+def get_cache():
+    return caches[getattr(settings, 'AUTH_CACHE_ALIAS', 'default')]
+
+
+def get_tiers_version():
+    return get_cache().get(TIERS_VERSION_KEY)
+
+
+def bump_tiers_version():
+    """
+    Invalidate the tiers and plans cached by every process
+    """
+    cache = get_cache()
+    try:
+        cache.incr(TIERS_VERSION_KEY)
+    except ValueError:
+        # an evicted version restarts from a number no process has seen
+        cache.add(TIERS_VERSION_KEY, random.getrandbits(32), None)
+
+
+class TierPlan:
+    """
+    Thumbnail sizes of an account tier compiled for lookups by height.
+
+    `heights` lists every size the tier may request, `eager_heights` the sizes rendered at upload and
+    `lazy_heights` the sizes rendered on their first request, all in ascending order.
+    """
+
+    def __init__(self, rules):
+        self.rules = {rule.height: rule for rule in sorted(rules)}
+        self.heights = tuple(self.rules)
+        self.eager_heights = tuple(height for height, rule in self.rules.items() if rule.eager)
+        self.lazy_heights = tuple(height for height, rule in self.rules.items() if not rule.eager)
+        variant_formats = []
+        for rule in self.rules.values():
+            variant_formats.extend(image_format for image_format in rule.formats if image_format not in variant_formats)
+        self.variant_formats = tuple(variant_formats)
+        self.digest = hashlib.sha256(repr(sorted(self.rules.values())).encode()).hexdigest()[:16]
+
+    def __contains__(self, height):
+        return height in self.rules
+
+    def formats(self, height):
+        return self.rules[height].formats
+
+    def quality(self, height):
+        rule = self.rules.get(height)
+        return rule.quality if rule is not None else None
+
+
+def compile_plan(sizes):
+    """
+    Return the TierPlan of ThumbnailSize rows
+    """
+    return TierPlan(SizeRule(size.height, size.get_formats(), size.quality, size.eager) for size in sizes)
+
+
+class PlanCache:
+    """
+    In-process cache of compiled tier plans, invalidated with the tiers version in the shared cache
+    """
+
+    def __init__(self):
+        self._plans = {}
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self, tier):
+        version = get_tiers_version()
+        with self._lock:
+            if version != self._version:
+                self._plans.clear()
+                self._version = version
+            plan = self._plans.get(tier.pk)
+        if plan is None:
+            plan = compile_plan(tier.thumbnail_sizes.all())
+            with self._lock:
+                if version == self._version:
+                    self._plans[tier.pk] = plan
+        return plan
+
+    def clear(self):
+        with self._lock:
+            self._plans.clear()
+            self._version = None
+
+
+_plan_cache = PlanCache()
+
+
+def get_plan_cache():
+    return _plan_cache